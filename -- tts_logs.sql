@@ -42,6 +42,10 @@ CREATE TABLE usage_logs (
     model VARCHAR(255),
     status VARCHAR(50),                   -- 'success', 'error'
     error_message TEXT,
+    idempotency_key VARCHAR(64) UNIQUE,   -- 本地落盘记录的去重键，重放时重复写入会被忽略
     FOREIGN KEY (api_key) REFERENCES apikeys(api_key),
     FOREIGN KEY (user_uuid) REFERENCES users(uuid)
-);
\ No newline at end of file
+);
+
+-- 已有的 usage_logs 表开启 USAGE_SPOOL_ENABLED 前执行：
+-- ALTER TABLE usage_logs ADD COLUMN idempotency_key VARCHAR(64) UNIQUE;
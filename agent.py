@@ -1,5 +1,10 @@
+from utils.startup import startup  # 最先导入，启动计时从这里开始
+
+import asyncio
 import logging
 import os
+import sys
+import aiohttp
 from dotenv import load_dotenv
 from livekit.agents import (
     AutoSubscribe,
@@ -10,19 +15,34 @@ from livekit.agents import (
     llm, metrics,
 )
 from livekit.agents.pipeline import VoicePipelineAgent
-from livekit.agents.metrics.base import LLMMetrics, STTMetrics, TTSMetrics, VADMetrics
-from livekit.plugins import silero, deepgram, openai
-from livekit.plugins.cartesia import tts
 from config.settings import settings
-from config.prompts import SYSTEM_PROMPT
+from config.profiles import PROFILES, AgentProfile, select_profile
 from database import supabase_client
 from database.supabase_client import SupabaseClient
-from utils.logger import setup_logger, logger
-import asyncio
+from database.apikey_cache import apikey_cache
+from database.credit_lease import CreditLease
+from database.pool import close_pool
+from database.turn_log import create_turn_logger
+from database.usage_spool import start_usage_replayer
+from services.adaptive_endpointing import create_turn_detector, load_turn_detector_plugin
+from services.context_budget import ContextBudget
+from services.speculation import Speculator, TranscriptTapSTT
+from services.stt_gate import VADGatedSTT
+from services.text_segmenter import SegmentedTTS
+from services.tts_cache import CachedTTS, TTSAudioCache
+from utils.health import report_process_state, start_health_server
+from utils.logger import logger, set_log_context, setup_job_logging, setup_logger
+from utils.loop_monitor import start_loop_monitor
+from utils.pricing import calculate_metrics_cost, calculate_summary_cost
+from utils.quantiles import MetricsAggregator, process_metrics
+from utils.session_reaper import start_session_reaper
+from utils.tracing import create_turn_tracer
+from utils.worker_load import get_worker_load, init_worker_load, read_rss_mb, create_session_load_tracker
+from utils.worker_metrics import get_reporter, start_metrics_server
 from livekit import rtc, api
 from datetime import datetime
 
-db_client = SupabaseClient()
+startup.mark("imports")
 
 # 定义价格常量
 OPENAI_LLM_INPUT_PRICE = 0.0015 / 1000  # 每1k tokens的输入价格
@@ -31,171 +51,235 @@ OPENAI_TTS_PRICE = 0.015 / 1000  # 每1k字符的TTS价格
 DEEPGRAM_STT_PRICE = 0.0059  # 每分钟的STT价格
 
 
+def _import_plugins():
+    """
+    导入服务商插件
+
+    openai 等插件导入要几百毫秒，主 worker 进程用不到，推迟到任务进程预热时导入；
+    插件须在主线程导入（注册插件时有检查）。
+    """
+    from livekit.plugins import cartesia, deepgram, openai, silero
+    return cartesia, deepgram, openai, silero
+
+
 def prewarm(proc: JobProcess):
-    """预热函数，加载VAD模型"""
+    """预热函数：导入插件，加载VAD模型和TTS缓存，准备服务商连接"""
+    # 日志的格式化和进程间转发移到后台线程，低于 LOG_LEVEL 的记录直接丢弃
+    setup_job_logging()
+
+    with startup.phase("plugin_imports"):
+        silero = _import_plugins()[3]
+        if settings.ENDPOINTING_CONFIG["MODE"] == "adaptive":
+            # 模型在主 worker 的推理进程中加载，任务进程只需要客户端
+            load_turn_detector_plugin()
+
     try:
-        proc.userdata["vad"] = silero.VAD.load()
+        with startup.phase("vad_load"):
+            if settings.VAD_CONFIG["MODE"] == "local":
+                proc.userdata["vad"] = silero.VAD.load()
+            else:
+                from services.batched_vad import load_vad
+                proc.userdata["vad"] = load_vad()
         logger.info("VAD model loaded successfully")
     except Exception as e:
         logger.error(f"Error loading VAD model: {str(e)}")
         raise
 
+    if settings.TTS_CACHE_CONFIG["ENABLED"]:
+        try:
+            with startup.phase("tts_cache_load"):
+                cache = TTSAudioCache(settings.TTS_CACHE_CONFIG["DIR"], settings.TTS_CACHE_CONFIG["MAX_BYTES"])
+                cache.load()
+            proc.userdata["tts_cache"] = cache
+        except Exception as e:
+            # 缓存不可用时直接使用 TTS 服务
+            logger.error(f"Error loading TTS cache: {str(e)}")
+
+    if settings.PROVIDER_POOL_CONFIG["ENABLED"]:
+        try:
+            from services.provider_pool import ProviderPool
+
+            pool = ProviderPool(
+                llm_base_url=settings.LLM_CONFIG.get("base_url", "https://api.openai.com/v1"),
+                deepgram_url=settings.PROVIDER_POOL_CONFIG["DEEPGRAM_URL"],
+                cartesia_url=settings.PROVIDER_POOL_CONFIG["CARTESIA_URL"],
+                refresh_interval=settings.PROVIDER_POOL_CONFIG["REFRESH_INTERVAL"],
+                keepalive=settings.PROVIDER_POOL_CONFIG["KEEPALIVE"],
+                dns_ttl=settings.PROVIDER_POOL_CONFIG["DNS_TTL"],
+            )
+            with startup.phase("provider_pool_prepare"):
+                pool.prepare()
+            proc.userdata["provider_pool"] = pool
+        except Exception as e:
+            # 连接池不可用时各插件自行建连
+            logger.error(f"Error preparing provider pool: {str(e)}")
+
+    startup.report("Job process prewarmed")
+    report_process_state(
+        vad=True,
+        tts_cache="tts_cache" in proc.userdata,
+        pool_prepared="provider_pool" in proc.userdata,
+        busy=False,
+        rss_mb=round(read_rss_mb(), 1),
+        startup_ms=startup.as_dict(),
+    )
+
+
+def create_tts(proc: JobProcess, profile: AgentProfile, http_session=None):
+    """创建 TTS：流式路径按子句分段，预热时加载了缓存则再包上缓存层（缓存 key 含声音配置，配置档之间不会混用）"""
+    cartesia = _import_plugins()[0]
+    tts_impl = cartesia.TTS(**profile.tts, http_session=http_session)
+    segmenter_config = dict(profile.text_segmenter)
+    if segmenter_config.pop("ENABLED"):
+        tts_impl = SegmentedTTS(tts_impl, segmenter_config)
+    cache = proc.userdata.get("tts_cache")
+    if cache is None:
+        return tts_impl
+    return CachedTTS(tts_impl, cache, profile.tts)
+
+
+def prefill_tts_cache():
+    """
+    主进程启动时合成各配置档问候语中缓存里还没有的
+
+    任务进程只在预热时加载缓存，新机器上缓存为空，第一句问候仍要等 TTS 服务；
+    在 cli.run_app 之前合成，任务进程预热时就能加载到。出错或超时只记录日志，
+    问候语在第一次播放时照常写入缓存。
+    """
+    config = settings.TTS_CACHE_CONFIG
+    if not (config["ENABLED"] and config["PREFILL"]):
+        return
+    cartesia = _import_plugins()[0]
+
+    async def _prefill() -> int:
+        cache = TTSAudioCache(config["DIR"], config["MAX_BYTES"])
+        cache.load()
+        added = 0
+        async with aiohttp.ClientSession() as http_session:
+            for profile in PROFILES.values():
+                cached_tts = CachedTTS(cartesia.TTS(**profile.tts, http_session=http_session), cache, profile.tts)
+                try:
+                    added += await cached_tts.prefill([profile.greeting])
+                finally:
+                    await cached_tts.aclose()
+        return added
 
-class UsageStats:
-    def __init__(self):
-        # STT 统计
-        self.stt_count = 0
-        self.stt_total_duration = 0.0
-        self.stt_total_audio = 0.0
-        self.stt_total_streaming = 0
-
-        # TTS 统计
-        self.tts_count = 0
-        self.tts_total_duration = 0.0
-        self.tts_total_chars = 0
-        self.tts_total_audio = 0.0
-        self.tts_total_ttfb = 0.0
-        self.tts_cancelled = 0
-
-        # LLM 统计
-        self.llm_count = 0
-        self.llm_total_duration = 0.0
-        self.llm_total_ttft = 0.0
-        self.llm_total_tokens = 0
-        self.llm_prompt_tokens = 0
-        self.llm_completion_tokens = 0
-        self.llm_cancelled = 0
-
-        # VAD 统计
-        self.vad_total_idle = 0.0
-        self.vad_total_inference = 0.0
-        self.vad_inference_count = 0
-
-
-# def setup_usage_collector(agent):
-#     stats = UsageStats()
-#
-#     def usage_collector(*args):
-#         if not args:
-#             return
-#
-#         metrics_data = args[0]
-#
-#         async def handle_metrics():
-#             try:
-#                 # STT 使用统计
-#                 if isinstance(metrics_data, STTMetrics):
-#                     stats.stt_count += 1
-#                     stats.stt_total_duration += metrics_data.duration
-#                     stats.stt_total_audio += metrics_data.audio_duration
-#                     if metrics_data.streamed:
-#                         stats.stt_total_streaming += 1
-#
-#                     logger.info(
-#                         f"Speech-to-Text Metrics [ID: {metrics_data.request_id}]:"
-#                         f"\n  Model: {metrics_data.label}"
-#                         f"\n  Processing Time: {metrics_data.duration:.2f}s"
-#                         f"\n  Audio Duration: {metrics_data.audio_duration:.2f}s"
-#                         f"\n  Streaming: {'Yes' if metrics_data.streamed else 'No'}"
-#                         f"\n  Error: {metrics_data.error if metrics_data.error else 'None'}"
-#                         f"\n  -------- Cumulative Stats --------"
-#                         f"\n  Total Calls: {stats.stt_count}"
-#                         f"\n  Avg Processing Time: {stats.stt_total_duration / stats.stt_count:.2f}s"
-#                         f"\n  Total Audio Processed: {stats.stt_total_audio:.2f}s"
-#                         f"\n  Streaming Requests: {stats.stt_total_streaming}"
-#                     )
-#
-#                 # TTS 使用统计
-#                 elif isinstance(metrics_data, TTSMetrics):
-#                     stats.tts_count += 1
-#                     stats.tts_total_duration += metrics_data.duration
-#                     stats.tts_total_chars += metrics_data.characters_count
-#                     stats.tts_total_audio += metrics_data.audio_duration
-#                     stats.tts_total_ttfb += metrics_data.ttfb
-#                     if metrics_data.cancelled:
-#                         stats.tts_cancelled += 1
-#
-#                     logger.info(
-#                         f"Text-to-Speech Metrics [ID: {metrics_data.request_id}]:"
-#                         f"\n  Model: {metrics_data.label}"
-#                         f"\n  Characters: {metrics_data.characters_count}"
-#                         f"\n  Processing Time: {metrics_data.duration:.2f}s"
-#                         f"\n  Audio Duration: {metrics_data.audio_duration:.2f}s"
-#                         f"\n  Time to First Byte: {metrics_data.ttfb:.2f}s"
-#                         f"\n  Streaming: {'Yes' if metrics_data.streamed else 'No'}"
-#                         f"\n  Cancelled: {'Yes' if metrics_data.cancelled else 'No'}"
-#                         f"\n  Error: {metrics_data.error if metrics_data.error else 'None'}"
-#                         f"\n  -------- Cumulative Stats --------"
-#                         f"\n  Total Calls: {stats.tts_count}"
-#                         f"\n  Total Characters: {stats.tts_total_chars}"
-#                         f"\n  Avg TTFB: {stats.tts_total_ttfb / stats.tts_count:.2f}s"
-#                         f"\n  Cancelled Requests: {stats.tts_cancelled}"
-#                     )
-#
-#                 # LLM 使用统计
-#                 elif isinstance(metrics_data, LLMMetrics):
-#                     stats.llm_count += 1
-#                     stats.llm_total_duration += metrics_data.duration
-#                     stats.llm_total_ttft += metrics_data.ttft
-#                     stats.llm_total_tokens += metrics_data.total_tokens
-#                     stats.llm_prompt_tokens += metrics_data.prompt_tokens
-#                     stats.llm_completion_tokens += metrics_data.completion_tokens
-#                     if metrics_data.cancelled:
-#                         stats.llm_cancelled += 1
-#
-#                     logger.info(
-#                         f"LLM Metrics [ID: {metrics_data.request_id}]:"
-#                         f"\n  Model: {metrics_data.label}"
-#                         f"\n  Processing Time: {metrics_data.duration:.2f}s"
-#                         f"\n  Time to First Token: {metrics_data.ttft:.2f}s"
-#                         f"\n  Tokens: {metrics_data.total_tokens} (Prompt: {metrics_data.prompt_tokens}, Completion: {metrics_data.completion_tokens})"
-#                         f"\n  Tokens/Second: {metrics_data.tokens_per_second:.1f}"
-#                         f"\n  Cancelled: {'Yes' if metrics_data.cancelled else 'No'}"
-#                         f"\n  Error: {metrics_data.error if metrics_data.error else 'None'}"
-#                         f"\n  -------- Cumulative Stats --------"
-#                         f"\n  Total Calls: {stats.llm_count}"
-#                         f"\n  Total Tokens: {stats.llm_total_tokens}"
-#                         f"\n  Avg TTFT: {stats.llm_total_ttft / stats.llm_count:.2f}s"
-#                         f"\n  Cancelled Requests: {stats.llm_cancelled}"
-#                     )
-#
-#                 # VAD 使用统计
-#                 elif isinstance(metrics_data, VADMetrics):
-#                     stats.vad_total_idle += metrics_data.idle_time
-#                     stats.vad_total_inference += metrics_data.inference_duration_total
-#                     stats.vad_inference_count += metrics_data.inference_count
-#
-#                     logger.info(
-#                         f"VAD Metrics:"
-#                         f"\n  Model: {metrics_data.label}"
-#                         f"\n  Idle Time: {metrics_data.idle_time:.2f}s"
-#                         f"\n  Inference Time: {metrics_data.inference_duration_total:.2f}s"
-#                         f"\n  Inference Count: {metrics_data.inference_count}"
-#                         f"\n  -------- Cumulative Stats --------"
-#                         f"\n  Total Inference Count: {stats.vad_inference_count}"
-#                         f"\n  Total Idle Time: {stats.vad_total_idle:.2f}s"
-#                         f"\n  Total Inference Time: {stats.vad_total_inference:.2f}s"
-#                         f"\n  Avg Inference Time: {stats.vad_total_inference / stats.vad_inference_count:.4f}s"
-#                     )
-#
-#             except Exception as e:
-#                 logger.error(f"Error in usage collection: {str(e)}")
-#                 logger.error(f"Metrics data type: {type(metrics_data)}")
-#                 logger.error(f"Metrics data content: {vars(metrics_data)}")
-#
-#         asyncio.create_task(handle_metrics())
-#
-#     # 注册事件监听器
-#     agent.on("metrics_collected", usage_collector)
-
-
-def setup_metrics_collector(agent, ctx, api_key):
+    try:
+        with startup.phase("tts_cache_prefill"):
+            added = asyncio.run(asyncio.wait_for(_prefill(), config["PREFILL_TIMEOUT"]))
+        if added:
+            logger.info(f"Synthesized {added} greeting(s) into the TTS cache")
+    except Exception as e:
+        logger.error(f"Error prefilling TTS cache: {str(e)}")
+
+
+def _format_context_budget(context_budget) -> str:
+    if context_budget is None:
+        return ""
+    stats = context_budget.stats()
+    return (
+        f"\n"
+        f"\nContext Budget:"
+        f"\n  - Prompt Tokens Saved: {stats['prompt_tokens_saved']:,} of {stats['prompt_tokens_before']:,}"
+        f"\n  - Summaries: {stats['summaries']} ({stats['summary_tokens']:,} tokens, ${context_budget.summary_cost:.4f})"
+        f"\n  - Dropped Messages: {stats['dropped_messages']}"
+    )
+
+
+def _format_speculation(speculator) -> str:
+    if speculator is None:
+        return ""
+    stats = speculator.stats()
+    return (
+        f"\n"
+        f"\nSpeculative LLM:"
+        f"\n  - Committed: {stats['committed']} of {stats['started']} ({stats['commit_rate']:.0%})"
+        f"\n  - Latency Saved: {stats['latency_saved']:.2f}s"
+        f"\n  - Wasted Tokens: {stats['wasted_prompt_tokens'] + stats['wasted_completion_tokens']:,}"
+        f" (${speculator.wasted_cost:.4f})"
+    )
+
+
+def _format_stt_gate(stt_gate) -> str:
+    if stt_gate is None:
+        return ""
+    stats = stt_gate.stats()
+    return (
+        f"\n"
+        f"\nSTT Silence Suppression:"
+        f"\n  - Audio Sent: {stats['forwarded_seconds']:.2f}s in {stats['segments']} segment(s)"
+        f"\n  - Audio Saved: {stats['suppressed_seconds']:.2f}s ({stats['suppressed_ratio']:.0%}, ${stats['saved_cost']:.4f})"
+    )
+
+
+def _format_endpointing(eou_detector) -> str:
+    if eou_detector is None:
+        return ""
+    stats = eou_detector.stats()
+    return (
+        f"\n"
+        f"\nAdaptive Endpointing:"
+        f"\n  - Turns: {stats['turns']} (extended {stats['extended_turns']}, user resumed {stats['resumed']}, fallbacks {stats['fallbacks']})"
+        f"\n  - Mean Delay: {stats['mean_delay']:.2f}s"
+        f"\n  - Latency Won: {stats['latency_won']:.2f}s"
+    )
+
+
+def setup_metrics_collector(agent, ctx, api_key, profile: AgentProfile, context_budget=None, speculator=None,
+                            stt_gate=None, reaper=None, eou_detector=None):
     """设置指标收集器"""
     usage_collector = metrics.UsageCollector()
+    latency_stats = MetricsAggregator()
     supabase_client = SupabaseClient()
 
     # 生成会话 ID
     session_id = f"session_{ctx.room.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    set_log_context(session_id=session_id)
+
+    # 积分租约：会话开始预留额度，之后在本地扣减
+    def _on_credits_exhausted():
+        logger.warning(f"Session {session_id} ran out of credits, shutting down")
+        if reaper is not None:
+            reaper.shutdown("Insufficient credits")
+        else:
+            ctx.shutdown(reason="Insufficient credits")
+
+    credit_lease = None
+    if settings.CREDIT_LEASE_CONFIG["ENABLED"]:
+        credit_lease = CreditLease(
+            supabase_client,
+            api_key,
+            chunk=settings.CREDIT_LEASE_CONFIG["CHUNK"],
+            low_watermark=settings.CREDIT_LEASE_CONFIG["LOW_WATERMARK"],
+            min_renew_interval=settings.CREDIT_LEASE_CONFIG["MIN_RENEW_INTERVAL"],
+            on_exhausted=_on_credits_exhausted,
+        )
+        credit_lease.start()
+
+    # 上报给主 worker 进程的指标
+    reporter = get_reporter()
+    if reporter is not None:
+        reporter.session_started()
+
+    # 本会话的实际开销（VAD 推理、事件循环延迟、内存），主进程据此计算负载
+    load_tracker = create_session_load_tracker()
+
+    # 事件循环看门狗：指标上报和负载统计共用它的心跳；都不需要时为 None
+    lag_callbacks = [callback for callback in (
+        reporter.observe_loop_lag if reporter is not None else None,
+        load_tracker.observe_lag if load_tracker is not None else None,
+    ) if callback is not None]
+    loop_monitor = start_loop_monitor(session_id, on_lag=lag_callbacks, required=load_tracker is not None)
+
+    # 单轮延迟追踪：未被采样的会话不注册任何回调
+    tracer = create_turn_tracer(session_id)
+    if tracer is not None:
+        agent.on("agent_started_speaking", tracer.on_agent_started_speaking)
+
+    # 逐轮内容记录：同样按会话采样
+    turn_logger = create_turn_logger(profile)
+    if turn_logger is not None:
+        turn_logger.attach(agent)
 
     @agent.on("metrics_collected")
     def _on_metrics_collected(mtrcs: metrics.AgentMetrics):
@@ -203,6 +287,20 @@ def setup_metrics_collector(agent, ctx, api_key):
         metrics.log_metrics(mtrcs)
         # 收集使用情况
         usage_collector.collect(mtrcs)
+        # 延迟分位数统计
+        latency_stats.observe(mtrcs)
+        # 本地扣减积分
+        if credit_lease is not None:
+            credit_lease.spend(calculate_metrics_cost(mtrcs))
+        if reporter is not None:
+            reporter.observe(mtrcs)
+        if load_tracker is not None:
+            load_tracker.observe(mtrcs)
+        # 按轮次关联指标
+        if tracer is not None:
+            tracer.on_metrics(mtrcs)
+        if turn_logger is not None:
+            turn_logger.on_metrics(mtrcs)
 
     async def log_session_cost():
         """记录会话成本"""
@@ -210,15 +308,22 @@ def setup_metrics_collector(agent, ctx, api_key):
             summary = usage_collector.get_summary()
 
             # 计算各项成本
-            llm_cost = (
-                    summary.llm_prompt_tokens * settings.PRICE_CONFIG["LLM"]["INPUT_PRICE"]
-                    + summary.llm_completion_tokens * settings.PRICE_CONFIG["LLM"]["OUTPUT_PRICE"]
-            )
-            tts_cost = summary.tts_characters_count * settings.PRICE_CONFIG["TTS"]["PRICE"]
-            stt_cost = summary.stt_audio_duration * settings.PRICE_CONFIG["STT"]["PRICE"]
+            llm_cost, tts_cost, stt_cost = calculate_summary_cost(summary)
+            # 上下文摘要请求不经过 agent 的指标事件，单独计入 LLM 成本
+            if context_budget is not None:
+                llm_cost += context_budget.summary_cost
+            # 未提交的投机请求同样产生费用
+            if speculator is not None:
+                llm_cost += speculator.wasted_cost
             total_cost = llm_cost + tts_cost + stt_cost
 
-            # 记录会话汇总到 Supabase
+            # 用会话总成本对账积分租约
+            if credit_lease is not None:
+                reconciliation = await credit_lease.reconcile(total_cost)
+                logger.debug(f"Credit lease reconciliation for {session_id}: {reconciliation}")
+
+            # 记录会话汇总到 Supabase；被超时回收的会话记为 reclaimed，原因写在 error_message
+            end_reason = reaper.reason if reaper is not None else None
             await supabase_client.log_usage(
                 api_key=api_key,
                 service_type='session_summary',
@@ -226,8 +331,8 @@ def setup_metrics_collector(agent, ctx, api_key):
                 cost=total_cost,
                 model='all',
                 request_id=session_id,  # 使用生成的会话 ID
-                status='completed',
-                error_message=None
+                status='reclaimed' if reaper is not None and reaper.reclaimed else 'completed',
+                error_message=end_reason if reaper is not None and reaper.reclaimed else None
             )
 
             # 记录各服务的详细使用情况
@@ -237,7 +342,7 @@ def setup_metrics_collector(agent, ctx, api_key):
                 service_type='llm_summary',
                 usage_amount=summary.llm_prompt_tokens + summary.llm_completion_tokens,
                 cost=llm_cost,
-                model=settings.LLM_CONFIG.get('model', 'gpt-3.5-turbo'),
+                model=profile.llm_model,
                 request_id=session_id,  # 使用生成的会话 ID
                 status='completed'
             )
@@ -248,7 +353,7 @@ def setup_metrics_collector(agent, ctx, api_key):
                 service_type='tts_summary',
                 usage_amount=summary.tts_characters_count,
                 cost=tts_cost,
-                model=settings.TTS_CONFIG.get('model', 'default'),
+                model=profile.tts.get('model', 'default'),
                 request_id=session_id,  # 使用生成的会话 ID
                 status='completed'
             )
@@ -266,8 +371,10 @@ def setup_metrics_collector(agent, ctx, api_key):
 
             # 记录详细的使用统计到日志
             logger.info(
-                f"\nSession Usage Summary (ID: {session_id}):"
+                f"\nSession Usage Summary (ID: {session_id}, profile: {profile.name}):"
                 f"\n------------------------"
+                f"\nEnd Reason: {end_reason or 'unknown'}"
+                f"\n"
                 f"\nLLM Usage:"
                 f"\n  - Prompt Tokens: {summary.llm_prompt_tokens:,}"
                 f"\n  - Completion Tokens: {summary.llm_completion_tokens:,}"
@@ -283,8 +390,20 @@ def setup_metrics_collector(agent, ctx, api_key):
                 f"\n  - Cost: ${stt_cost:.4f}"
                 f"\n"
                 f"\nTotal Session Cost: ${total_cost:.4f}"
+                f"\n"
+                f"\nLatency Percentiles:{latency_stats.format_summary()}"
+                f"{_format_context_budget(context_budget)}"
+                f"{_format_speculation(speculator)}"
+                f"{_format_stt_gate(stt_gate)}"
+                f"{_format_endpointing(eou_detector)}"
                 f"\n------------------------"
             )
+            process_metrics.merge(latency_stats)
+            logger.debug(f"Process latency percentiles:{process_metrics.format_summary()}")
+            logger.debug(f"API key cache stats: {apikey_cache.stats()}")
+            logger.debug(f"PostgREST pool stats: {supabase_client.pool.stats()}")
+            if "tts_cache" in ctx.proc.userdata:
+                logger.debug(f"TTS cache stats: {ctx.proc.userdata['tts_cache'].stats()}")
 
         except Exception as e:
             logger.error(f"Error in log_session_cost: {str(e)}")
@@ -300,18 +419,84 @@ def setup_metrics_collector(agent, ctx, api_key):
                 status='error',
                 error_message=str(e)
             )
+        finally:
+            if context_budget is not None:
+                await context_budget.aclose()
+            if speculator is not None:
+                await speculator.aclose()
+            if reporter is not None:
+                if stt_gate is not None:
+                    reporter.observe_stt_suppressed(stt_gate.suppressed_seconds)
+                reporter.session_ended()
+            if loop_monitor is not None:
+                profile_path = await loop_monitor.aclose()
+                logger.info(f"Event loop stats for {session_id}: {loop_monitor.stats()}")
+                if profile_path:
+                    logger.info(f"Wrote sampling profile for {session_id} to {profile_path}")
+            # 心跳停止后再上报会话结束，之后不会再有负载上报
+            if load_tracker is not None:
+                await load_tracker.aclose()
+            if tracer is not None:
+                await tracer.aclose()
+                logger.debug(f"Exported {tracer.exported} turn traces for {session_id}")
+            if turn_logger is not None:
+                await turn_logger.aclose(timeout=settings.USAGE_WRITER_CONFIG["DRAIN_TIMEOUT"])
+                logger.debug(f"Turn log stats for {session_id}: {turn_logger.stats()}")
+            # 在 shutdown_process_timeout 内把排队的使用记录写完，再关闭进程级连接池
+            await supabase_client.aclose(timeout=settings.USAGE_WRITER_CONFIG["DRAIN_TIMEOUT"])
+            await close_pool()
 
     # 添加关闭回调
     ctx.add_shutdown_callback(log_session_cost)
 
 
+async def log_unstarted_session(ctx: JobContext, reaper):
+    """
+    会话在设置指标收集器之前就结束时（最常见的是等待参与者超时被回收），log_session_cost
+    还没有注册，在这里补记一条会话汇总（费用为 0）和结束原因
+    """
+    api_key = settings.LIVEKIT_API_KEY
+    if not api_key:
+        return
+    client = SupabaseClient()
+    session_id = f"session_{ctx.room.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    try:
+        await client.log_usage(
+            api_key=api_key,
+            service_type='session_summary',
+            usage_amount=0,
+            cost=0,
+            model='all',
+            request_id=session_id,
+            status='reclaimed' if reaper.reclaimed else 'completed',
+            error_message=reaper.reason if reaper.reclaimed else None
+        )
+    finally:
+        await client.aclose(timeout=settings.USAGE_WRITER_CONFIG["DRAIN_TIMEOUT"])
+        await close_pool()
+
+
 async def entrypoint(ctx: JobContext):
     """主入口函数"""
+    _, deepgram, openai, _ = _import_plugins()
+    report_process_state(busy=True)
+    set_log_context(room=ctx.room.name)
     try:
-        initial_ctx = llm.ChatContext().append(
-            role="system",
-            text=SYSTEM_PROMPT
-        )
+        # 连接房间、等待参与者的同时预热服务商连接
+        pool = ctx.proc.userdata.get("provider_pool")
+        if pool is not None:
+            pool.start()
+
+        # 等待参与者、长时间无语音、最长会话时长的超时回收，并记录会话结束原因
+        reaper = start_session_reaper(ctx)
+        # 设置指标收集器之前结束的会话（如等待参与者超时）由这里补记会话汇总
+        metrics_started = False
+
+        async def _log_unstarted_session():
+            if not metrics_started:
+                await log_unstarted_session(ctx, reaper)
+
+        ctx.add_shutdown_callback(_log_unstarted_session)
 
         # 1. 设置房间监听器
         @ctx.room.on("participant_disconnected")
@@ -319,12 +504,12 @@ async def entrypoint(ctx: JobContext):
             logger.info(f"Participant {participant.identity} disconnected")
             if len(ctx.room.remote_participants) == 0:
                 logger.info("All participants left, initiating shutdown")
-                asyncio.create_task(ctx.shutdown(reason="All participants left"))
+                reaper.shutdown("All participants left")
 
         @ctx.room.on("disconnected")
         def on_disconnected():
             logger.info(f"Room {ctx.room.name} disconnected")
-            asyncio.create_task(ctx.shutdown(reason="Room disconnected"))
+            reaper.shutdown("Room disconnected")
 
         # 2. 连接到房间
         logger.info(f"Connecting to room {ctx.room.name}")
@@ -332,30 +517,105 @@ async def entrypoint(ctx: JobContext):
 
         # 3. 等待参与者加入
         participant = await ctx.wait_for_participant()
-        logger.info(f"Starting voice assistant for participant {participant.identity}")
+        reaper.participant_joined()
+
+        # 按任务元数据（调度时指定）或房间元数据选择配置档
+        profile = select_profile(ctx.job.metadata, ctx.room.metadata)
+        logger.info(f"Starting voice assistant for participant {participant.identity} with profile {profile.name}")
+        initial_ctx = llm.ChatContext().append(
+            role="system",
+            text=profile.system_prompt
+        )
 
         # 4. 从 settings 获取 API key
         api_key = settings.LIVEKIT_API_KEY
         if not api_key:
             logger.error("No API key found in settings")
-            ctx.shutdown(reason="Missing API key")
+            reaper.shutdown("Missing API key")
             return
 
         # 5. 初始化 agent
+        http_session = None
+        if pool is not None:
+            http_session = pool.http_session()
+            agent_llm = openai.LLM(model=profile.llm_model, client=pool.llm_client())
+        else:
+            agent_llm = openai.LLM(**{**settings.LLM_CONFIG, "model": profile.llm_model})
+        context_budget = None
+        if settings.CONTEXT_BUDGET_CONFIG["ENABLED"]:
+            context_budget = ContextBudget(
+                agent_llm,
+                max_tokens=settings.CONTEXT_BUDGET_CONFIG["MAX_TOKENS"],
+                summary_trigger=settings.CONTEXT_BUDGET_CONFIG["SUMMARY_TRIGGER"],
+                keep_recent_messages=settings.CONTEXT_BUDGET_CONFIG["KEEP_RECENT_MESSAGES"],
+            )
+
+        speculator = None
+        agent_stt = deepgram.STT(
+            api_key=settings.DEEPGRAM_API_KEY,
+            http_session=http_session,
+            **{**settings.DEEPGRAM_CONFIG, "endpointing_ms": profile.stt_endpointing_ms},
+        )
+        stt_gate = None
+        if settings.STT_GATE_CONFIG["ENABLED"]:
+            stt_gate = VADGatedSTT(
+                agent_stt,
+                ctx.proc.userdata["vad"],
+                pre_roll=settings.STT_GATE_CONFIG["PRE_ROLL_MS"] / 1000,
+                hang_over=settings.STT_GATE_CONFIG["HANG_OVER_MS"] / 1000,
+            )
+            agent_stt = stt_gate
+        if settings.SPECULATION_CONFIG["ENABLED"]:
+            speculator = Speculator(
+                agent_llm,
+                prepare=context_budget.preview if context_budget is not None else None,
+                min_words=settings.SPECULATION_CONFIG["MIN_WORDS"],
+                stable_interims=settings.SPECULATION_CONFIG["STABLE_INTERIMS"],
+                similarity_threshold=settings.SPECULATION_CONFIG["SIMILARITY"],
+                max_per_turn=settings.SPECULATION_CONFIG["MAX_PER_TURN"],
+            )
+            agent_stt = TranscriptTapSTT(agent_stt, on_transcript=speculator.on_transcript)
+
+        def before_llm_cb(agent: VoicePipelineAgent, chat_ctx: llm.ChatContext):
+            """发给 LLM 之前按 token 预算裁剪上下文，能用投机结果时直接回放"""
+            if context_budget is not None:
+                chat_ctx = context_budget.prepare(chat_ctx)
+            if speculator is not None:
+                stream = speculator.take(chat_ctx)
+                if stream is not None:
+                    return stream
+            return agent.llm.chat(chat_ctx=chat_ctx, fnc_ctx=agent.fnc_ctx)
+
+        # adaptive 模式下端点等待由 turn detector 决定，agent 只保留最短等待
+        reporter = get_reporter()
+        eou_detector = create_turn_detector(
+            ctx, profile, on_turn=reporter.observe_endpointing if reporter is not None else None
+        )
         agent = VoicePipelineAgent(
-            allow_interruptions=True,
-            interrupt_speech_duration=0.8,
-            interrupt_min_words=1,
-            min_endpointing_delay=0.5,
+            allow_interruptions=profile.allow_interruptions,
+            interrupt_speech_duration=profile.interrupt_speech_duration,
+            interrupt_min_words=profile.interrupt_min_words,
+            min_endpointing_delay=(settings.ENDPOINTING_CONFIG["MIN_DELAY"] if eou_detector is not None
+                                   else profile.min_endpointing_delay),
+            turn_detector=eou_detector,
             vad=ctx.proc.userdata["vad"],
-            stt=deepgram.STT(api_key=settings.DEEPGRAM_API_KEY),
-            llm=openai.LLM(**settings.LLM_CONFIG),
-            tts=tts.TTS(**settings.TTS_CONFIG),
+            stt=agent_stt,
+            llm=agent_llm,
+            tts=create_tts(ctx.proc, profile, http_session),
             chat_ctx=initial_ctx,
+            before_llm_cb=before_llm_cb,
         )
 
+        if speculator is not None:
+            speculator.attach(agent)
+        if eou_detector is not None:
+            eou_detector.attach(agent)
+
         # 6. 设置指标收集器
-        setup_metrics_collector(agent, ctx, api_key)
+        reaper.attach(agent)
+        setup_metrics_collector(agent, ctx, api_key, profile, context_budget, speculator, stt_gate, reaper,
+                                eou_detector)
+        metrics_started = True
 
         # 7. 设置清理回调
         async def cleanup():
@@ -364,6 +624,9 @@ async def entrypoint(ctx: JobContext):
 
                 # await agent.say("Goodbye, ending the session now.", allow_interruptions=False)
                 await agent.aclose()
+                if pool is not None:
+                    logger.debug(f"Provider pool status: {pool.status()}")
+                    await pool.aclose()
 
                 # 删除房间（可选，取决于你的需求）
                 # if settings.DELETE_ROOM_ON_SHUTDOWN:
@@ -385,7 +648,9 @@ async def entrypoint(ctx: JobContext):
 
         # 8. 启动 agent
         agent.start(ctx.room, participant)
-        await agent.say("Hey, what's your name", allow_interruptions=True)
+        if pool is not None:
+            report_process_state(pool=pool.status())
+        await agent.say(profile.greeting, allow_interruptions=True)
 
         ctx.add_shutdown_callback(cleanup)
 
@@ -395,18 +660,50 @@ async def entrypoint(ctx: JobContext):
         raise
 
 
-async def session_timeout(ctx: JobContext, timeout: int):
-    """会话超时控制"""
-    await asyncio.sleep(timeout)
-    logger.info(f"Session reached maximum duration of {timeout} seconds")
-    ctx.shutdown()
-
-
 if __name__ == "__main__":
+    setup_logger("voice-agent", settings.LOG_FILE)
+    if settings.AGENT_PROFILE_CONFIG["DEFAULT"] not in PROFILES:
+        logger.error(f"Unknown default agent profile {settings.AGENT_PROFILE_CONFIG['DEFAULT']}, "
+                     f"available: {', '.join(PROFILES)}")
+        sys.exit(1)
+    if len(sys.argv) > 1 and sys.argv[1] == "download-files":
+        # 插件导入时才会登记需要下载的模型文件
+        _import_plugins()
+    else:
+        # 新机器上先合成问候语，第一个会话的问候也能命中缓存
+        prefill_tts_cache()
+    if settings.ENDPOINTING_CONFIG["MODE"] == "adaptive":
+        # 导入时登记推理任务，worker 启动时在推理进程中加载模型，各会话共用
+        load_turn_detector_plugin()
+
+    # 指标、健康检查服务运行在主 worker 进程，任务进程通过 Unix socket 上报
+    with startup.phase("servers"):
+        metrics_server = start_metrics_server()
+        health_server = start_health_server()
+        # 任务进程落盘的使用记录由主进程重放到数据库
+        start_usage_replayer(metrics_server.aggregator if metrics_server is not None else None)
+        if settings.VAD_CONFIG["MODE"] == "server":
+            # 跨任务进程合批的 VAD 推理服务，只在该模式下才在主进程导入 silero
+            from services.batched_vad import start_vad_server
+            start_vad_server()
+    if health_server is not None:
+        health_server.health.startup = startup.as_dict()
+
+    # 按实测的每会话开销决定是否接收新房间；没有健康检查通道时使用默认的 CPU 负载
+    load_options = {}
+    if settings.LOAD_CONFIG["ENABLED"]:
+        if health_server is not None:
+            init_worker_load(health_server.health)
+            load_options = {"load_fnc": get_worker_load, "load_threshold": settings.LOAD_CONFIG["THRESHOLD"]}
+        else:
+            logger.warning("Load-aware admission needs the health server, using the default CPU load")
+
+    startup.report("Worker started")
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
             prewarm_fnc=prewarm,
-            shutdown_process_timeout=120,  # 2分钟的清理超时时间
+            shutdown_process_timeout=settings.SHUTDOWN_PROCESS_TIMEOUT,  # 2分钟的清理超时时间
+            **load_options,
         ),
     )
@@ -0,0 +1,82 @@
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from config.prompts import REELS_SYSTEM_PROMPT, SYSTEM_PROMPT
+from config.settings import settings
+from utils.logger import logger
+
+
+@dataclass(frozen=True)
+class AgentProfile:
+    """
+    一种 agent 的配置：提示词、声音、模型和断句参数
+
+    同一个 worker 按任务选择配置档，VAD、TTS 缓存、服务商连接池等预热资源在配置档之间共用。
+    未指定的字段取 settings 中的全局配置。
+    """
+    name: str
+    system_prompt: str
+    greeting: str = "Hey, what's your name"
+    tts: Dict = field(default_factory=lambda: dict(settings.TTS_CONFIG))
+    llm_model: str = settings.LLM_CONFIG["model"]
+    stt_endpointing_ms: int = settings.DEEPGRAM_CONFIG["endpointing_ms"]
+    text_segmenter: Dict = field(default_factory=lambda: dict(settings.TEXT_SEGMENTER_CONFIG))
+    # VoicePipelineAgent 的断句与打断参数
+    allow_interruptions: bool = True
+    interrupt_speech_duration: float = 0.8
+    interrupt_min_words: int = 1
+    min_endpointing_delay: float = 0.5
+
+
+PROFILES: Dict[str, AgentProfile] = {}
+
+
+def register_profile(profile: AgentProfile):
+    PROFILES[profile.name] = profile
+
+
+register_profile(AgentProfile(
+    name="default",
+    system_prompt=SYSTEM_PROMPT,
+))
+
+# 原 agent_reels.py：同样的绘本流程，语气更平和，使用 VoicePipelineAgent 的默认打断参数
+register_profile(AgentProfile(
+    name="reels",
+    system_prompt=REELS_SYSTEM_PROMPT,
+    tts={**settings.TTS_CONFIG, "emotion": ["curiosity:high", "positivity:high"]},
+    interrupt_speech_duration=0.5,
+    interrupt_min_words=0,
+))
+
+
+def _profile_name(metadata: Optional[str]) -> Optional[str]:
+    """元数据可以是 JSON 对象（取 METADATA_KEY 字段），也可以直接是配置档名"""
+    if not metadata:
+        return None
+    metadata = metadata.strip()
+    if metadata in PROFILES:
+        return metadata
+    try:
+        data = json.loads(metadata)
+    except ValueError:
+        return None
+    if isinstance(data, dict):
+        name = data.get(settings.AGENT_PROFILE_CONFIG["METADATA_KEY"])
+        return str(name) if name is not None else None
+    return None
+
+
+def select_profile(*metadata: Optional[str]) -> AgentProfile:
+    """按顺序检查各元数据（如任务元数据、房间元数据），取第一个指定的配置档"""
+    default = settings.AGENT_PROFILE_CONFIG["DEFAULT"]
+    for item in metadata:
+        name = _profile_name(item)
+        if name is None:
+            continue
+        if name in PROFILES:
+            return PROFILES[name]
+        logger.warning(f"Unknown agent profile {name}, using {default}")
+        break
+    return PROFILES[default]
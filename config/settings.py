@@ -17,9 +17,45 @@ class Settings:
         "language": "en-US",
         "smart_format": True,
         "punctuate": True,
-        "endpointing": 25,
+        "endpointing_ms": 25,
         "interim_results": True,
-        "vad_events": True
+        "base_url": os.getenv("DEEPGRAM_BASE_URL", "https://api.deepgram.com/v1/listen"),
+    }
+
+    # 基于中间转写结果的投机 LLM 请求（会增加 token 消耗，按部署调节）
+    SPECULATION_CONFIG: Dict = {
+        "ENABLED": os.getenv("SPECULATION_ENABLED", "false").lower() == "true",
+        "MIN_WORDS": int(os.getenv("SPECULATION_MIN_WORDS", "3")),                # 发起投机的最少词数
+        "STABLE_INTERIMS": int(os.getenv("SPECULATION_STABLE_INTERIMS", "2")),    # 中间结果连续不变的次数
+        "SIMILARITY": float(os.getenv("SPECULATION_SIMILARITY", "0.9")),          # 与最终转写的相似度阈值
+        "MAX_PER_TURN": int(os.getenv("SPECULATION_MAX_PER_TURN", "3")),          # 每轮最多发起的投机请求数
+    }
+
+    # 静音抑制：只把 VAD 判定为语音的音频送给 STT，减少上行带宽和 STT 费用
+    STT_GATE_CONFIG: Dict = {
+        "ENABLED": os.getenv("STT_GATE_ENABLED", "false").lower() == "true",
+        "PRE_ROLL_MS": int(os.getenv("STT_GATE_PRE_ROLL_MS", "500")),     # 语音开始前补发的音频
+        "HANG_OVER_MS": int(os.getenv("STT_GATE_HANG_OVER_MS", "600")),   # 语音结束后继续转发的音频
+    }
+
+    # 端点判定：fixed 使用配置档的 min_endpointing_delay；adaptive 由 turn-detector 模型
+    # 给出说完的概率，有把握时缩短等待，没把握时延长（孩子句中停顿不会被打断）
+    ENDPOINTING_CONFIG: Dict = {
+        "MODE": os.getenv("ENDPOINTING_MODE", "fixed"),
+        "MIN_DELAY": float(os.getenv("ENDPOINTING_MIN_DELAY", "0.2")),        # 概率不低于 LIKELY 时的等待（秒）
+        "MAX_DELAY": float(os.getenv("ENDPOINTING_MAX_DELAY", "2.0")),        # 概率不高于 UNLIKELY 时的等待（秒）
+        "LIKELY": float(os.getenv("ENDPOINTING_LIKELY", "0.8")),              # 之间按概率线性插值
+        "UNLIKELY": float(os.getenv("ENDPOINTING_UNLIKELY", "0.15")),
+        "TIMEOUT": float(os.getenv("ENDPOINTING_TIMEOUT", "1.0")),            # 模型推理超时，超时按固定等待处理
+    }
+
+    # Silero VAD 推理方式：local 每个流单独推理；batched 同一进程内的流合批；
+    # server 各任务进程把窗口发给主 worker 进程，跨会话合批（语音判断与 local 完全一致）
+    VAD_CONFIG: Dict = {
+        "MODE": os.getenv("VAD_MODE", "local"),
+        "MAX_DELAY_MS": float(os.getenv("VAD_BATCH_MAX_DELAY_MS", "5")),           # 凑批最多等待的时间（毫秒），远小于 32ms 的窗口
+        "MAX_BATCH": int(os.getenv("VAD_BATCH_MAX_SIZE", "64")),                  # 每次推理的最大窗口数
+        "SOCKET_PATH": os.getenv("VAD_SOCKET_PATH", "/tmp/voice-agent-vad.sock"),  # server 模式的推理服务地址
     }
 
     # TTS配置
@@ -30,10 +66,53 @@ class Settings:
         "emotion": ["curiosity:highest", "positivity:high"]
     }
 
+    # TTS 音频缓存配置（固定语句如问候语只合成一次）
+    TTS_CACHE_CONFIG: Dict = {
+        "ENABLED": os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true",
+        "DIR": os.getenv("TTS_CACHE_DIR", "cache/tts"),                               # 缓存目录，多个进程共享
+        "MAX_BYTES": int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),  # 磁盘占用上限
+        "PREFILL": os.getenv("TTS_CACHE_PREFILL", "true").lower() == "true",          # 主进程启动时合成缺少的问候语
+        "PREFILL_TIMEOUT": float(os.getenv("TTS_CACHE_PREFILL_TIMEOUT", "15")),       # 合成问候语最多等待的时间（秒）
+    }
+
+    # 服务商连接预热配置（每个任务进程一个连接池）
+    PROVIDER_POOL_CONFIG: Dict = {
+        "ENABLED": os.getenv("PROVIDER_POOL_ENABLED", "true").lower() == "true",
+        "DEEPGRAM_URL": os.getenv("PROVIDER_POOL_DEEPGRAM_URL", "https://api.deepgram.com"),
+        "CARTESIA_URL": os.getenv("PROVIDER_POOL_CARTESIA_URL", "https://api.cartesia.ai"),
+        "REFRESH_INTERVAL": float(os.getenv("PROVIDER_POOL_REFRESH_INTERVAL", "30")),  # 空闲多久后做健康检查（秒）
+        "KEEPALIVE": float(os.getenv("PROVIDER_POOL_KEEPALIVE", "90")),                # 客户端保留空闲连接的时间（秒）
+        "DNS_TTL": float(os.getenv("PROVIDER_POOL_DNS_TTL", "300")),                   # 预热时解析的地址有效期（秒）
+    }
+
+    # 文本分段配置：首段在子句边界尽早送给 TTS，之后的段按倍数变长
+    TEXT_SEGMENTER_CONFIG: Dict = {
+        "ENABLED": os.getenv("TEXT_SEGMENTER_ENABLED", "true").lower() == "true",
+        "first_min_words": int(os.getenv("TEXT_SEGMENTER_FIRST_MIN_WORDS", "3")),    # 首段最少词数
+        "first_max_words": int(os.getenv("TEXT_SEGMENTER_FIRST_MAX_WORDS", "12")),   # 首段没有标点时强制切分的词数
+        "growth": float(os.getenv("TEXT_SEGMENTER_GROWTH", "2.0")),                  # 每段最小词数的增长倍数
+        "max_min_words": int(os.getenv("TEXT_SEGMENTER_MAX_MIN_WORDS", "30")),       # 最小词数上限
+        "hard_max_words": int(os.getenv("TEXT_SEGMENTER_HARD_MAX_WORDS", "60")),     # 没有句末时强制切分的词数
+    }
+
     # LLM配置
     LLM_CONFIG: Dict = {
         "model": "gpt-4o-mini",
-        "base_url": "https://api.zhizengzeng.com/v1"
+        "base_url": os.getenv("LLM_BASE_URL", "https://api.zhizengzeng.com/v1")
+    }
+
+    # agent 配置档：每个任务按任务/房间元数据选择（配置档定义见 config/profiles.py）
+    AGENT_PROFILE_CONFIG: Dict = {
+        "DEFAULT": os.getenv("AGENT_DEFAULT_PROFILE", "default"),             # 元数据未指定时使用的配置档
+        "METADATA_KEY": os.getenv("AGENT_PROFILE_METADATA_KEY", "profile"),   # 元数据 JSON 中的字段名
+    }
+
+    # 对话上下文 token 预算（超出后压缩较早的对话）
+    CONTEXT_BUDGET_CONFIG: Dict = {
+        "ENABLED": os.getenv("CONTEXT_BUDGET_ENABLED", "true").lower() == "true",
+        "MAX_TOKENS": int(os.getenv("CONTEXT_BUDGET_MAX_TOKENS", "6000")),            # 发给 LLM 的上下文上限
+        "SUMMARY_TRIGGER": float(os.getenv("CONTEXT_BUDGET_SUMMARY_TRIGGER", "0.75")),  # 达到上限的该比例时开始摘要
+        "KEEP_RECENT_MESSAGES": int(os.getenv("CONTEXT_BUDGET_KEEP_RECENT", "6")),     # 始终原样保留的最近消息数
     }
 
     # API价格配置（单位：美元）
@@ -57,14 +136,129 @@ class Settings:
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
 
+    # Supabase 连接池配置（每个进程共用一个）
+    SUPABASE_POOL_CONFIG: Dict = {
+        "MAX_CONNECTIONS": int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "20")),     # 最大连接数
+        "MAX_KEEPALIVE": int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "10")),         # 保持空闲的连接数
+        "KEEPALIVE_EXPIRY": float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30")), # 空闲连接保留时间（秒）
+        "TIMEOUT": float(os.getenv("SUPABASE_POOL_TIMEOUT", "10")),                   # 请求超时（秒）
+        "CONNECT_TIMEOUT": float(os.getenv("SUPABASE_POOL_CONNECT_TIMEOUT", "5")),    # 建连超时（秒）
+        "MAX_CONCURRENCY": int(os.getenv("SUPABASE_POOL_MAX_CONCURRENCY", "16")),     # 最大并发请求数
+        "MAX_RETRIES": int(os.getenv("SUPABASE_POOL_MAX_RETRIES", "3")),              # 瞬时错误的重试次数
+        "BACKOFF_BASE": float(os.getenv("SUPABASE_POOL_BACKOFF_BASE", "0.2")),        # 退避基数（秒）
+        "BACKOFF_MAX": float(os.getenv("SUPABASE_POOL_BACKOFF_MAX", "2.0")),          # 退避上限（秒）
+    }
+
+    # API key → user_uuid 缓存配置
+    APIKEY_CACHE_CONFIG: Dict = {
+        "MAX_SIZE": int(os.getenv("APIKEY_CACHE_MAX_SIZE", "1024")),        # 最多缓存的 key 数量
+        "TTL": float(os.getenv("APIKEY_CACHE_TTL", "300")),                 # 有效 key 的缓存时间（秒）
+        "NEGATIVE_TTL": float(os.getenv("APIKEY_CACHE_NEGATIVE_TTL", "30")),  # 无效 key 的缓存时间（秒）
+    }
+
+    # 积分租约配置（会话内本地扣减，余额不足时结束会话；默认关闭，开启前须确认 API key 在 apikeys 表中有积分）
+    CREDIT_LEASE_CONFIG: Dict = {
+        "ENABLED": os.getenv("CREDIT_LEASE_ENABLED", "false").lower() == "true",
+        "CHUNK": float(os.getenv("CREDIT_LEASE_CHUNK", "0.5")),                  # 每次预留的额度（美元）
+        "LOW_WATERMARK": float(os.getenv("CREDIT_LEASE_LOW_WATERMARK", "0.1")),  # 剩余额度低于此值时续租（美元）
+        "MIN_RENEW_INTERVAL": float(os.getenv("CREDIT_LEASE_MIN_RENEW_INTERVAL", "5")),  # 两次续租的最小间隔（秒）
+    }
+
+    # 使用记录批量写入配置
+    USAGE_WRITER_CONFIG: Dict = {
+        "BATCH_SIZE": int(os.getenv("USAGE_BATCH_SIZE", "50")),          # 每批最多写入的记录数
+        "FLUSH_INTERVAL": float(os.getenv("USAGE_FLUSH_INTERVAL", "1.0")),  # 最长攒批时间（秒）
+        "MAX_QUEUE_SIZE": int(os.getenv("USAGE_MAX_QUEUE_SIZE", "10000")),  # 内存队列上限
+        "DRAIN_TIMEOUT": float(os.getenv("USAGE_DRAIN_TIMEOUT", "30")),    # 会话结束时排空队列的超时（秒）
+    }
+
+    # 使用记录落盘：任务进程同步写入本地 SQLite，主进程批量重放到 usage_logs
+    # （需要 usage_logs.idempotency_key 唯一列，见 SQL 文件中的迁移语句）
+    USAGE_SPOOL_CONFIG: Dict = {
+        "ENABLED": os.getenv("USAGE_SPOOL_ENABLED", "false").lower() == "true",
+        "PATH": os.getenv("USAGE_SPOOL_PATH", "/tmp/voice-agent-usage-spool.db"),
+        "MAX_BYTES": int(os.getenv("USAGE_SPOOL_MAX_BYTES", str(64 * 1024 * 1024))),  # 本地积压的空间上限
+        "BATCH_SIZE": int(os.getenv("USAGE_SPOOL_BATCH_SIZE", "200")),               # 每次重放的记录数
+        "REPLAY_INTERVAL": float(os.getenv("USAGE_SPOOL_REPLAY_INTERVAL", "1.0")),   # 没有积压时的轮询间隔（秒）
+        "MAX_BACKOFF": float(os.getenv("USAGE_SPOOL_MAX_BACKOFF", "60")),           # 写库失败后的最长重试间隔（秒）
+    }
+
+    # 单轮对话延迟追踪配置（采样率为 0 时不注册任何回调）
+    TRACE_CONFIG: Dict = {
+        "SAMPLE_RATE": float(os.getenv("TRACE_SAMPLE_RATE", "0")),                 # 被追踪会话的比例，0~1
+        "EXPORTER": os.getenv("TRACE_EXPORTER", "file"),                          # file 或 otlp
+        "FILE": os.getenv("TRACE_FILE", "logs/turn_traces.jsonl"),                # file 导出的路径
+        "OTLP_ENDPOINT": os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"),  # OTLP/HTTP 地址
+        "SERVICE_NAME": os.getenv("TRACE_SERVICE_NAME", "voice-pipeline-agent"),
+    }
+
+    # 逐轮记录转写、LLM 和 TTS 内容到 stt_logs / llm_logs / tts_logs（按会话采样）
+    TURN_LOG_CONFIG: Dict = {
+        "SAMPLE_RATE": float(os.getenv("TURN_LOG_SAMPLE_RATE", "0")),              # 被记录会话的比例，0~1
+        "COMPRESS_THRESHOLD": int(os.getenv("TURN_LOG_COMPRESS_THRESHOLD", "4096")),  # 超过该字节数的文本压缩存储
+        "BATCH_SIZE": int(os.getenv("TURN_LOG_BATCH_SIZE", "50")),                 # 每批最多写入的行数
+        "FLUSH_INTERVAL": float(os.getenv("TURN_LOG_FLUSH_INTERVAL", "2.0")),      # 最长攒批时间（秒）
+        "MAX_QUEUE_SIZE": int(os.getenv("TURN_LOG_MAX_QUEUE_SIZE", "1000")),       # 内存队列上限，满了丢弃
+    }
+
+    # worker 指标汇总配置（任务进程通过 Unix 数据报上报，主进程提供 Prometheus 接口）
+    METRICS_CONFIG: Dict = {
+        "ENABLED": os.getenv("METRICS_ENABLED", "false").lower() == "true",
+        "HOST": os.getenv("METRICS_HOST", "0.0.0.0"),
+        "PORT": int(os.getenv("METRICS_PORT", "9100")),                                  # /metrics 端口
+        "SOCKET_PATH": os.getenv("METRICS_SOCKET_PATH", "/tmp/voice-agent-metrics.sock"),  # 进程间上报的 socket
+        "FLUSH_INTERVAL": float(os.getenv("METRICS_FLUSH_INTERVAL", "5")),               # 任务进程上报间隔（秒）
+    }
+
+    # 事件循环看门狗与采样分析器（任务进程内，默认关闭）
+    LOOP_MONITOR_CONFIG: Dict = {
+        "ENABLED": os.getenv("LOOP_MONITOR_ENABLED", "false").lower() == "true",
+        "INTERVAL": float(os.getenv("LOOP_MONITOR_INTERVAL", "0.05")),                # 心跳间隔（秒）
+        "BLOCK_THRESHOLD": float(os.getenv("LOOP_MONITOR_BLOCK_THRESHOLD", "0.1")),   # 阻塞超过此时长时抓取调用栈（秒）
+        "PROFILER_ENABLED": os.getenv("LOOP_PROFILER_ENABLED", "false").lower() == "true",
+        "PROFILER_INTERVAL": float(os.getenv("LOOP_PROFILER_INTERVAL", "0.02")),      # 采样间隔（秒）
+        "PROFILER_ALL_THREADS": os.getenv("LOOP_PROFILER_ALL_THREADS", "false").lower() == "true",  # 默认只采样事件循环线程
+        "PROFILER_DIR": os.getenv("LOOP_PROFILER_DIR", "logs/profiles"),              # 折叠栈（flamegraph）输出目录
+    }
+
+    # 健康检查配置（主 worker 进程提供 /livez、/readyz）
+    HEALTH_CONFIG: Dict = {
+        "ENABLED": os.getenv("HEALTH_ENABLED", "true").lower() == "true",
+        "HOST": os.getenv("HEALTH_HOST", "0.0.0.0"),
+        "PORT": int(os.getenv("HEALTH_PORT", "8082")),                                 # livekit 自带的 8081 只返回 OK
+        "SOCKET_PATH": os.getenv("HEALTH_SOCKET_PATH", "/tmp/voice-agent-health.sock"),  # 任务进程上报预热状态
+        "MIN_READY_PROCESSES": int(os.getenv("HEALTH_MIN_READY_PROCESSES", "1")),       # 就绪所需的空闲预热进程数
+    }
+
+    # 任务准入：按任务进程实测的每会话开销计算 worker 负载（通过健康检查通道上报，需开启 HEALTH）
+    LOAD_CONFIG: Dict = {
+        "ENABLED": os.getenv("LOAD_AWARE_ENABLED", "true").lower() == "true",
+        "THRESHOLD": float(os.getenv("LOAD_THRESHOLD", "0.75")),          # 负载达到此值时不再接收新房间
+        "HYSTERESIS": float(os.getenv("LOAD_HYSTERESIS", "0.1")),         # 满载后降到 THRESHOLD - HYSTERESIS 以下才恢复
+        "MAX_SESSIONS": int(os.getenv("LOAD_MAX_SESSIONS", "0")),         # 最大并发会话数，0 表示不限制
+        "VAD_CPU_BUDGET": float(os.getenv("LOAD_VAD_CPU_BUDGET", "0.5")),  # VAD 推理最多占用的 CPU 比例（其余留给音频处理等）
+        "LAG_TARGET_MS": float(os.getenv("LOAD_LAG_TARGET_MS", "50")),    # 事件循环延迟 p90 达到此值视为满载（毫秒）
+        "MEMORY_BUDGET_MB": float(os.getenv("LOAD_MEMORY_BUDGET_MB", "0")),  # 所有进程的内存上限，0 表示物理内存的 80%
+        "REPORT_INTERVAL": float(os.getenv("LOAD_REPORT_INTERVAL", "2")),  # 任务进程上报间隔（秒）
+    }
+
     # 日志配置
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     LOG_FORMAT: str = os.getenv("LOG_FORMAT", "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     LOG_FILE: str = os.getenv("LOG_FILE", "agent.log")
+    # 日志经队列由后台线程格式化和写出，事件循环上只做过滤和入队
+    LOG_CONFIG: Dict = {
+        "JSON": os.getenv("LOG_JSON", "true").lower() == "true",              # 输出一行一个 JSON（带 session_id / room）
+        "QUEUE_SIZE": int(os.getenv("LOG_QUEUE_SIZE", "10000")),               # 队列上限，满了丢弃并计数
+        "RATE_LIMITS": os.getenv("LOG_RATE_LIMITS", "livekit=50,voice-agent=200"),  # 各 logger 前缀每秒最多条数（ERROR 及以上不限）
+        "SAMPLING": os.getenv("LOG_SAMPLING", ""),                            # 各 logger 前缀的采样比例，如 "livekit.agents=0.1"（只作用于 INFO 及以下）
+        "QUIET_LOGGERS": os.getenv("LOG_QUIET_LOGGERS", "httpx,httpcore,openai,websockets,hpack,urllib3"),  # 任务进程中只记录 WARNING 及以上
+    }
 
     # 会话控制配置
     PARTICIPANT_WAIT_TIMEOUT = 300  # 等待参与者加入的超时时间（秒）
     MAX_SESSION_DURATION = 3600     # 最大会话时长（秒），None 表示无限制
     ROOM_IDLE_TIMEOUT = 300        # 房间空闲超时时间（秒）
+    SHUTDOWN_PROCESS_TIMEOUT = 120  # 任务进程的清理超时时间（秒）
 
 settings = Settings()
\ No newline at end of file
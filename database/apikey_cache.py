@@ -0,0 +1,141 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from config.settings import settings
+
+
+class _LoadCancelled(Exception):
+    """发起查询的调用方被取消，等待同一查询的调用方应重试"""
+
+
+class ApiKeyCache:
+    """
+    API key → user_uuid 的进程内缓存
+
+    - 容量上限 + LRU 淘汰
+    - 正常结果按 ttl 过期，无效 key（查询结果为空）按 negative_ttl 过期
+    - 同一个 key 同时只有一次数据库查询，其余调用等待同一个结果；发起查询的调用方
+      被取消时，等待者自行重试，不会跟着收到 CancelledError
+    - 查询出错不会被缓存
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300, negative_ttl: float = 30):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._generation = 0  # invalidate / clear 时递增，进行中的查询据此判断结果是否过时
+
+        # 统计
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.load_errors = 0
+
+    def _lookup(self, api_key: str) -> Tuple[bool, Optional[str]]:
+        entry = self._entries.get(api_key)
+        if entry is None:
+            return False, None
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[api_key]
+            self.expirations += 1
+            return False, None
+
+        self._entries.move_to_end(api_key)
+        if value is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return True, value
+
+    def _store(self, api_key: str, value: Optional[str]):
+        ttl = self._ttl if value is not None else self._negative_ttl
+        self._entries[api_key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(api_key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, api_key: str, loader: Callable[[str], Awaitable[Optional[str]]]) -> Optional[str]:
+        """读取缓存，未命中时通过 loader 加载（同一 key 只加载一次）"""
+        while True:
+            found, value = self._lookup(api_key)
+            if found:
+                return value
+
+            inflight = self._inflight.get(api_key)
+            if inflight is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except _LoadCancelled:
+                # 发起查询的调用方被取消，不影响等待者：重新查找或自己发起查询
+                continue
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[api_key] = future
+        generation = self._generation
+        try:
+            value = await loader(api_key)
+        except asyncio.CancelledError:
+            future.set_exception(_LoadCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            self.load_errors += 1
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            # 查询期间 key 被 invalidate 时不写回旧值
+            if generation == self._generation:
+                self._store(api_key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(api_key) is future:
+                del self._inflight[api_key]
+
+    def invalidate(self, api_key: str):
+        """使某个 key 的缓存失效（例如 key 被吊销或重新绑定用户），进行中的查询结果也不再写入缓存"""
+        self._generation += 1
+        self._entries.pop(api_key, None)
+        self._inflight.pop(api_key, None)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._inflight.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'load_errors': self.load_errors,
+            'hit_rate': (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+        }
+
+
+# 进程级共享实例
+apikey_cache = ApiKeyCache(
+    max_size=settings.APIKEY_CACHE_CONFIG["MAX_SIZE"],
+    ttl=settings.APIKEY_CACHE_CONFIG["TTL"],
+    negative_ttl=settings.APIKEY_CACHE_CONFIG["NEGATIVE_TTL"],
+)
@@ -0,0 +1,141 @@
+import asyncio
+import time
+from typing import Callable, Dict, Optional
+
+from utils.logger import logger
+
+
+class CreditLease:
+    """
+    会话级积分租约
+
+    会话开始时从用户余额中预留一块额度（chunk），之后每次 metrics_collected 只在本地扣减；
+    剩余额度低于 low_watermark 时在后台重新查询余额并续租。续租确认余额耗尽后
+    标记 exhausted 并回调 on_exhausted，由调用方结束会话。会话结束时 reconcile()
+    用权威的会话总成本对账。预留只存在于本进程：数据库里没有扣留任何积分，
+    实际扣费仍以 usage_logs 为准。
+
+    余额查询失败时租约降级为不限额（只记录日志），不会因为数据库故障中断会话。
+    """
+
+    def __init__(self,
+                 client,
+                 api_key: str,
+                 chunk: float,
+                 low_watermark: float,
+                 min_renew_interval: float = 5.0,
+                 on_exhausted: Optional[Callable[[], None]] = None):
+        self._client = client
+        self._api_key = api_key
+        self._chunk = chunk
+        self._low_watermark = low_watermark
+        self._min_renew_interval = min_renew_interval
+        self._on_exhausted = on_exhausted
+
+        self.limit = 0.0          # 本会话无需查库即可花费的上限
+        self.spent = 0.0          # 本地累计花费
+        self.balance: Optional[float] = None  # 最近一次查询到的余额
+        self.renewals = 0
+        self.exhausted = False
+        self.unlimited = False    # 余额查询失败时降级
+
+        self._acquired = False
+        self._acquire_task: Optional[asyncio.Task] = None
+        self._renew_task: Optional[asyncio.Task] = None
+        self._last_renew = 0.0
+
+    @property
+    def remaining(self) -> float:
+        return self.limit - self.spent
+
+    def start(self):
+        """在后台预留第一块额度，不阻塞会话启动"""
+        self._acquire_task = asyncio.create_task(self.acquire(), name="credit_lease_acquire")
+
+    async def acquire(self) -> bool:
+        """预留第一块额度，返回是否有可用余额"""
+        await self._refresh()
+        self._acquired = True
+        self._check_exhausted()
+        return not self.exhausted
+
+    async def _refresh(self):
+        balance = await self._client.get_credit_balance(self._api_key)
+        self._last_renew = time.monotonic()
+        if balance is None:
+            if not self.unlimited:
+                logger.error(f"Credit lease falling back to unlimited, balance lookup failed for {self._api_key}")
+            self.unlimited = True
+            return
+
+        self.unlimited = False
+        self.balance = balance
+        # 余额中尚未扣除本会话已花费的部分
+        available = max(balance - self.spent, 0.0)
+        self.limit = self.spent + min(self._chunk, available)
+        logger.debug(f"Credit lease for {self._api_key}: balance={balance:.4f}, limit={self.limit:.4f}, spent={self.spent:.4f}")
+
+    def spend(self, cost: float) -> bool:
+        """本地扣减，不访问数据库；返回租约是否仍然有效"""
+        if cost <= 0:
+            return not self.exhausted
+        self.spent += cost
+
+        if self.unlimited or not self._acquired:
+            # 首次预留尚未完成时先记账，预留完成后统一判断
+            return True
+
+        if self.remaining < self._low_watermark:
+            self._schedule_renew()
+        return not self.exhausted
+
+    def _renew_pending(self) -> bool:
+        return self._renew_task is not None and not self._renew_task.done()
+
+    def _schedule_renew(self):
+        if self._renew_pending() or self.exhausted:
+            return
+        wait = self._min_renew_interval - (time.monotonic() - self._last_renew)
+        self._renew_task = asyncio.create_task(self._renew(max(wait, 0.0)), name="credit_lease_renew")
+
+    async def _renew(self, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await self._refresh()
+            self.renewals += 1
+        except Exception as e:
+            logger.error(f"Error renewing credit lease: {str(e)}")
+            return
+        self._check_exhausted()
+
+    def _check_exhausted(self):
+        if self.unlimited or self.exhausted:
+            return
+        # 刚查询过余额，剩余额度仍不为正说明余额已用完
+        if self.remaining <= 0:
+            self.exhausted = True
+            logger.warning(f"Credits exhausted for API key {self._api_key}: spent={self.spent:.4f}, balance={self.balance}")
+            if self._on_exhausted:
+                self._on_exhausted()
+
+    async def reconcile(self, actual_cost: float) -> Dict:
+        """
+        会话结束时用权威成本对账
+
+        released 是本进程内未用完的额度，只用于统计：数据库中没有预留，无需归还。
+        """
+        for task in (self._acquire_task, self._renew_task):
+            if task is not None:
+                task.cancel()
+        result = {
+            'spent_local': self.spent,
+            'actual_cost': actual_cost,
+            'drift': actual_cost - self.spent,
+            'released': max(self.remaining, 0.0),
+            'renewals': self.renewals,
+            'exhausted': self.exhausted,
+        }
+        self.spent = actual_cost
+        self.limit = actual_cost
+        return result
@@ -0,0 +1,208 @@
+import asyncio
+import random
+from typing import Dict, List, Optional
+
+import httpx
+
+from config.settings import settings
+from utils.logger import logger
+
+# 请求尚未发出即失败，任何方法都可以安全重试
+_RETRYABLE_BEFORE_SEND = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# 请求可能已被服务端处理，只对幂等请求重试
+_RETRYABLE_AFTER_SEND = (httpx.ReadTimeout, httpx.WriteTimeout, httpx.RemoteProtocolError, httpx.ReadError)
+_RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+class PostgrestPool:
+    """
+    进程级共享的异步 PostgREST 客户端
+
+    所有 SupabaseClient 实例共用一个 keep-alive 连接池，并发数由信号量限制，
+    请求带超时，瞬时错误按指数退避 + 随机抖动重试。底层 httpx 客户端在第一次
+    请求时才创建，关闭后再次使用会自动重建。
+    """
+
+    def __init__(self,
+                 url: str,
+                 key: str,
+                 max_connections: int = 20,
+                 max_keepalive: int = 10,
+                 keepalive_expiry: float = 30.0,
+                 timeout: float = 10.0,
+                 connect_timeout: float = 5.0,
+                 max_concurrency: int = 16,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.2,
+                 backoff_max: float = 2.0):
+        self._base_url = f"{url.rstrip('/')}/rest/v1"
+        self._headers = {
+            'apikey': key,
+            'Authorization': f"Bearer {key}",
+            'Content-Type': 'application/json',
+        }
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._max_concurrency = max_concurrency
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # 统计
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.waiting = 0
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self._base_url,
+                headers=self._headers,
+                limits=self._limits,
+                timeout=self._timeout,
+            )
+            logger.debug(f"Created pooled PostgREST client for {self._base_url}")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._client
+
+    @staticmethod
+    def _is_retryable(error: Exception, idempotent: bool) -> bool:
+        if isinstance(error, _RETRYABLE_BEFORE_SEND):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return idempotent and error.response.status_code in _RETRYABLE_STATUS
+        return idempotent and isinstance(error, _RETRYABLE_AFTER_SEND)
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter
+        return random.uniform(0, min(self._backoff_max, self._backoff_base * (2 ** attempt)))
+
+    async def request(self,
+                      method: str,
+                      path: str,
+                      *,
+                      params=None,
+                      json=None,
+                      headers: Optional[Dict[str, str]] = None,
+                      idempotent: Optional[bool] = None) -> httpx.Response:
+        """发送请求，失败时按幂等性决定是否重试，最终失败抛出 httpx 异常"""
+        client = self._ensure_client()
+        if idempotent is None:
+            idempotent = method.upper() in ('GET', 'HEAD')
+
+        attempt = 0
+        while True:
+            self.waiting += 1
+            try:
+                await self._semaphore.acquire()
+            finally:
+                # 等待时被取消也要减掉
+                self.waiting -= 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.requests += 1
+            try:
+                response = await client.request(method, path, params=params, json=json, headers=headers)
+                response.raise_for_status()
+                return response
+            except Exception as e:
+                if attempt >= self._max_retries or not self._is_retryable(e, idempotent):
+                    self.errors += 1
+                    raise
+            finally:
+                self.in_flight -= 1
+                self._semaphore.release()
+
+            delay = self._backoff(attempt)
+            attempt += 1
+            self.retries += 1
+            logger.warning(f"PostgREST {method} {path} failed, retrying in {delay:.2f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+    async def select(self,
+                     table: str,
+                     columns: str,
+                     filters: Optional[Dict[str, str]] = None,
+                     limit: Optional[int] = None) -> List[Dict]:
+        """查询表，filters 使用 PostgREST 语法，例如 {'status': 'eq.active'}"""
+        params = {'select': columns, **(filters or {})}
+        if limit is not None:
+            params['limit'] = str(limit)
+        response = await self.request('GET', f"/{table}", params=params)
+        return response.json()
+
+    async def insert(self, table: str, rows: List[Dict], idempotent: bool = False, on_conflict: Optional[str] = None):
+        """批量插入，不返回写入的行；指定 on_conflict（唯一列）时跳过已存在的行，可以安全重试"""
+        if on_conflict is not None:
+            await self.request(
+                'POST', f"/{table}", json=rows,
+                params={'on_conflict': on_conflict},
+                headers={'Prefer': 'return=minimal,resolution=ignore-duplicates'},
+                idempotent=True,
+            )
+            return
+        await self.request(
+            'POST', f"/{table}", json=rows,
+            headers={'Prefer': 'return=minimal'},
+            idempotent=idempotent,
+        )
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'waiting': self.waiting,
+            'max_concurrency': self._max_concurrency,
+            'max_connections': self._limits.max_connections,
+            'utilisation': self.in_flight / self._max_concurrency if self._max_concurrency else 0.0,
+        }
+
+
+_shared_pool: Optional[PostgrestPool] = None
+
+
+def get_pool() -> PostgrestPool:
+    """获取进程级共享连接池（首次调用时创建）"""
+    global _shared_pool
+    if _shared_pool is None:
+        config = settings.SUPABASE_POOL_CONFIG
+        _shared_pool = PostgrestPool(
+            settings.SUPABASE_URL,
+            settings.SUPABASE_KEY,
+            max_connections=config["MAX_CONNECTIONS"],
+            max_keepalive=config["MAX_KEEPALIVE"],
+            keepalive_expiry=config["KEEPALIVE_EXPIRY"],
+            timeout=config["TIMEOUT"],
+            connect_timeout=config["CONNECT_TIMEOUT"],
+            max_concurrency=config["MAX_CONCURRENCY"],
+            max_retries=config["MAX_RETRIES"],
+            backoff_base=config["BACKOFF_BASE"],
+            backoff_max=config["BACKOFF_MAX"],
+        )
+    return _shared_pool
+
+
+async def close_pool():
+    """关闭进程级连接池（任务进程退出前调用）"""
+    if _shared_pool is not None:
+        logger.debug(f"Closing PostgREST pool: {_shared_pool.stats()}")
+        await _shared_pool.aclose()
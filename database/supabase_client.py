@@ -1,34 +1,83 @@
 from datetime import datetime
-from typing import Optional
-from supabase import create_client, Client
+from typing import Dict, List, Optional
 from config.settings import settings
+from database.apikey_cache import apikey_cache
+from database.credit_lease import CreditLease
+from database.pool import PostgrestPool, get_pool
+from database.usage_spool import get_usage_spool
+from database.usage_writer import UsageWriter
 from utils.logger import logger
 
 
 class SupabaseClient:
     def __init__(self):
-        self.client: Client = create_client(
-            settings.SUPABASE_URL,
-            settings.SUPABASE_KEY
+        # 所有实例共用进程级连接池，构造本身不建立任何连接
+        self.pool: PostgrestPool = get_pool()
+        # 开启落盘时记录同步写入本地，由主进程重放到数据库
+        self.usage_spool = get_usage_spool()
+        self.usage_writer = UsageWriter(
+            self.write_usage_batch,
+            batch_size=settings.USAGE_WRITER_CONFIG["BATCH_SIZE"],
+            flush_interval=settings.USAGE_WRITER_CONFIG["FLUSH_INTERVAL"],
+            max_queue_size=settings.USAGE_WRITER_CONFIG["MAX_QUEUE_SIZE"],
         )
 
+    async def _load_user_uuid(self, api_key: str) -> Optional[str]:
+        """查询 apikeys 表，key 不存在或未激活时返回 None"""
+        rows = await self.pool.select(
+            'apikeys',
+            'user_uuid',
+            {'api_key': f'eq.{api_key}', 'status': 'eq.active'},
+            limit=1,
+        )
+        if rows:
+            return rows[0].get('user_uuid')
+        return None
+
     async def get_user_uuid_by_apikey(self, api_key: str) -> Optional[str]:
-        """根据 API key 获取用户 UUID"""
+        """根据 API key 获取用户 UUID（经过进程内缓存）"""
         try:
-            response = self.client.table('apikeys')\
-                .select('user_uuid')\
-                .eq('api_key', api_key)\
-                .eq('status', 'active')\
-                .single()\
-                .execute()
-            
-            if response.data:
-                return response.data.get('user_uuid')
-            return None
+            return await apikey_cache.get(api_key, self._load_user_uuid)
         except Exception as e:
             logger.error(f"Error getting user_uuid for API key: {str(e)}")
             return None
 
+    def invalidate_api_key(self, api_key: str):
+        """API key 被吊销或变更后，清除其缓存"""
+        apikey_cache.invalidate(api_key)
+
+    async def write_usage_batch(self, records: List[Dict]):
+        """
+        批量写入 usage_logs（由 UsageWriter 或 UsageReplayer 调用）
+
+        查询用户失败时整批抛出异常，由调用方决定是否重试；带 idempotency_key 的记录
+        （来自落盘队列）重复写入时被数据库忽略。
+        """
+        user_uuids: Dict[str, Optional[str]] = {}
+        rows = []
+        for record in records:
+            api_key = record['api_key']
+            if api_key not in user_uuids:
+                user_uuids[api_key] = await apikey_cache.get(api_key, self._load_user_uuid)
+            user_uuid = user_uuids[api_key]
+            if not user_uuid:
+                logger.error(f"Invalid or inactive API key: {api_key}")
+                continue
+            # PostgREST 批量插入要求每行的字段一致
+            rows.append({
+                'request_id': None,
+                'error_message': None,
+                **record,
+                'user_uuid': user_uuid,
+            })
+
+        if not rows:
+            return
+
+        on_conflict = 'idempotency_key' if 'idempotency_key' in rows[0] else None
+        await self.pool.insert('usage_logs', rows, on_conflict=on_conflict)
+        logger.debug(f"Logged {len(rows)} usage records in one batch")
+
     async def log_usage(self,
                        api_key: str,
                        service_type: str,
@@ -40,17 +89,13 @@ class SupabaseClient:
                        error_message: Optional[str] = None):
         """
         记录 API 使用情况
+
+        只把记录交给后台写入器，不在事件循环上等待数据库；
+        用户 UUID 在批量写入时统一解析。
         """
         try:
-            # 获取用户 UUID
-            user_uuid = await self.get_user_uuid_by_apikey(api_key)
-            if not user_uuid:
-                logger.error(f"Invalid or inactive API key: {api_key}")
-                return
-
             data = {
                 'api_key': api_key,
-                'user_uuid': user_uuid,
                 'service_type': service_type,
                 'usage_amount': usage_amount,
                 'cost': cost,
@@ -63,37 +108,60 @@ class SupabaseClient:
                 data['request_id'] = request_id
             if error_message:
                 data['error_message'] = error_message
-                
-            self.client.table('usage_logs').insert(data).execute()
-            logger.debug(f"Logged {service_type} usage for user {user_uuid}: {data}")
-            
+
+            if self.usage_spool is not None:
+                self.usage_spool.append(data)
+            else:
+                self.usage_writer.submit(data)
+
         except Exception as e:
             logger.error(f"Error logging usage: {str(e)}")
 
-    async def check_credits(self, api_key: str, required_cost: float) -> bool:
-        """检查用户是否有足够的积分"""
+    async def get_credit_balance(self, api_key: str) -> Optional[float]:
+        """查询用户当前有效积分总和，key 确认不存在或未激活时返回 0，查询失败返回 None"""
         try:
-            user_uuid = await self.get_user_uuid_by_apikey(api_key)
+            # 直接走缓存：查询失败要抛到下面返回 None，不能当作无效 key
+            user_uuid = await apikey_cache.get(api_key, self._load_user_uuid)
             if not user_uuid:
-                return False
+                return 0.0
 
-            # 获取用户当前有效的积分总和
-            response = self.client.table('credits')\
-                .select('credits')\
-                .eq('user_uuid', user_uuid)\
-                .gte('expired_at', datetime.now().isoformat())\
-                .execute()
+            rows = await self.pool.select(
+                'credits',
+                'credits',
+                {'user_uuid': f'eq.{user_uuid}', 'expired_at': f'gte.{datetime.now().isoformat()}'},
+            )
 
-            total_credits = sum(row.get('credits', 0) for row in response.data)
-            return total_credits >= required_cost
+            return float(sum(row.get('credits', 0) for row in rows))
 
         except Exception as e:
-            logger.error(f"Error checking credits: {str(e)}")
+            logger.error(f"Error fetching credit balance: {str(e)}")
+            return None
+
+    async def check_credits(self, api_key: str, required_cost: float) -> bool:
+        """检查用户是否有足够的积分"""
+        total_credits = await self.get_credit_balance(api_key)
+        if total_credits is None:
             return False
+        return total_credits >= required_cost
+
+    async def _authorize(self, api_key: str, cost: float, lease: Optional[CreditLease]) -> bool:
+        """有租约时在本地扣减，否则回退到逐次查库"""
+        if lease is not None:
+            return lease.spend(cost)
+        return await self.check_credits(api_key, cost)
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的使用记录全部写入"""
+        return await self.usage_writer.flush(timeout)
+
+    async def aclose(self, timeout: Optional[float] = None) -> bool:
+        """排空使用记录队列并停止后台写入"""
+        return await self.usage_writer.aclose(timeout)
 
-    async def log_llm_usage(self, api_key: str, tokens: int, cost: float, **kwargs):
+    async def log_llm_usage(self, api_key: str, tokens: int, cost: float,
+                            lease: Optional[CreditLease] = None, **kwargs):
         # 检查积分是否足够
-        if not await self.check_credits(api_key, cost):
+        if not await self._authorize(api_key, cost, lease):
             logger.error(f"Insufficient credits for API key: {api_key}")
             return
 
@@ -105,8 +173,9 @@ class SupabaseClient:
             **kwargs
         )
 
-    async def log_tts_usage(self, api_key: str, characters: int, cost: float, **kwargs):
-        if not await self.check_credits(api_key, cost):
+    async def log_tts_usage(self, api_key: str, characters: int, cost: float,
+                            lease: Optional[CreditLease] = None, **kwargs):
+        if not await self._authorize(api_key, cost, lease):
             logger.error(f"Insufficient credits for API key: {api_key}")
             return
 
@@ -118,8 +187,9 @@ class SupabaseClient:
             **kwargs
         )
 
-    async def log_stt_usage(self, api_key: str, duration: float, cost: float, **kwargs):
-        if not await self.check_credits(api_key, cost):
+    async def log_stt_usage(self, api_key: str, duration: float, cost: float,
+                            lease: Optional[CreditLease] = None, **kwargs):
+        if not await self._authorize(api_key, cost, lease):
             logger.error(f"Insufficient credits for API key: {api_key}")
             return
 
@@ -131,8 +201,9 @@ class SupabaseClient:
             **kwargs
         )
 
-    async def log_vad_usage(self, api_key: str, duration: float, cost: float, **kwargs):
-        if not await self.check_credits(api_key, cost):
+    async def log_vad_usage(self, api_key: str, duration: float, cost: float,
+                            lease: Optional[CreditLease] = None, **kwargs):
+        if not await self._authorize(api_key, cost, lease):
             logger.error(f"Insufficient credits for API key: {api_key}")
             return
 
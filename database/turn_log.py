@@ -0,0 +1,167 @@
+import base64
+import random
+import zlib
+from typing import Dict, List, Optional
+
+from livekit.agents import llm
+from livekit.agents.metrics.base import LLMMetrics, PipelineEOUMetrics, STTMetrics, TTSMetrics
+
+from config.settings import settings
+from database.pool import get_pool
+from database.usage_writer import UsageWriter
+from utils.logger import logger
+
+_COMPRESSED_PREFIX = "zlib:"
+
+
+def compress_text(text: str, threshold: int) -> str:
+    """超过 threshold 字节的文本压缩为 "zlib:" + base64，压缩后不更小时保留原文"""
+    raw = text.encode('utf-8')
+    if threshold <= 0 or len(raw) <= threshold:
+        return text
+    packed = _COMPRESSED_PREFIX + base64.b64encode(zlib.compress(raw, 6)).decode('ascii')
+    return packed if len(packed) < len(raw) else text
+
+
+def decompress_text(value: str) -> str:
+    """compress_text 的逆操作，供分析时读取"""
+    if value and value.startswith(_COMPRESSED_PREFIX):
+        return zlib.decompress(base64.b64decode(value[len(_COMPRESSED_PREFIX):])).decode('utf-8')
+    return value
+
+
+def _message_text(msg: llm.ChatMessage) -> str:
+    if isinstance(msg.content, str):
+        return msg.content
+    if isinstance(msg.content, list):
+        return " ".join(part for part in msg.content if isinstance(part, str))
+    return ""
+
+
+class TurnLogger:
+    """
+    逐轮写入 stt_logs / llm_logs / tts_logs
+
+    用户语音提交时写一行 stt_logs（转写文本、此前送入 STT 的音频时长、转写延迟）；
+    agent 语音提交或被打断时写 llm_logs（用户这句话 → 回复文本、token 数、生成耗时）
+    和 tts_logs（回复文本、合成音频时长）。问候语等没有 LLM 请求的语音只写 tts_logs。
+    事件回调里只做内存操作，行交给后台批量写入器，不影响对话延迟。
+    """
+
+    def __init__(self,
+                 stt_model: str,
+                 llm_model: str,
+                 tts_model: str,
+                 voice_id: str,
+                 compress_threshold: int = 4096,
+                 batch_size: int = 50,
+                 flush_interval: float = 2.0,
+                 max_queue_size: int = 1000):
+        self._stt_model = stt_model
+        self._llm_model = llm_model
+        self._tts_model = tts_model
+        self._voice_id = voice_id
+        self._compress_threshold = compress_threshold
+        self._writer = UsageWriter(
+            self._write_rows,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            max_queue_size=max_queue_size,
+            name="turn log",
+        )
+
+        # 尚未归入某一轮的指标
+        self._stt_audio = 0.0
+        self._transcription_delay = 0.0
+        self._llm: List[LLMMetrics] = []
+        self._tts: List[TTSMetrics] = []
+        self._prompt = ""
+
+    def attach(self, agent):
+        agent.on("user_speech_committed", self.on_user_speech)
+        agent.on("agent_speech_committed", self.on_agent_speech)
+        agent.on("agent_speech_interrupted", self.on_agent_speech)
+
+    def on_metrics(self, mtrcs):
+        if isinstance(mtrcs, STTMetrics):
+            self._stt_audio += mtrcs.audio_duration
+        elif isinstance(mtrcs, PipelineEOUMetrics):
+            self._transcription_delay = mtrcs.transcription_delay
+        elif isinstance(mtrcs, LLMMetrics):
+            self._llm.append(mtrcs)
+        elif isinstance(mtrcs, TTSMetrics):
+            self._tts.append(mtrcs)
+
+    def _text(self, text: str) -> str:
+        return compress_text(text, self._compress_threshold)
+
+    def on_user_speech(self, msg: llm.ChatMessage):
+        text = _message_text(msg)
+        self._submit('stt_logs', {
+            'audio_duration': round(self._stt_audio, 3),
+            'transcription': self._text(text),
+            'model': self._stt_model,
+            'duration': round(self._transcription_delay, 3),
+        })
+        self._stt_audio = 0.0
+        self._transcription_delay = 0.0
+        self._prompt = text
+
+    def on_agent_speech(self, msg: llm.ChatMessage):
+        text = _message_text(msg)
+        if self._llm:
+            self._submit('llm_logs', {
+                'prompt': self._text(self._prompt),
+                'response': self._text(text),
+                'model': self._llm_model,
+                'tokens_used': sum(m.total_tokens for m in self._llm),
+                'duration': round(sum(m.duration for m in self._llm), 3),
+            })
+        if text:
+            self._submit('tts_logs', {
+                'text': self._text(text),
+                'voice_id': self._voice_id,
+                'model': self._tts_model,
+                'duration': round(sum(m.audio_duration for m in self._tts), 3),
+            })
+        self._llm, self._tts = [], []
+        self._prompt = ""
+
+    def _submit(self, table: str, row: Dict):
+        self._writer.submit({'table': table, 'row': row})
+
+    async def _write_rows(self, records: List[Dict]):
+        # PostgREST 批量插入按表分组，同一表的行字段一致
+        by_table: Dict[str, List[Dict]] = {}
+        for record in records:
+            by_table.setdefault(record['table'], []).append(record['row'])
+        pool = get_pool()
+        for table, rows in by_table.items():
+            await pool.insert(table, rows)
+
+    def stats(self) -> Dict:
+        return self._writer.stats()
+
+    async def aclose(self, timeout: Optional[float] = None):
+        await self._writer.aclose(timeout)
+
+
+def create_turn_logger(profile) -> Optional[TurnLogger]:
+    """按采样率决定本会话是否逐轮记录；未采样时返回 None，调用方不注册任何回调"""
+    config = settings.TURN_LOG_CONFIG
+    if config["SAMPLE_RATE"] <= 0 or random.random() >= config["SAMPLE_RATE"]:
+        return None
+    try:
+        return TurnLogger(
+            stt_model=settings.DEEPGRAM_CONFIG["model"],
+            llm_model=profile.llm_model,
+            tts_model=profile.tts.get("model", ""),
+            voice_id=profile.tts.get("voice", ""),
+            compress_threshold=config["COMPRESS_THRESHOLD"],
+            batch_size=config["BATCH_SIZE"],
+            flush_interval=config["FLUSH_INTERVAL"],
+            max_queue_size=config["MAX_QUEUE_SIZE"],
+        )
+    except Exception as e:
+        logger.error(f"Error creating turn logger: {str(e)}")
+        return None
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from utils.logger import logger
+
+
+class UsageSpool:
+    """
+    使用记录的本地落盘队列（SQLite WAL，每个 worker 一个文件）
+
+    任务进程 append() 同步写入并提交，WAL + synchronous=NORMAL 下一次提交只是追加写
+    WAL 文件（几十微秒），进程被杀也不会丢；主进程的 UsageReplayer 按写入顺序批量读取，
+    写入数据库成功后再删除。多个进程共用同一个文件，由 SQLite 的文件锁串行化。
+
+    每条记录在写入时分配 idempotency_key，重放时数据库按它去重：写库成功但删除前进程
+    退出，下次重放同一批也不会重复计费。超过 max_bytes 时拒绝新记录（与内存队列满时
+    的处理一致），并计入 dropped。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._page_size = 4096
+
+        # 统计（本进程）
+        self.appended = 0
+        self.dropped = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage_records ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "created_at REAL NOT NULL, "
+                "payload TEXT NOT NULL)"
+            )
+            self._page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _used_bytes(self, conn: sqlite3.Connection) -> int:
+        # 删除后的空闲页会被复用，只计算在用的页
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * self._page_size
+
+    def append(self, record: Dict) -> bool:
+        """同步写入一条记录，空间已满或写入失败时返回 False"""
+        record = {**record, 'idempotency_key': uuid.uuid4().hex}
+        try:
+            with self._lock:
+                conn = self._connect()
+                if self._max_bytes and self._used_bytes(conn) >= self._max_bytes:
+                    self.dropped += 1
+                    logger.error(f"Usage spool full ({self._max_bytes} bytes), dropping {record.get('service_type')} record")
+                    return False
+                conn.execute(
+                    "INSERT INTO usage_records (created_at, payload) VALUES (?, ?)",
+                    (time.time(), json.dumps(record)),
+                )
+            self.appended += 1
+            return True
+        except sqlite3.Error as e:
+            self.dropped += 1
+            logger.error(f"Error spooling usage record: {str(e)}")
+            return False
+
+    def read_batch(self, limit: int) -> List[Tuple[int, float, Dict]]:
+        """按写入顺序读取最早的 limit 条：(seq, created_at, record)"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT seq, created_at, payload FROM usage_records ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        return [(seq, created_at, json.loads(payload)) for seq, created_at, payload in rows]
+
+    def delete(self, seqs: List[int]):
+        if not seqs:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            conn.executemany("DELETE FROM usage_records WHERE seq = ?", [(seq,) for seq in seqs])
+            conn.execute("COMMIT")
+
+    def backlog(self) -> Dict:
+        """未重放的记录数、占用空间和最早一条的等待时间（秒）"""
+        with self._lock:
+            conn = self._connect()
+            count, oldest = conn.execute("SELECT COUNT(*), MIN(created_at) FROM usage_records").fetchone()
+            used = self._used_bytes(conn)
+        return {
+            'records': count,
+            'bytes': used,
+            'oldest_age': max(0.0, time.time() - oldest) if oldest is not None else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class UsageReplayer:
+    """
+    主 worker 进程内把落盘的记录批量写入 usage_logs
+
+    在独立线程的事件循环中运行，不占用 worker 的事件循环。写入失败时保留记录，
+    按指数退避重试；replay_lag 为最近一批记录从写入本地到写入数据库的时间。
+    """
+
+    def __init__(self,
+                 spool: UsageSpool,
+                 write_batch: Callable[[List[Dict]], Awaitable[None]],
+                 batch_size: int = 200,
+                 interval: float = 1.0,
+                 max_backoff: float = 60.0):
+        self._spool = spool
+        self._write_batch = write_batch
+        self._batch_size = batch_size
+        self._interval = interval
+        self._max_backoff = max_backoff
+
+        # 统计
+        self.replayed = 0
+        self.failed_batches = 0
+        self.replay_lag = 0.0
+        self.max_replay_lag = 0.0
+
+    def start(self):
+        threading.Thread(target=lambda: asyncio.run(self._run()), name="usage_replayer", daemon=True).start()
+
+    async def _run(self):
+        backoff = self._interval
+        while True:
+            try:
+                batch = self._spool.read_batch(self._batch_size)
+                if batch:
+                    await self._write_batch([record for _, _, record in batch])
+                    self._spool.delete([seq for seq, _, _ in batch])
+                    now = time.time()
+                    self.replayed += len(batch)
+                    self.replay_lag = now - batch[0][1]
+                    self.max_replay_lag = max(self.max_replay_lag, self.replay_lag)
+                    backoff = self._interval
+                    if len(batch) == self._batch_size:
+                        continue
+            except Exception as e:
+                self.failed_batches += 1
+                logger.error(f"Error replaying usage records, retrying in {backoff:.0f}s: {str(e)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self._max_backoff)
+                continue
+            await asyncio.sleep(self._interval)
+
+    def stats(self) -> Dict:
+        return {
+            **self._spool.backlog(),
+            'replayed': self.replayed,
+            'failed_batches': self.failed_batches,
+            'replay_lag': round(self.replay_lag, 3),
+            'max_replay_lag': round(self.max_replay_lag, 3),
+        }
+
+
+_spool: Optional[UsageSpool] = None
+
+
+def get_usage_spool() -> Optional[UsageSpool]:
+    """本进程的落盘队列（首次调用时创建），未开启时返回 None"""
+    global _spool
+    if not settings.USAGE_SPOOL_CONFIG["ENABLED"]:
+        return None
+    if _spool is None:
+        _spool = UsageSpool(settings.USAGE_SPOOL_CONFIG["PATH"], settings.USAGE_SPOOL_CONFIG["MAX_BYTES"])
+    return _spool
+
+
+def start_usage_replayer(metrics=None) -> Optional[UsageReplayer]:
+    """在主 worker 进程中启动重放（须在 cli.run_app 之前调用），metrics 为 WorkerMetrics 时导出积压指标"""
+    spool = get_usage_spool()
+    if spool is None:
+        return None
+    try:
+        from database.supabase_client import SupabaseClient
+
+        client = SupabaseClient()
+        replayer = UsageReplayer(
+            spool,
+            client.write_usage_batch,
+            batch_size=settings.USAGE_SPOOL_CONFIG["BATCH_SIZE"],
+            interval=settings.USAGE_SPOOL_CONFIG["REPLAY_INTERVAL"],
+            max_backoff=settings.USAGE_SPOOL_CONFIG["MAX_BACKOFF"],
+        )
+        replayer.start()
+        if metrics is not None:
+            metrics.register_gauge('voice_agent_usage_spool_records', 'Usage records waiting to be replayed',
+                                   lambda: spool.backlog()['records'])
+            metrics.register_gauge('voice_agent_usage_spool_bytes', 'Disk used by the usage spool',
+                                   lambda: spool.backlog()['bytes'])
+            metrics.register_gauge('voice_agent_usage_spool_oldest_seconds', 'Age of the oldest unreplayed usage record',
+                                   lambda: spool.backlog()['oldest_age'])
+            metrics.register_gauge('voice_agent_usage_replay_lag_seconds', 'Spool-to-database lag of the last replayed batch',
+                                   lambda: replayer.replay_lag)
+        logger.info(f"Replaying usage records from {settings.USAGE_SPOOL_CONFIG['PATH']}")
+        return replayer
+    except Exception as e:
+        # 记录仍在本地，重启后继续重放
+        logger.error(f"Error starting usage replayer: {str(e)}")
+        return None
@@ -0,0 +1,135 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from utils.logger import logger
+
+
+class UsageWriter:
+    """
+    usage_logs 等表的后台批量写入器（write-behind）
+
+    submit() 只把记录放进内存队列，不做任何 I/O；后台任务按条数（batch_size）
+    或时间（flush_interval）聚合成一批，再交给 write_batch 批量写入。
+    write_batch 负责保证数据库 I/O 不阻塞事件循环。
+    """
+
+    def __init__(self,
+                 write_batch: Callable[[List[Dict]], Awaitable[None]],
+                 batch_size: int = 50,
+                 flush_interval: float = 1.0,
+                 max_queue_size: int = 10000,
+                 name: str = "usage"):
+        self._write_batch = write_batch
+        self._name = name
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_queue_size = max_queue_size
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._pending = 0
+        self._draining = False
+
+        # 统计
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def _ensure_started(self):
+        """首次提交时在当前事件循环上启动后台任务"""
+        if self._task is not None and not self._task.done():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_queue_size)
+            self._idle = asyncio.Event()
+            self._idle.set()
+        self._task = asyncio.create_task(self._run(), name=f"{self._name}_writer")
+
+    def submit(self, record: Dict) -> bool:
+        """非阻塞地提交一条使用记录，队列已满时丢弃并返回 False"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"{self._name.capitalize()} queue full ({self._max_queue_size}), dropping {record.get('service_type') or record.get('table')} record")
+            return False
+
+        self.submitted += 1
+        self._pending += 1
+        self._idle.clear()
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._flush_interval
+
+            # 在 flush_interval 内尽量凑满一批；排空阶段不再等待
+            while len(batch) < self._batch_size:
+                timeout = deadline - loop.time()
+                if self._draining or timeout <= 0:
+                    if self._queue.empty():
+                        break
+                    batch.append(self._queue.get_nowait())
+                    continue
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._write(batch)
+
+    async def _write(self, batch: List[Dict]):
+        try:
+            await self._write_batch(batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Error writing {self._name} batch ({len(batch)} records): {str(e)}")
+        finally:
+            self._pending -= len(batch)
+            if self._pending <= 0:
+                self._idle.set()
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待所有已提交的记录写入完成，超时返回 False"""
+        if self._pending <= 0:
+            return True
+
+        self._draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out flushing {self._name} records, {self._pending} still pending")
+            return False
+        finally:
+            self._draining = False
+
+    async def aclose(self, timeout: Optional[float] = None) -> bool:
+        """排空队列后停止后台任务"""
+        flushed = await self.flush(timeout)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        return flushed
+
+    def stats(self) -> Dict:
+        return {
+            'submitted': self.submitted,
+            'written': self.written,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'pending': self._pending,
+        }
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import math
+import random
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from aiohttp import WSMsgType, web
+
+# 各服务商的延迟/吞吐配置，jitter 为上下浮动的比例
+PROFILES: Dict[str, Dict] = {
+    'fast': {
+        'stt_final_delay': 0.05,      # 静音达到 endpointing 后再过多久给出最终转写（秒）
+        'llm_ttft': 0.15,             # LLM 首 token 时间（秒）
+        'llm_tokens_per_second': 120,
+        'llm_reply_words': 40,        # 每次回复的词数
+        'tts_ttfb': 0.08,             # TTS 首包时间（秒）
+        'tts_realtime_factor': 0.1,   # 合成耗时 / 音频时长
+        'db_latency': 0.01,           # PostgREST 请求耗时（秒）
+        'jitter': 0.1,
+    },
+    'typical': {
+        'stt_final_delay': 0.15,
+        'llm_ttft': 0.45,
+        'llm_tokens_per_second': 60,
+        'llm_reply_words': 60,
+        'tts_ttfb': 0.2,
+        'tts_realtime_factor': 0.25,
+        'db_latency': 0.04,
+        'jitter': 0.25,
+    },
+    'slow': {
+        'stt_final_delay': 0.4,
+        'llm_ttft': 1.2,
+        'llm_tokens_per_second': 25,
+        'llm_reply_words': 80,
+        'tts_ttfb': 0.5,
+        'tts_realtime_factor': 0.6,
+        'db_latency': 0.15,
+        'jitter': 0.4,
+    },
+}
+
+# 模拟孩子说的话，假 Deepgram 按顺序循环给出
+USER_UTTERANCES = [
+    "My name is Lily.",
+    "I want a story about a dragon who is afraid of the dark.",
+    "Can the dragon have a friend who is a little owl?",
+    "They should go to a cave full of glowing crystals.",
+    "What happens when they find the treasure?",
+    "Make the owl tell a joke.",
+]
+
+_STORY_WORDS = (
+    "Once upon a time, in a valley wrapped in soft purple mist, there lived a small dragon named Ember. "
+    "Ember could breathe the warmest golden fire, but every night when the stars came out, "
+    "Ember hid under a blanket of leaves, because the dark felt big and full of strange sounds. "
+    "One evening a tiny owl landed on a branch nearby and blinked two round eyes. "
+    "Hello, said the owl, I see much better in the dark, shall we explore it together? "
+).split()
+
+# 假 Deepgram 判断为语音的 RMS 阈值（16-bit PCM）
+_SPEECH_RMS = 500
+
+
+def jittered(profile: Dict, key: str) -> float:
+    value = profile[key]
+    return max(0.0, value * (1 + random.uniform(-profile['jitter'], profile['jitter'])))
+
+
+def deterministic(profile: Dict) -> Dict:
+    """去掉浮动的配置：每次请求的延迟都取配置值，用于可重复的基准测试"""
+    return dict(profile, jitter=0.0)
+
+
+def reply_text(words: int) -> str:
+    start = random.randrange(len(_STORY_WORDS))
+    return ' '.join(_STORY_WORDS[(start + i) % len(_STORY_WORDS)] for i in range(words))
+
+
+class FakeProviderServer:
+    """
+    本地假服务商（一个 aiohttp 应用）
+
+    /v1/listen：Deepgram 流式识别 websocket，按能量判断语音起止，给出中间和最终转写；
+    /v1/chat/completions：OpenAI 兼容的流式接口，按 ttft 和 tokens/s 输出；
+    /rest/v1/*：PostgREST，api key 总是有效、积分充足，写入直接丢弃；
+    其他路径返回 200，供连接池预热和健康检查使用。
+    """
+
+    def __init__(self, profile: Dict):
+        self._profile = profile
+        self.stats = {'stt_streams': 0, 'llm_requests': 0, 'db_requests': 0}
+        self.app = web.Application()
+        self.app.router.add_get('/v1/listen', self._listen)
+        self.app.router.add_post('/v1/chat/completions', self._chat)
+        self.app.router.add_route('*', '/rest/v1/{table}', self._postgrest)
+        self.app.router.add_route('*', '/{tail:.*}', self._ok)
+
+    async def _ok(self, request: web.Request):
+        return web.Response(text='ok')
+
+    async def _postgrest(self, request: web.Request):
+        self.stats['db_requests'] += 1
+        await asyncio.sleep(jittered(self._profile, 'db_latency'))
+        table = request.match_info['table']
+        if request.method != 'GET':
+            await request.read()
+            return web.Response(status=201)
+        if table == 'apikeys':
+            return web.json_response([{'user_uuid': 'loadtest-user'}])
+        if table == 'credits':
+            return web.json_response([{'credits': 1e9}])
+        return web.json_response([])
+
+    async def _chat(self, request: web.Request):
+        self.stats['llm_requests'] += 1
+        body = await request.json()
+        prompt_chars = sum(len(str(m.get('content') or '')) for m in body.get('messages', []))
+        words = reply_text(self._profile['llm_reply_words']).split()
+        request_id = f"chatcmpl-{random.getrandbits(48):x}"
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+
+        async def _send(payload: Dict):
+            await response.write(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+
+        def _chunk(delta: Dict, finish_reason=None) -> Dict:
+            return {
+                'id': request_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': body.get('model', 'fake'),
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+
+        await asyncio.sleep(jittered(self._profile, 'llm_ttft'))
+        await _send(_chunk({'role': 'assistant', 'content': ''}))
+        interval = 1.0 / self._profile['llm_tokens_per_second']
+        for i, word in enumerate(words):
+            await _send(_chunk({'content': word if i == 0 else ' ' + word}))
+            await asyncio.sleep(interval)
+        await _send(_chunk({}, finish_reason='stop'))
+        if (body.get('stream_options') or {}).get('include_usage'):
+            await _send({
+                'id': request_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': body.get('model', 'fake'), 'choices': [],
+                'usage': {'prompt_tokens': prompt_chars // 4, 'completion_tokens': len(words),
+                          'total_tokens': prompt_chars // 4 + len(words)},
+            })
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def _listen(self, request: web.Request):
+        self.stats['stt_streams'] += 1
+        sample_rate = int(request.query.get('sample_rate', '16000'))
+        endpointing = request.query.get('endpointing', 'false')
+        endpointing_s = 0.3 if endpointing == 'false' else int(endpointing) / 1000
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        utterance = 0
+        speaking = False
+        speech_s = silence_s = audio_s = 0.0
+        interim_at = 0.0
+        pending: List[asyncio.Task] = []
+
+        async def _send_results(text: str, start: float, duration: float, is_final: bool):
+            if is_final:
+                await asyncio.sleep(jittered(self._profile, 'stt_final_delay'))
+            words = text.split()
+            step = duration / max(len(words), 1)
+            if not ws.closed:
+                await ws.send_json({
+                    'type': 'Results', 'channel_index': [0, 1], 'start': start, 'duration': duration,
+                    'is_final': is_final, 'speech_final': is_final,
+                    'channel': {'alternatives': [{
+                        'transcript': text, 'confidence': 0.98,
+                        'words': [{'word': w, 'start': start + i * step, 'end': start + (i + 1) * step,
+                                   'confidence': 0.98} for i, w in enumerate(words)],
+                    }]},
+                    'metadata': {'request_id': f"fake-{id(ws):x}"},
+                })
+
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT:
+                if json.loads(msg.data).get('type') == 'CloseStream':
+                    break
+                continue
+            if msg.type != WSMsgType.BINARY:
+                continue
+
+            samples = array('h', msg.data)
+            duration = len(samples) / sample_rate
+            audio_s += duration
+            rms = math.sqrt(sum(s * s for s in samples) / len(samples)) if samples else 0.0
+            text = USER_UTTERANCES[utterance % len(USER_UTTERANCES)]
+
+            if rms >= _SPEECH_RMS:
+                if not speaking:
+                    speaking, speech_s, interim_at = True, 0.0, 0.0
+                    await ws.send_json({'type': 'SpeechStarted', 'channel': [0], 'timestamp': audio_s})
+                speech_s += duration
+                silence_s = 0.0
+                if speech_s - interim_at >= 0.4:
+                    interim_at = speech_s
+                    # 中间结果随说话时长逐步给出更多的词
+                    words = text.split()
+                    partial = ' '.join(words[:max(1, int(len(words) * min(speech_s / 2.0, 0.9)))])
+                    await _send_results(partial, audio_s - speech_s, speech_s, False)
+            elif speaking:
+                silence_s += duration
+                if silence_s >= endpointing_s:
+                    speaking = False
+                    pending.append(asyncio.create_task(
+                        _send_results(text, audio_s - speech_s - silence_s, speech_s, True)
+                    ))
+                    utterance += 1
+
+        for task in pending:
+            task.cancel()
+        await ws.close()
+        return ws
+
+
+async def serve(host: str, port: int, profile: Dict):
+    server = FakeProviderServer(profile)
+    runner = web.AppRunner(server.app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return server, runner
+
+
+def run_server(host: str, port: int, profile_name: str, ready, stop, seed: Optional[int] = None):
+    """在单独的进程中运行假服务商，ready/stop 为 multiprocessing.Event；给定 seed 时延迟和回复文本固定"""
+    profile = PROFILES[profile_name]
+    if seed is not None:
+        random.seed(seed)
+        profile = deterministic(profile)
+
+    async def _main():
+        _, runner = await serve(host, port, profile)
+        ready.set()
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+        await runner.cleanup()
+
+    asyncio.run(_main())
@@ -0,0 +1,301 @@
+import asyncio
+import math
+import time
+import wave
+from array import array
+from types import SimpleNamespace
+from typing import List, Optional
+
+from livekit import rtc
+
+from loadtest.fake_providers import USER_UTTERANCES
+
+_SAMPLE_RATE = 16000
+_FRAME_SAMPLES = 160  # 10ms
+
+
+def load_utterances(paths: List[str]) -> List[array]:
+    """读取 16-bit WAV（每个文件一句话），转成 16kHz 单声道；没有给文件时生成合成语音"""
+    if not paths:
+        return [_synthetic_utterance(len(text.split()) * 0.3) for text in USER_UTTERANCES]
+
+    utterances = []
+    for path in paths:
+        with wave.open(path, 'rb') as f:
+            if f.getsampwidth() != 2:
+                raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+            channels, rate = f.getnchannels(), f.getframerate()
+            samples = array('h', f.readframes(f.getnframes()))
+        if channels > 1:
+            samples = samples[::channels]
+        if rate != _SAMPLE_RATE:
+            step = rate / _SAMPLE_RATE
+            samples = array('h', (samples[int(i * step)] for i in range(int(len(samples) / step))))
+        utterances.append(samples)
+    return utterances
+
+
+def _synthetic_utterance(seconds: float) -> array:
+    """带谐波、按音节节奏调幅的信号；能触发假 Deepgram 的能量判断，Silero 不一定认作语音"""
+    samples = array('h')
+    for i in range(int(seconds * _SAMPLE_RATE)):
+        t = i / _SAMPLE_RATE
+        envelope = 0.5 - 0.5 * math.cos(2 * math.pi * 4 * t)
+        tone = sum(math.sin(2 * math.pi * 140 * k * t) / k for k in range(1, 6))
+        samples.append(int(6000 * envelope * tone / 2.3))
+    return samples
+
+
+class SimulatedUser:
+    """
+    模拟的孩子：依次说出每句话，等 agent 回复播完后停顿 think_time 秒再说下一句
+
+    每轮的延迟为最后一个语音帧送出到 agent 第一帧回复音频之间的时间。给定 max_turns 时，
+    说完这么多句并等回复播完后只发送静音，finished 被置位。
+    """
+
+    def __init__(self, utterances: List[array], think_time: float = 1.0, reply_timeout: float = 20.0,
+                 max_turns: Optional[int] = None):
+        self._utterances = utterances
+        self._think_time = think_time
+        self._reply_timeout = reply_timeout
+        self._max_turns = max_turns
+        self.finished = asyncio.Event()
+        self._speech_ended_at: Optional[float] = None
+        self._replied = False
+        self._last_agent_audio = 0.0
+        self._agent_queue_end = 0.0
+        self.latencies: List[float] = []
+        self.turns = 0
+        self.timeouts = 0
+
+    def on_agent_audio(self, now: float, queue_end: float):
+        if self._speech_ended_at is not None:
+            self.latencies.append(now - self._speech_ended_at)
+            self._speech_ended_at = None
+        self._replied = True
+        self._last_agent_audio = now
+        self._agent_queue_end = queue_end
+
+    def _agent_finished(self) -> bool:
+        now = time.monotonic()
+        return self._replied and now >= self._agent_queue_end and now - self._last_agent_audio > 0.5
+
+    async def frames(self):
+        start = time.monotonic()
+        sent = 0
+        silence = array('h', bytes(_FRAME_SAMPLES * 2))
+
+        async def _emit(samples: array):
+            nonlocal sent
+            # 按绝对时间排帧，避免 sleep 误差累积
+            delay = start + sent * _FRAME_SAMPLES / _SAMPLE_RATE - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent += 1
+            return rtc.AudioFrame(samples.tobytes(), _SAMPLE_RATE, 1, _FRAME_SAMPLES)
+
+        # 先等问候语播完
+        self._replied = False
+        deadline = time.monotonic() + self._reply_timeout
+        while not self._agent_finished() and time.monotonic() < deadline:
+            yield await _emit(silence)
+
+        index = 0
+        while True:
+            utterance = self._utterances[index % len(self._utterances)]
+            index += 1
+            for offset in range(0, len(utterance) - _FRAME_SAMPLES + 1, _FRAME_SAMPLES):
+                yield await _emit(utterance[offset:offset + _FRAME_SAMPLES])
+            self._speech_ended_at = time.monotonic()
+            self._replied = False
+            self.turns += 1
+
+            # 超时只计到回复开始播放，长回复会一直播完
+            deadline = time.monotonic() + self._reply_timeout
+            while not self._agent_finished():
+                if not self._replied and time.monotonic() >= deadline:
+                    self.timeouts += 1
+                    self._speech_ended_at = None
+                    break
+                yield await _emit(silence)
+
+            think_until = time.monotonic() + self._think_time
+            while time.monotonic() < think_until:
+                yield await _emit(silence)
+
+            if self._max_turns is not None and self.turns >= self._max_turns:
+                self.finished.set()
+                while True:
+                    yield await _emit(silence)
+
+
+class FakeAudioStream:
+    """替换 rtc.AudioStream：参与者的麦克风音频来自 SimulatedUser"""
+
+    user: Optional[SimulatedUser] = None
+
+    def __init__(self, track, *args, **kwargs):
+        self._frames = FakeAudioStream.user.frames()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> rtc.AudioFrameEvent:
+        return rtc.AudioFrameEvent(frame=await self._frames.__anext__())
+
+    async def aclose(self):
+        await self._frames.aclose()
+
+
+class FakeAudioSource:
+    """替换 rtc.AudioSource：按实时节奏“播放”agent 的音频，并通知 SimulatedUser"""
+
+    user: Optional[SimulatedUser] = None
+
+    def __init__(self, sample_rate: int, num_channels: int, queue_size_ms: int = 1000, loop=None):
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self._queue_size = queue_size_ms / 1000
+        self._queue_end = 0.0
+
+    @property
+    def queued_duration(self) -> float:
+        return max(0.0, self._queue_end - time.monotonic())
+
+    async def capture_frame(self, frame: rtc.AudioFrame):
+        now = time.monotonic()
+        self._queue_end = max(self._queue_end, now) + frame.samples_per_channel / frame.sample_rate
+        if FakeAudioSource.user is not None:
+            FakeAudioSource.user.on_agent_audio(now, self._queue_end)
+        # 与原生实现一样，缓冲超过 queue_size 时阻塞
+        wait = self.queued_duration - self._queue_size
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def clear_queue(self):
+        self._queue_end = time.monotonic()
+
+    async def wait_for_playout(self):
+        await asyncio.sleep(self.queued_duration)
+
+    async def aclose(self):
+        pass
+
+
+class _FakePublication:
+    def __init__(self, track):
+        self.sid = f"TR_{id(self):x}"
+        self.source = rtc.TrackSource.SOURCE_MICROPHONE
+        self.subscribed = True
+        self.track = track
+
+    def set_subscribed(self, subscribed: bool):
+        self.subscribed = subscribed
+
+    async def wait_for_subscription(self):
+        pass
+
+
+class _FakeLocalParticipant:
+    identity = "agent"
+
+    def __init__(self):
+        self.track_publications = {}
+
+    async def publish_track(self, track, options=None):
+        publication = _FakePublication(track)
+        self.track_publications[publication.sid] = publication
+        return publication
+
+    async def set_attributes(self, attributes):
+        pass
+
+    async def publish_transcription(self, transcription):
+        pass
+
+
+class FakeRemoteParticipant(rtc.RemoteParticipant):
+    """参与者对象须是 rtc.RemoteParticipant 的实例，VoicePipelineAgent.start 会检查类型"""
+
+    def __init__(self, identity: str, metadata: str = ""):
+        self._identity = identity
+        self._metadata = metadata
+        publication = _FakePublication(SimpleNamespace(sid=f"TR_{identity}"))
+        self._track_publications = {publication.sid: publication}
+
+    @property
+    def identity(self) -> str:
+        return self._identity
+
+    @property
+    def sid(self) -> str:
+        return f"PA_{self._identity}"
+
+    @property
+    def name(self) -> str:
+        return self._identity
+
+    @property
+    def metadata(self) -> str:
+        return self._metadata
+
+    @property
+    def attributes(self):
+        return {}
+
+
+class FakeRoom(rtc.EventEmitter):
+    """没有连接 LiveKit 的房间：isconnected() 为 False，转写和属性不会发布"""
+
+    def __init__(self, name: str, participant: FakeRemoteParticipant, metadata: str = ""):
+        super().__init__()
+        self.name = name
+        self.metadata = metadata
+        self.local_participant = _FakeLocalParticipant()
+        self.remote_participants = {participant.identity: participant}
+
+    def isconnected(self) -> bool:
+        return False
+
+
+class FakeJobContext:
+    """entrypoint 用到的 JobContext 接口"""
+
+    def __init__(self, proc, room_name: str, metadata: str = ""):
+        self.proc = proc
+        self.participant = FakeRemoteParticipant(f"child-{room_name}")
+        self.room = FakeRoom(room_name, self.participant, metadata)
+        self.job = SimpleNamespace(id=f"AJ_{room_name}", metadata=metadata)
+        self.shutdown_reason: Optional[str] = None
+        self._shutdown_callbacks = []
+        self._shutdown = asyncio.Event()
+
+    async def connect(self, *args, **kwargs):
+        pass
+
+    async def wait_for_participant(self, *args, **kwargs):
+        return self.participant
+
+    def add_shutdown_callback(self, callback):
+        self._shutdown_callbacks.append(callback)
+
+    def shutdown(self, reason: str = ""):
+        if self.shutdown_reason is None:
+            self.shutdown_reason = reason
+        self._shutdown.set()
+
+    async def wait_for_shutdown(self):
+        await self._shutdown.wait()
+
+    async def run_shutdown_callbacks(self):
+        await asyncio.gather(*(callback() for callback in self._shutdown_callbacks), return_exceptions=True)
+
+
+def install_rtc_fakes(user: SimulatedUser):
+    """把 rtc 的音频输入输出替换为假实现（每个会话进程只调用一次）"""
+    FakeAudioStream.user = user
+    FakeAudioSource.user = user
+    rtc.AudioStream = FakeAudioStream
+    rtc.AudioSource = FakeAudioSource
+    rtc.LocalAudioTrack.create_audio_track = staticmethod(lambda name, source: SimpleNamespace(name=name))
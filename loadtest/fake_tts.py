@@ -0,0 +1,88 @@
+import asyncio
+from typing import Dict
+
+from livekit import rtc
+from livekit.agents import tts, utils
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions
+
+from loadtest.fake_providers import jittered
+
+_SAMPLE_RATE = 24000
+_CHARS_PER_SECOND = 15  # 语速：每秒约 15 个字符
+_CHUNK_SECONDS = 0.1
+
+
+class FakeCartesiaTTS(tts.TTS):
+    """
+    进程内的假 Cartesia
+
+    cartesia 插件的 websocket 地址写死为 api.cartesia.ai，没法指向本地服务，因此在进程内
+    替换插件的 TTS 类。流式接口与 Cartesia 一致：每次 flush 合成一段，整个流结束时才发
+    is_final；按 ttfb 和实时率控制输出节奏，音频为静音。
+    """
+
+    profile: Dict = {}
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=True),
+            sample_rate=_SAMPLE_RATE,
+            num_channels=1,
+        )
+
+    def synthesize(
+        self,
+        text: str,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.ChunkedStream:
+        return _FakeChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+    def stream(
+        self,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.SynthesizeStream:
+        return _FakeSynthesizeStream(tts=self, conn_options=conn_options)
+
+
+async def _synthesize(text: str, profile: Dict, request_id: str, send, is_final_at_end: bool):
+    """按配置的节奏生成 text 对应时长的静音帧"""
+    await asyncio.sleep(jittered(profile, 'tts_ttfb'))
+    duration = max(len(text) / _CHARS_PER_SECOND, _CHUNK_SECONDS)
+    chunks = max(1, round(duration / _CHUNK_SECONDS))
+    samples = int(_SAMPLE_RATE * _CHUNK_SECONDS)
+    for i in range(chunks):
+        frame = rtc.AudioFrame.create(_SAMPLE_RATE, 1, samples)
+        send(tts.SynthesizedAudio(
+            request_id=request_id,
+            frame=frame,
+            is_final=is_final_at_end and i == chunks - 1,
+        ))
+        await asyncio.sleep(_CHUNK_SECONDS * profile['tts_realtime_factor'])
+
+
+class _FakeChunkedStream(tts.ChunkedStream):
+    async def _run(self):
+        await _synthesize(self._input_text, FakeCartesiaTTS.profile, utils.shortuuid(),
+                          self._event_ch.send_nowait, False)
+
+
+class _FakeSynthesizeStream(tts.SynthesizeStream):
+    async def _run(self):
+        request_id = utils.shortuuid()
+        text = ""
+        async for data in self._input_ch:
+            if isinstance(data, self._FlushSentinel):
+                if text.strip():
+                    self._mark_started()
+                    await _synthesize(text, FakeCartesiaTTS.profile, request_id, self._event_ch.send_nowait, False)
+                text = ""
+            else:
+                text += data
+        # 与 Cartesia 一样，上下文结束时发送 is_final
+        self._event_ch.send_nowait(tts.SynthesizedAudio(
+            request_id=request_id,
+            frame=rtc.AudioFrame.create(_SAMPLE_RATE, 1, int(_SAMPLE_RATE * 0.01)),
+            is_final=True,
+        ))
@@ -0,0 +1,222 @@
+"""
+录音回放基准：把录好的孩子语音逐句送入完整的 VoicePipelineAgent 流水线，测量每一轮的延迟
+
+    python -m loadtest.replay --audio fixtures/*.wav --rounds 3 --baseline loadtest/replay_baseline.json
+
+与 loadtest.run 使用同样的假服务商和假房间，但只跑一个会话，并去掉所有随机性：
+服务商延迟固定为配置值，回复文本按 seed 生成，每句话播放 rounds 遍后结束。
+各阶段延迟取自 TurnTracer 的关键路径拆分（说话结束 → STT 最终结果 → 端点判定 →
+LLM 首 token → TTS 首字节 → 首帧音频），端到端延迟由模拟用户从最后一个语音帧量到
+第一帧回复音频。
+
+给定 --baseline 时与之比较，任一阶段的分位数比基线慢 threshold 以上（且超过
+min-delta 毫秒）即以退出码 1 结束；--update-baseline 把本次结果写为新的基线。
+"""
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from loadtest.run import _configure_env
+
+# 关键路径上的阶段，与 TurnTracer 根 span 的 critical_path.* 属性对应
+STAGES = ('stt_final', 'endpointing', 'llm_ttft', 'tts_ttfb', 'playout', 'total')
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _read_traces(path: str) -> Dict[str, List[float]]:
+    """读取 FileSpanExporter 写出的轮次，只统计由用户语音触发的轮次（不含问候语）"""
+    stages: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    if not os.path.exists(path):
+        return stages
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            for resource in json.loads(line)['resourceSpans']:
+                for scope in resource['scopeSpans']:
+                    for span in scope['spans']:
+                        if span['name'] != 'turn':
+                            continue
+                        attributes = {a['key']: next(iter(a['value'].values())) for a in span['attributes']}
+                        if not attributes.get('turn.user_initiated'):
+                            continue
+                        for stage in STAGES:
+                            value = attributes.get(f"critical_path.{stage}")
+                            if value is not None:
+                                stages[stage].append(max(0.0, float(value)))
+    return stages
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """精确分位数（最近秩），单位毫秒"""
+    ordered = sorted(values)
+    result: Dict[str, Optional[float]] = {'count': len(ordered)}
+    for q in QUANTILES:
+        if ordered:
+            index = max(0, math.ceil(q * len(ordered)) - 1)
+            result[f"p{round(q * 100):d}"] = round(ordered[index] * 1000, 1)
+        else:
+            result[f"p{round(q * 100):d}"] = None
+    return result
+
+
+def compare(current: Dict, baseline: Dict, threshold: float, min_delta_ms: float) -> List[str]:
+    """返回超出阈值的退化项，空列表表示通过"""
+    regressions = []
+    for stage, stats in current['stages'].items():
+        reference = baseline.get('stages', {}).get(stage)
+        if reference is None:
+            continue
+        for q in QUANTILES:
+            key = f"p{round(q * 100):d}"
+            now, before = stats.get(key), reference.get(key)
+            if now is None or before is None:
+                continue
+            if now - before > min_delta_ms and now > before * (1 + threshold):
+                regressions.append(f"{stage} {key}: {before:.1f}ms -> {now:.1f}ms (+{(now / before - 1) * 100 if before else 0:.0f}%)")
+    return regressions
+
+
+def _print_report(current: Dict, baseline: Optional[Dict]):
+    print(f"profile={current['profile']} turns={current['turns']} timeouts={current['timeouts']}")
+    print(f"{'stage':<12} {'count':>5} " + ' '.join(f"{f'p{round(q * 100):d}':>9} {'base':>9}" for q in QUANTILES))
+    for stage, stats in current['stages'].items():
+        reference = (baseline or {}).get('stages', {}).get(stage, {})
+        cells = []
+        for q in QUANTILES:
+            key = f"p{round(q * 100):d}"
+            for value in (stats.get(key), reference.get(key)):
+                cells.append(f"{'-' if value is None else f'{value:.1f}':>9}")
+        print(f"{stage:<12} {stats['count']:>5} " + ' '.join(cells))
+
+
+def run_replay(options: Dict, port: int) -> Dict:
+    """在子进程中运行一个会话，返回各阶段的延迟分位数"""
+    from loadtest.fake_providers import run_server
+    from loadtest.session import run_session
+
+    ctx = mp.get_context('spawn')
+    ready, stop = ctx.Event(), ctx.Event()
+    server = ctx.Process(target=run_server, args=('127.0.0.1', port, options['profile'], ready, stop, options['seed']),
+                         daemon=True)
+    server.start()
+    if not ready.wait(30):
+        raise RuntimeError("fake provider server did not start")
+
+    results = ctx.Queue()
+    session_options = dict(options, start_at=time.time() + options['warmup'])
+    proc = ctx.Process(target=run_session, args=(0, session_options, results), daemon=True)
+    try:
+        proc.start()
+        result = results.get(timeout=options['warmup'] + options['duration'] + 60)
+        proc.join(timeout=5)
+    finally:
+        if proc.is_alive():
+            proc.kill()
+        stop.set()
+        server.join(timeout=5)
+
+    if 'latency' not in result:
+        raise RuntimeError('; '.join(result.get('errors', [])) or "session produced no results")
+    stages = {stage: _percentiles(values) for stage, values in _read_traces(os.environ['TRACE_FILE']).items()}
+    # 端到端延迟按模拟用户听到的时间计算，包含假房间的播放
+    stages['turn'] = _percentiles(result['latencies'])
+    return {
+        'profile': options['profile'],
+        'audio': [os.path.basename(path) for path in options['audio']],
+        'rounds': options['rounds'],
+        'turns': result['turns'],
+        'timeouts': result['timeouts'],
+        'stages': stages,
+        'errors': result['errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded utterances through the pipeline and compare turn latency")
+    parser.add_argument('--audio', nargs='*', default=[], help="16-bit WAV files, one utterance each")
+    parser.add_argument('--rounds', type=int, default=3, help="times each utterance is replayed")
+    parser.add_argument('--profile', default='typical', help="provider latency profile: fast, typical or slow")
+    parser.add_argument('--agent-profile', help="agent profile to request through job metadata (see config/profiles.py)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for reply texts")
+    parser.add_argument('--think-time', type=float, default=1.0, help="pause after each agent reply (seconds)")
+    parser.add_argument('--reply-timeout', type=float, default=20.0, help="seconds to wait for a reply")
+    parser.add_argument('--warmup', type=float, default=15, help="seconds allowed for process start and prewarm")
+    parser.add_argument('--max-duration', type=float, default=600, help="upper bound on the session length (seconds)")
+    parser.add_argument('--port', type=int, default=18081, help="port of the fake provider server")
+    parser.add_argument('--log-level', default='WARNING', help="log level inside the session process")
+    parser.add_argument('--baseline', help="baseline JSON to compare against")
+    parser.add_argument('--update-baseline', action='store_true', help="write the results to --baseline instead of comparing")
+    parser.add_argument('--threshold', type=float, default=0.15, help="allowed relative slowdown per percentile")
+    parser.add_argument('--min-delta', type=float, default=25.0, help="ignore slowdowns smaller than this (ms)")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    from loadtest.fake_providers import PROFILES
+    from loadtest.fake_room import load_utterances
+    if args.profile not in PROFILES:
+        parser.error(f"unknown profile {args.profile}, choose from {', '.join(PROFILES)}")
+    if args.update_baseline and not args.baseline:
+        parser.error("--update-baseline requires --baseline")
+
+    work_dir = tempfile.mkdtemp(prefix='voice-agent-replay-')
+    _configure_env(args.port, work_dir)
+    # 每一轮都导出关键路径拆分
+    os.environ.update({
+        'TRACE_SAMPLE_RATE': '1',
+        'TRACE_EXPORTER': 'file',
+        'TRACE_FILE': os.path.join(work_dir, 'turn_traces.jsonl'),
+    })
+    options = {
+        'profile': args.profile,
+        'metadata': json.dumps({'profile': args.agent_profile}) if args.agent_profile else "",
+        'audio': args.audio,
+        'rounds': args.rounds,
+        'max_turns': len(load_utterances(args.audio)) * args.rounds,
+        'seed': args.seed,
+        'think_time': args.think_time,
+        'reply_timeout': args.reply_timeout,
+        'duration': args.max_duration,
+        'warmup': args.warmup,
+        'log_level': args.log_level.upper(),
+    }
+
+    print(f"replaying {options['max_turns']} turn(s) ...", file=sys.stderr)
+    current = run_replay(options, args.port)
+
+    baseline = None
+    if args.baseline and not args.update_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    _print_report(current, baseline)
+    for error in current['errors']:
+        print(f"! {error}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return
+
+    failed = current['timeouts'] > 0 or current['turns'] < options['max_turns']
+    if baseline is not None:
+        if (baseline.get('profile'), baseline.get('audio')) != (current['profile'], current['audio']):
+            print("! baseline was recorded with a different profile or audio set")
+        regressions = compare(current, baseline, args.threshold, args.min_delta)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+    elif args.baseline:
+        print(f"! baseline {args.baseline} not found, nothing to compare")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+多房间压测：在一台离线机器上，用本地假服务商并发运行 N 个会话，逐级提高并发
+
+    python -m loadtest.run --levels 1,2,4,8 --duration 60 --profile typical
+
+每个会话是一个独立进程（与生产环境的任务进程一致），运行真实的 agent.entrypoint、
+Silero VAD 以及 deepgram/openai 插件；LiveKit 房间和音频收发由 loadtest.fake_room 模拟，
+Deepgram、OpenAI 兼容接口和 Supabase 由 loadtest.fake_providers 模拟，Cartesia 在进程内模拟。
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+
+def _configure_env(port: int, cache_dir: str):
+    """在导入 settings 之前设置环境变量，子进程会继承"""
+    base = f"http://127.0.0.1:{port}"
+    os.environ.update({
+        'DEEPGRAM_BASE_URL': f"{base}/v1/listen",
+        'DEEPGRAM_API_KEY': 'loadtest',
+        'LLM_BASE_URL': f"{base}/v1",
+        'OPENAI_API_KEY': 'loadtest',
+        'SUPABASE_URL': base,
+        'SUPABASE_KEY': 'loadtest',
+        'LIVEKIT_API_KEY': 'loadtest',
+        'PROVIDER_POOL_DEEPGRAM_URL': base,
+        'PROVIDER_POOL_CARTESIA_URL': base,
+        'HEALTH_ENABLED': 'false',
+        'METRICS_ENABLED': 'false',
+        'TTS_CACHE_DIR': cache_dir,
+        'LOG_FILE': os.path.join(cache_dir, 'agent.log'),
+    })
+
+
+def _run_level(sessions: int, options: Dict) -> List[Dict]:
+    from loadtest.session import run_session
+
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    # 给每个进程留出导入和预热（加载 VAD）的时间，之后同时开始
+    level_options = dict(options, start_at=time.time() + options['warmup'])
+    procs = [ctx.Process(target=run_session, args=(i, level_options, results), daemon=True)
+             for i in range(sessions)]
+    for proc in procs:
+        proc.start()
+
+    collected = []
+    deadline = level_options['start_at'] + options['duration'] + 60
+    while len(collected) < sessions and time.time() < deadline:
+        try:
+            collected.append(results.get(timeout=1.0))
+        except Exception:
+            if not any(proc.is_alive() for proc in procs) and results.empty():
+                break
+    for proc in procs:
+        proc.join(timeout=5)
+        if proc.is_alive():
+            proc.kill()
+    return collected
+
+
+def _summarize(sessions: int, results: List[Dict]) -> Dict:
+    from utils.quantiles import QuantileSketch
+
+    latency, lag = QuantileSketch(), QuantileSketch()
+    turns = timeouts = 0
+    cpu = wall = 0.0
+    rss: List[float] = []
+    errors: List[str] = []
+    for result in results:
+        errors.extend(result.get('errors', []))
+        if 'latency' not in result:
+            continue
+        latency.merge_compact(result['latency'])
+        lag.merge_compact(result['loop_lag'])
+        turns += result['turns']
+        timeouts += result['timeouts']
+        cpu += result['cpu_seconds']
+        wall = max(wall, result['wall_seconds'])
+        rss.append(result['rss_mb'])
+
+    def _ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        'sessions': sessions,
+        'completed': len(rss),
+        # 一个核满负荷时能撑住的会话数：墙钟时间 / 每个会话消耗的 CPU 时间
+        'sessions_per_core': round(wall * len(rss) / cpu, 1) if cpu else None,
+        'cpu_utilization': round(cpu / wall / (os.cpu_count() or 1), 3) if wall else None,
+        'rss_mb_per_session': round(sum(rss) / len(rss), 1) if rss else None,
+        'loop_lag_ms': {'p50': _ms(lag.quantile(0.5)), 'p99': _ms(lag.quantile(0.99)),
+                        'max': _ms(lag.max if lag.count else None)},
+        'turn_latency_ms': {'p50': _ms(latency.quantile(0.5)), 'p95': _ms(latency.quantile(0.95)),
+                            'p99': _ms(latency.quantile(0.99))},
+        'turns': turns,
+        'timeouts': timeouts,
+        'errors': errors,
+    }
+
+
+def _print_table(summaries: List[Dict]):
+    header = (f"{'sessions':>8} {'per_core':>8} {'cpu%':>6} {'rss_mb':>7} "
+              f"{'lag_p50':>8} {'lag_p99':>8} {'lag_max':>8} "
+              f"{'turn_p50':>9} {'turn_p95':>9} {'turn_p99':>9} {'turns':>6} {'timeouts':>8}")
+    print(header)
+    for s in summaries:
+        lag, turn = s['loop_lag_ms'], s['turn_latency_ms']
+        cells = [s['sessions_per_core'], None if s['cpu_utilization'] is None else s['cpu_utilization'] * 100,
+                 s['rss_mb_per_session'], lag['p50'], lag['p99'], lag['max'], turn['p50'], turn['p95'], turn['p99']]
+        text = ['-' if value is None else f"{value:.1f}" for value in cells]
+        print(f"{s['sessions']:>8} {text[0]:>8} {text[1]:>6} {text[2]:>7} {text[3]:>8} {text[4]:>8} {text[5]:>8} "
+              f"{text[6]:>9} {text[7]:>9} {text[8]:>9} {s['turns']:>6} {s['timeouts']:>8}")
+        for error in s['errors'][:5]:
+            print(f"         ! {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-room load test against local provider stand-ins")
+    parser.add_argument('--levels', default='1,2,4,8', help="comma separated concurrent session counts")
+    parser.add_argument('--duration', type=float, default=60, help="seconds each level runs")
+    parser.add_argument('--warmup', type=float, default=15, help="seconds allowed for process start and prewarm")
+    parser.add_argument('--profile', default='typical', help="provider latency profile: fast, typical or slow")
+    parser.add_argument('--agent-profile', help="agent profile to request through job metadata (see config/profiles.py)")
+    parser.add_argument('--audio', nargs='*', default=[], help="16-bit WAV files, one utterance each")
+    parser.add_argument('--think-time', type=float, default=1.0, help="pause after each agent reply (seconds)")
+    parser.add_argument('--reply-timeout', type=float, default=20.0, help="seconds to wait for a reply")
+    parser.add_argument('--port', type=int, default=18080, help="port of the fake provider server")
+    parser.add_argument('--log-level', default='WARNING', help="log level inside session processes")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    from loadtest.fake_providers import PROFILES, run_server
+    if args.profile not in PROFILES:
+        parser.error(f"unknown profile {args.profile}, choose from {', '.join(PROFILES)}")
+
+    cache_dir = tempfile.mkdtemp(prefix='voice-agent-loadtest-')
+    _configure_env(args.port, cache_dir)
+    options = {
+        'profile': args.profile,
+        'metadata': json.dumps({'profile': args.agent_profile}) if args.agent_profile else "",
+        'audio': args.audio,
+        'think_time': args.think_time,
+        'reply_timeout': args.reply_timeout,
+        'duration': args.duration,
+        'warmup': args.warmup,
+        'log_level': args.log_level.upper(),
+    }
+
+    ctx = mp.get_context('spawn')
+    ready, stop = ctx.Event(), ctx.Event()
+    server = ctx.Process(target=run_server, args=('127.0.0.1', args.port, args.profile, ready, stop), daemon=True)
+    server.start()
+    if not ready.wait(30):
+        print("fake provider server did not start", file=sys.stderr)
+        sys.exit(1)
+
+    summaries = []
+    try:
+        for sessions in (int(level) for level in args.levels.split(',')):
+            print(f"running {sessions} session(s) for {args.duration:.0f}s ...", file=sys.stderr)
+            summaries.append(_summarize(sessions, _run_level(sessions, options)))
+    finally:
+        stop.set()
+        server.join(timeout=5)
+
+    print(f"profile={args.profile} cores={os.cpu_count()}")
+    _print_table(summaries)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'profile': args.profile, 'cores': os.cpu_count(), 'levels': summaries}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
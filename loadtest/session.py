@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import random
+import resource
+import time
+from typing import Dict, List
+
+from utils.quantiles import QuantileSketch
+from utils.worker_load import read_memory_mb
+
+_LAG_INTERVAL = 0.05
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def _monitor_loop_lag(sketch: QuantileSketch):
+    """每 50ms 醒来一次，实际醒来时间比预期晚多少即为事件循环延迟"""
+    while True:
+        expected = time.monotonic() + _LAG_INTERVAL
+        await asyncio.sleep(_LAG_INTERVAL)
+        sketch.add(max(0.0, time.monotonic() - expected))
+
+
+async def _run(index: int, options: Dict) -> Dict:
+    from livekit.agents import JobProcess
+    from livekit.agents.utils import http_context
+
+    import agent
+    from loadtest.fake_providers import PROFILES, deterministic
+    from loadtest.fake_room import FakeJobContext, SimulatedUser, install_rtc_fakes, load_utterances
+    from loadtest.fake_tts import FakeCartesiaTTS
+
+    proc = JobProcess()
+    agent.prewarm(proc)
+
+    # cartesia 插件的地址写死，换成进程内的假实现
+    from livekit.plugins import cartesia
+    FakeCartesiaTTS.profile = PROFILES[options['profile']]
+    if options.get('seed') is not None:
+        random.seed(options['seed'] + index)
+        FakeCartesiaTTS.profile = deterministic(FakeCartesiaTTS.profile)
+    cartesia.TTS = FakeCartesiaTTS
+
+    user = SimulatedUser(load_utterances(options['audio']), options['think_time'], options['reply_timeout'],
+                         max_turns=options.get('max_turns'))
+    install_rtc_fakes(user)
+    ctx = FakeJobContext(proc, f"loadtest-{index}", options['metadata'])
+    http_context._new_session_ctx()
+
+    # 所有会话在同一时刻开始，预热耗时不计入测量
+    await asyncio.sleep(max(0.0, options['start_at'] - time.time()))
+    cpu_start, wall_start = _cpu_seconds(), time.monotonic()
+
+    lag = QuantileSketch()
+    monitor = asyncio.create_task(_monitor_loop_lag(lag))
+    errors: List[str] = []
+    entry = asyncio.create_task(agent.entrypoint(ctx))
+    shutdown = asyncio.create_task(ctx.wait_for_shutdown())
+    finished = asyncio.create_task(user.finished.wait())
+    # 给定 max_turns 时说完即结束，duration 为上限
+    await asyncio.wait([shutdown, finished], timeout=options['duration'], return_when=asyncio.FIRST_COMPLETED)
+    if shutdown.done():
+        errors.append(f"session shut down early: {ctx.shutdown_reason}")
+    else:
+        ctx.shutdown(reason="load test finished")
+    for task in (shutdown, finished):
+        task.cancel()
+
+    if entry.done() and entry.exception() is not None:
+        errors.append(f"entrypoint failed: {entry.exception()}")
+    entry.cancel()
+    await ctx.run_shutdown_callbacks()
+    monitor.cancel()
+    await http_context._close_http_ctx()
+
+    latency = QuantileSketch()
+    for seconds in user.latencies:
+        latency.add(seconds)
+    return {
+        'index': index,
+        'turns': user.turns,
+        'timeouts': user.timeouts,
+        'latency': latency.to_compact(),
+        'latencies': list(user.latencies),
+        'loop_lag': lag.to_compact(),
+        'cpu_seconds': _cpu_seconds() - cpu_start,
+        'wall_seconds': time.monotonic() - wall_start,
+        'errors': errors,
+        **read_memory_mb(),
+    }
+
+
+def run_session(index: int, options: Dict, results):
+    """
+    在独立进程中运行一个会话（与生产环境一样，一个任务进程服务一个房间）
+
+    options 须可 pickle；结果以 dict 放入 results 队列。
+    """
+    logging.basicConfig(level=options['log_level'], format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        result = asyncio.run(_run(index, options))
+    except Exception as e:
+        result = {'index': index, 'errors': [f"session crashed: {str(e)}"]}
+    results.put(result)
@@ -0,0 +1,197 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+from livekit.agents import llm
+from livekit.agents.pipeline.pipeline_agent import _DeferredReplyValidation
+
+from config.settings import settings
+from utils.logger import logger
+
+# 预热推理用的对话，内容无关紧要
+_WARMUP_CTX = [("assistant", "Hey, what's your name"), ("user", "My name is")]
+
+
+class AdaptiveTurnDetector:
+    """
+    按 turn-detector 模型给出的说完概率调整端点等待时间
+
+    VoicePipelineAgent 在 VAD 判定静音且拿到最终转写后调用 predict_end_of_turn。
+    概率不低于 likely 时等待 min_delay，不高于 unlikely 时等待 max_delay，之间线性插值。
+    等待从 VAD 判定的说话结束（attach 后由 user_stopped_speaking 记录）算起，在这里完成，
+    返回后 agent 不再额外等待（agent 的 min_endpointing_delay 须设为 min_delay，
+    unlikely_threshold 返回 0 以免被替换成 max_endpointing_delay）。等待期间用户接着
+    说话时任务被取消，这句话不会被截断。
+
+    模型不支持当前语言、推理超时或出错时按固定模式的等待处理：fixed_delay，转写以标点
+    结尾时乘以 agent 的缩短系数。每轮从说话结束到判定的时间，以及相比固定模式节省的
+    时间（负数为延长）交给 on_turn。
+    """
+
+    def __init__(self,
+                 model,
+                 fixed_delay: float,
+                 min_delay: float = 0.2,
+                 max_delay: float = 2.0,
+                 likely: float = 0.8,
+                 unlikely: float = 0.15,
+                 timeout: float = 1.0,
+                 on_turn: Optional[Callable[[float, float], None]] = None):
+        self._model = model
+        self._fixed_delay = fixed_delay
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._likely = likely
+        self._unlikely = unlikely
+        self._timeout = timeout
+        self._on_turn = on_turn
+        self._language_supported = False
+        self._speaking = False
+        self._end_of_speech: Optional[float] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+
+        # 统计
+        self.turns = 0
+        self.fallbacks = 0
+        self.resumed = 0  # 等待期间用户继续说话的次数
+        self.extended = 0  # 比固定模式等得更久的轮次
+        self.delays: List[float] = []
+        self.latency_won = 0.0
+        self.inference_seconds = 0.0
+
+    def attach(self, agent):
+        """用 agent 的 VAD 事件记录说话结束时间（与 agent 内部的端点判定同一时刻）"""
+        agent.on("user_started_speaking", self._on_user_started_speaking)
+        agent.on("user_stopped_speaking", self._on_user_stopped_speaking)
+
+    def _on_user_started_speaking(self):
+        self._speaking = True
+
+    def _on_user_stopped_speaking(self):
+        self._speaking = False
+        self._end_of_speech = time.perf_counter()
+
+    def _fixed_wait(self, chat_ctx: llm.ChatContext) -> float:
+        """固定模式下 agent 在说话结束后等待的时间"""
+        text = chat_ctx.messages[-1].content if chat_ctx.messages else ""
+        if isinstance(text, str) and text.strip() and text.strip()[-1] in _DeferredReplyValidation.PUNCTUATION:
+            return self._fixed_delay * _DeferredReplyValidation.PUNCTUATION_REDUCE_FACTOR
+        return self._fixed_delay
+
+    def unlikely_threshold(self) -> float:
+        return 0.0
+
+    def supports_language(self, language: Optional[str]) -> bool:
+        # 不支持的语言也由这里按固定等待处理，否则 agent 会直接使用 min_delay
+        self._language_supported = self._model.supports_language(language)
+        return True
+
+    def delay_for(self, probability: float) -> float:
+        if probability >= self._likely:
+            return self._min_delay
+        if probability <= self._unlikely:
+            return self._max_delay
+        ratio = (probability - self._unlikely) / (self._likely - self._unlikely)
+        return self._max_delay - ratio * (self._max_delay - self._min_delay)
+
+    async def predict_end_of_turn(self, chat_ctx: llm.ChatContext) -> float:
+        start = time.perf_counter()
+        end_of_speech = self._end_of_speech if self._end_of_speech is not None else start
+        fixed_wait = self._fixed_wait(chat_ctx)
+        probability = None
+        if self._language_supported:
+            try:
+                probability = await self._model.predict_end_of_turn(chat_ctx, timeout=self._timeout)
+                self.inference_seconds += time.perf_counter() - start
+            except Exception as e:
+                # 出错时 agent 不会再验证这一轮，必须在这里兜底
+                logger.error(f"Error predicting end of turn: {str(e)}")
+        if probability is None:
+            self.fallbacks += 1
+            delay = fixed_wait
+        else:
+            delay = self.delay_for(probability)
+
+        try:
+            await asyncio.sleep(max(0.0, delay - (time.perf_counter() - end_of_speech)))
+        except asyncio.CancelledError:
+            # agent 收到新的最终转写时也会取消并重新判定，只统计用户接着说话的情况
+            if self._speaking:
+                self.resumed += 1
+            raise
+
+        # 转写晚于等待时间才到达时，两种模式都在收到转写后立即判定
+        waited = max(delay, time.perf_counter() - end_of_speech)
+        won = max(fixed_wait, start - end_of_speech) - waited
+        self.turns += 1
+        self.delays.append(waited)
+        self.latency_won += won
+        if won < 0:
+            self.extended += 1
+        if probability is not None:
+            logger.info(f"End of turn probability {probability:.2f}, waited {waited:.2f}s ({won:+.2f}s vs fixed)")
+        if self._on_turn is not None:
+            self._on_turn(waited, won)
+        return 1.0 if probability is None else probability
+
+    def warmup(self):
+        """会话开始时先跑一次推理，第一轮不承担推理进程的冷启动（分词器、ONNX 首次运行）"""
+        ctx = llm.ChatContext()
+        for role, text in _WARMUP_CTX:
+            ctx.append(text=text, role=role)
+
+        async def _warmup():
+            start = time.perf_counter()
+            try:
+                await self._model.predict_end_of_turn(ctx, timeout=10)
+                logger.debug(f"Turn detector warmed up in {time.perf_counter() - start:.3f}s")
+            except Exception as e:
+                logger.error(f"Error warming up turn detector: {str(e)}")
+
+        self._warmup_task = asyncio.create_task(_warmup())
+
+    def stats(self) -> Dict:
+        return {
+            'turns': self.turns,
+            'fallbacks': self.fallbacks,
+            'resumed': self.resumed,
+            'mean_delay': sum(self.delays) / len(self.delays) if self.delays else 0.0,
+            'latency_won': self.latency_won,
+            'extended_turns': self.extended,
+            'inference_seconds': self.inference_seconds,
+        }
+
+
+def load_turn_detector_plugin():
+    """
+    导入 turn-detector 插件：导入时登记推理任务和需要下载的模型文件
+
+    主 worker 进程在 cli.run_app 之前导入，worker 启动时在推理进程中加载模型；
+    插件须在主线程导入。
+    """
+    from livekit.plugins import turn_detector
+    return turn_detector
+
+
+def create_turn_detector(ctx, profile, on_turn=None) -> Optional[AdaptiveTurnDetector]:
+    """adaptive 模式下为会话创建端点判定器并预热推理；模型在主 worker 的推理进程中运行"""
+    config = settings.ENDPOINTING_CONFIG
+    if config["MODE"] != "adaptive":
+        return None
+    try:
+        detector = AdaptiveTurnDetector(
+            load_turn_detector_plugin().EOUModel(inference_executor=ctx.inference_executor),
+            fixed_delay=profile.min_endpointing_delay,
+            min_delay=config["MIN_DELAY"],
+            max_delay=config["MAX_DELAY"],
+            likely=config["LIKELY"],
+            unlikely=config["UNLIKELY"],
+            timeout=config["TIMEOUT"],
+            on_turn=on_turn,
+        )
+        detector.warmup()
+        return detector
+    except Exception as e:
+        # 推理进程不可用时使用固定等待
+        logger.error(f"Error creating turn detector: {str(e)}")
+        return None
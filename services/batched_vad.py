@@ -0,0 +1,353 @@
+import os
+import socket
+import struct
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from livekit.plugins import silero
+from livekit.plugins.silero import onnx_model
+from livekit.plugins.silero.vad import VADStream
+
+from config.settings import settings
+from utils.logger import logger
+
+_FLOAT = np.dtype(np.float32)
+
+
+def _window_sizes(sample_rate: int):
+    """(窗口采样数, 上下文采样数)，与 onnx_model.OnnxModel 一致"""
+    if sample_rate not in onnx_model.SUPPORTED_SAMPLE_RATES:
+        raise ValueError("Silero VAD only supports 8KHz and 16KHz sample rates")
+    return (256, 32) if sample_rate == 8000 else (512, 64)
+
+
+class _Slot:
+    __slots__ = ('data', 'arrived', 'done', 'result', 'error')
+
+    def __init__(self, data: np.ndarray):
+        self.data = data
+        self.arrived = time.perf_counter()
+        self.done = threading.Event()
+        self.result = 0.0
+        self.error: Optional[BaseException] = None
+
+
+class VADBatcher:
+    """
+    Silero VAD 微批调度器
+
+    各流在自己的推理线程里调用 infer()（阻塞），调度线程把同一时刻的请求合成一批做一次
+    向量化推理：已注册的流都提交了、凑满 max_batch，或最早的请求等了 max_delay 秒，即发车。
+    ONNX 单次调用的固定开销占 VAD 成本的大头，合批后每个窗口的开销约为单独推理的一半以下。
+
+    与 OnnxModel 保持一致：OnnxModel 把新的 RNN 状态写到了 self._state 而不是 self._rnn_state，
+    每次推理实际输入的都是全零状态，只有 64 个采样的上下文会延续。这里同样每批都输入全零状态，
+    各流的概率与原路径逐位相同，语音判断也就完全一致。
+    """
+
+    def __init__(self,
+                 session,
+                 sample_rate: int = 16000,
+                 max_delay: float = 0.005,
+                 max_batch: int = 64):
+        self._session = session
+        self._sample_rate_nd = np.array(sample_rate, dtype=np.int64)
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._cond = threading.Condition()
+        self._pending: List[_Slot] = []
+        self._clients = 0
+        self._states: Dict[int, np.ndarray] = {}
+        self._thread = threading.Thread(target=self._run, name="vad_batcher", daemon=True)
+        self._thread.start()
+
+        # 统计
+        self.batches = 0
+        self.windows = 0
+        self.wait_seconds = 0.0
+        self.inference_seconds = 0.0
+
+    def register(self):
+        with self._cond:
+            self._clients += 1
+
+    def unregister(self):
+        with self._cond:
+            self._clients = max(self._clients - 1, 0)
+            self._cond.notify()
+
+    def infer(self, data: np.ndarray) -> float:
+        """data 为 [上下文 | 窗口] 的 float32 数组，返回语音概率"""
+        slot = _Slot(data)
+        with self._cond:
+            self._pending.append(slot)
+            self._cond.notify()
+        slot.done.wait()
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    def _ready(self) -> bool:
+        return len(self._pending) >= min(max(self._clients, 1), self.max_batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0].arrived + self.max_delay
+                while not self._ready():
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+            waited = time.perf_counter() - batch[0].arrived
+
+            start = time.perf_counter()
+            try:
+                results = self._infer_batch(np.stack([slot.data for slot in batch]))
+                for slot, result in zip(batch, results):
+                    slot.result = float(result)
+            except Exception as e:
+                for slot in batch:
+                    slot.error = e
+            self.inference_seconds += time.perf_counter() - start
+            self.wait_seconds += waited
+            self.batches += 1
+            self.windows += len(batch)
+            for slot in batch:
+                slot.done.set()
+
+    def _infer_batch(self, inputs: np.ndarray) -> np.ndarray:
+        size = len(inputs)
+        state = self._states.get(size)
+        if state is None:
+            state = self._states[size] = np.zeros((2, size, 128), dtype=np.float32)
+        out, _ = self._session.run(None, {'input': inputs, 'state': state, 'sr': self._sample_rate_nd})
+        return out[:, 0]
+
+    def stats(self) -> Dict:
+        return {
+            'batches': self.batches,
+            'windows': self.windows,
+            'avg_batch': round(self.windows / self.batches, 2) if self.batches else 0,
+            'avg_wait_ms': round(self.wait_seconds / self.batches * 1000, 2) if self.batches else 0,
+            'avg_inference_us_per_window': round(self.inference_seconds / self.windows * 1e6, 1) if self.windows else 0,
+        }
+
+
+class _RemoteBackend:
+    """
+    通过主进程的 VADInferenceServer 推理（每个流一个连接，调用在流自己的推理线程里串行）
+
+    连接失败或中断时改用本进程的 fallback，不影响会话。
+    """
+
+    def __init__(self, socket_path: str, sample_rate: int, fallback: Callable[[np.ndarray], float]):
+        self._socket_path = socket_path
+        self._sample_rate = sample_rate
+        self._fallback = fallback
+        self._sock: Optional[socket.socket] = None
+        self._failed = False
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(1.0)
+        sock.connect(self._socket_path)
+        sock.sendall(struct.pack('<i', self._sample_rate))
+        return sock
+
+    def __call__(self, data: np.ndarray) -> float:
+        if self._failed:
+            return self._fallback(data)
+        try:
+            if self._sock is None:
+                self._sock = self._connect()
+            self._sock.sendall(data.tobytes())
+            reply = _recv_exact(self._sock, 4)
+            return struct.unpack('<f', reply)[0]
+        except OSError as e:
+            logger.warning(f"VAD inference server unavailable, using local inference: {str(e)}")
+            self.close()
+            self._failed = True
+            return self._fallback(data)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data.extend(chunk)
+    return bytes(data)
+
+
+class _BatchedOnnxModel:
+    """
+    替代 onnx_model.OnnxModel 的每流模型：自己维护上下文，推理交给 backend
+
+    VADStream 只用到 window_size_samples、sample_rate 和 __call__，其余逻辑（平滑、阈值、
+    缓冲）保持不变。
+    """
+
+    def __init__(self, sample_rate: int, backend: Callable[[np.ndarray], float]):
+        self._sample_rate = sample_rate
+        self._window_size_samples, self._context_size = _window_sizes(sample_rate)
+        self._backend = backend
+        self._input_buffer = np.zeros(self._context_size + self._window_size_samples, dtype=np.float32)
+
+    @property
+    def sample_rate(self) -> int:
+        return self._sample_rate
+
+    @property
+    def window_size_samples(self) -> int:
+        return self._window_size_samples
+
+    @property
+    def context_size(self) -> int:
+        return self._context_size
+
+    def __call__(self, x: np.ndarray) -> float:
+        # 与 OnnxModel 相同：上一次输入的最后 context_size 个采样作为本次的上下文
+        self._input_buffer[:self._context_size] = self._input_buffer[-self._context_size:]
+        self._input_buffer[self._context_size:] = x
+        return self._backend(self._input_buffer.copy())
+
+
+class BatchedVAD(silero.VAD):
+    """
+    推理合批的 Silero VAD，用法与 silero.VAD 相同（由 load() 创建）
+
+    默认在本进程内合批；configure(socket_path=...) 后改为发给主进程的推理服务，
+    与其他任务进程的流一起合批，服务不可用时退回本进程推理。
+    """
+
+    def __init__(self, *, session, opts):
+        super().__init__(session=session, opts=opts)
+        self._socket_path: Optional[str] = None
+        self.batcher = VADBatcher(session, opts.sample_rate)
+
+    def configure(self, *, max_delay: float, max_batch: int, socket_path: Optional[str] = None):
+        self.batcher.max_delay = max_delay
+        self.batcher.max_batch = max_batch
+        self._socket_path = socket_path
+
+    def stream(self) -> VADStream:
+        sample_rate = self._opts.sample_rate
+        if self._socket_path:
+            backend = _RemoteBackend(self._socket_path, sample_rate, self.batcher.infer)
+            model = _BatchedOnnxModel(sample_rate, backend)
+            weakref.finalize(model, backend.close)
+        else:
+            self.batcher.register()
+            model = _BatchedOnnxModel(sample_rate, self.batcher.infer)
+            weakref.finalize(model, self.batcher.unregister)
+        stream = VADStream(self, self._opts, model)
+        self._streams.add(stream)
+        return stream
+
+
+class VADInferenceServer:
+    """
+    主 worker 进程内的 VAD 推理服务
+
+    任务进程的每个流建立一个 Unix 连接：先发送 int32 采样率，之后每次发送一个
+    [上下文 | 窗口] 的 float32 数组，收到一个 float32 概率。每个连接一个线程，
+    所有连接的请求进入同一个 VADBatcher 合批。
+    """
+
+    def __init__(self, socket_path: str, max_delay: float, max_batch: int):
+        self._socket_path = socket_path
+        self._max_delay = max_delay
+        self._max_batch = max_batch
+        self._session = onnx_model.new_inference_session(True)
+        self._batchers: Dict[int, VADBatcher] = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(socket_path)
+        self._sock.listen(128)
+
+    def _batcher(self, sample_rate: int) -> VADBatcher:
+        with self._lock:
+            batcher = self._batchers.get(sample_rate)
+            if batcher is None:
+                batcher = self._batchers[sample_rate] = VADBatcher(
+                    self._session, sample_rate, self._max_delay, self._max_batch
+                )
+            return batcher
+
+    def start(self):
+        threading.Thread(target=self._accept, name="vad_server_accept", daemon=True).start()
+        logger.info(f"VAD inference server listening on {self._socket_path}")
+
+    def _accept(self):
+        while True:
+            conn, _ = self._sock.accept()
+            threading.Thread(target=self._serve, args=(conn,), name="vad_server_conn", daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        batcher = None
+        try:
+            sample_rate = struct.unpack('<i', _recv_exact(conn, 4))[0]
+            window, context = _window_sizes(sample_rate)
+            size = (window + context) * _FLOAT.itemsize
+            batcher = self._batcher(sample_rate)
+            batcher.register()
+            while True:
+                data = np.frombuffer(_recv_exact(conn, size), dtype=np.float32)
+                conn.sendall(struct.pack('<f', batcher.infer(data)))
+        except (ConnectionError, OSError):
+            pass
+        except Exception as e:
+            logger.error(f"Error serving VAD inference: {str(e)}")
+        finally:
+            if batcher is not None:
+                batcher.unregister()
+            conn.close()
+
+    def stats(self) -> Dict:
+        return {rate: batcher.stats() for rate, batcher in self._batchers.items()}
+
+
+def load_vad() -> silero.VAD:
+    """按 VAD_CONFIG 的 MODE 加载 VAD：local 为原始实现，batched 进程内合批，server 交给主进程合批"""
+    config = settings.VAD_CONFIG
+    if config["MODE"] == "local":
+        return silero.VAD.load()
+    vad = BatchedVAD.load()
+    vad.configure(
+        max_delay=config["MAX_DELAY_MS"] / 1000,
+        max_batch=config["MAX_BATCH"],
+        socket_path=config["SOCKET_PATH"] if config["MODE"] == "server" else None,
+    )
+    return vad
+
+
+def start_vad_server() -> Optional[VADInferenceServer]:
+    """MODE 为 server 时在主 worker 进程中启动推理服务（须在 cli.run_app 之前调用）"""
+    config = settings.VAD_CONFIG
+    if config["MODE"] != "server":
+        return None
+    try:
+        server = VADInferenceServer(config["SOCKET_PATH"], config["MAX_DELAY_MS"] / 1000, config["MAX_BATCH"])
+        server.start()
+        return server
+    except Exception as e:
+        # 任务进程连不上时各自在本地推理
+        logger.error(f"Error starting VAD inference server: {str(e)}")
+        return None
@@ -0,0 +1,184 @@
+import asyncio
+import contextvars
+from typing import Dict, List, Optional, Set
+
+from livekit.agents import llm
+
+from config.settings import settings
+from utils.logger import logger
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a story being created with a child. "
+    "Merge the previous summary and the new dialogue into one concise summary. "
+    "Keep character names, the child's choices, the current chapter and any open questions. "
+    "Reply with the summary only."
+)
+
+SUMMARY_PREFIX = "Summary of the story so far:\n"
+
+
+def estimate_tokens(message: llm.ChatMessage) -> int:
+    """粗略估算消息 token 数（英文约 4 字符一个 token，另加每条消息的格式开销）"""
+    content = message.content
+    if isinstance(content, list):
+        text = ''.join(part for part in content if isinstance(part, str))
+    else:
+        text = content or ''
+    return len(text) // 4 + 4
+
+
+class ContextBudget:
+    """
+    按 token 预算裁剪发给 LLM 的对话上下文
+
+    开头的 system 消息（SYSTEM_PROMPT）原样保留在最前面，保证前缀字节不变，
+    服务端的 prompt 缓存可以命中。超过 summary_trigger 后在后台把较早的对话压缩进
+    滚动摘要，摘要以一条 system 消息紧跟在系统提示之后；摘要尚未完成而上下文已超过
+    硬上限时，先丢弃最早的对话，等摘要完成后再补上。
+
+    只修改每次请求用的副本，agent 自身的 chat_ctx 保持完整。
+    """
+
+    def __init__(self,
+                 summary_llm: llm.LLM,
+                 max_tokens: int,
+                 summary_trigger: float = 0.75,
+                 keep_recent_messages: int = 6):
+        self._llm = summary_llm
+        self._max_tokens = max_tokens
+        self._trigger_tokens = int(max_tokens * summary_trigger)
+        self._keep_recent = keep_recent_messages
+
+        self._token_counts: Dict[str, int] = {}  # message.id → token 数
+        self._summary: Optional[llm.ChatMessage] = None
+        self._summarized_ids: Set[str] = set()
+        self._summary_task: Optional[asyncio.Task] = None
+
+        # 统计
+        self.requests = 0
+        self.prompt_tokens_before = 0
+        self.prompt_tokens_after = 0
+        self.dropped_messages = 0
+        self.summaries = 0
+        self.summary_prompt_tokens = 0
+        self.summary_completion_tokens = 0
+
+    def _tokens(self, message: llm.ChatMessage) -> int:
+        count = self._token_counts.get(message.id)
+        if count is None:
+            count = self._token_counts[message.id] = estimate_tokens(message)
+        return count
+
+    def prepare(self, chat_ctx: llm.ChatContext) -> llm.ChatContext:
+        """返回裁剪后的上下文，必要时触发后台摘要"""
+        return self._trim(chat_ctx, record=True)
+
+    def preview(self, chat_ctx: llm.ChatContext) -> llm.ChatContext:
+        """与 prepare 同样裁剪，但不计入统计、不触发摘要（供可能被丢弃的投机请求使用）"""
+        return self._trim(chat_ctx, record=False)
+
+    def _trim(self, chat_ctx: llm.ChatContext, record: bool) -> llm.ChatContext:
+        messages = chat_ctx.messages
+        prefix_len = 0
+        while prefix_len < len(messages) and messages[prefix_len].role == "system":
+            prefix_len += 1
+        prefix = messages[:prefix_len]
+        history = [m for m in messages[prefix_len:] if m.id not in self._summarized_ids]
+
+        before = sum(self._tokens(m) for m in messages)
+        fixed = prefix + ([self._summary] if self._summary is not None else [])
+        fixed_tokens = sum(self._tokens(m) for m in fixed)
+        history_tokens = sum(self._tokens(m) for m in history)
+
+        if record and fixed_tokens + history_tokens > self._trigger_tokens:
+            self._schedule_summary(history)
+
+        # 硬上限：丢弃最早的对话，至少保留最后一条
+        dropped = 0
+        while len(history) > 1 and fixed_tokens + history_tokens > self._max_tokens:
+            history_tokens -= self._tokens(history.pop(0))
+            dropped += 1
+        # 不能以工具结果开头，否则缺少对应的 tool_calls
+        while len(history) > 1 and history[0].role == "tool":
+            history_tokens -= self._tokens(history.pop(0))
+            dropped += 1
+
+        if record:
+            self.requests += 1
+            self.dropped_messages += dropped
+            self.prompt_tokens_before += before
+            self.prompt_tokens_after += fixed_tokens + history_tokens
+
+        trimmed = llm.ChatContext(messages=fixed + history)
+        trimmed._metadata = chat_ctx._metadata
+        return trimmed
+
+    def _schedule_summary(self, history: List[llm.ChatMessage]):
+        if self._summary_task is not None and not self._summary_task.done():
+            return
+        candidates = history[:-self._keep_recent] if self._keep_recent else history
+        # 从 assistant 回复处截断，避免把一问一答拆开
+        while candidates and candidates[-1].role != "assistant":
+            candidates = candidates[:-1]
+        if not candidates:
+            return
+        # 在空的 contextvars 上下文中创建任务，摘要请求的指标不会被当作当前轮次的回复
+        self._summary_task = contextvars.Context().run(
+            asyncio.create_task, self._summarize(candidates), name="context_summary"
+        )
+
+    async def _summarize(self, messages: List[llm.ChatMessage]):
+        lines = []
+        if self._summary is not None:
+            lines.append(self._summary.content)
+        for message in messages:
+            if isinstance(message.content, str) and message.content and message.role in ("user", "assistant"):
+                lines.append(f"{message.role}: {message.content}")
+
+        ctx = llm.ChatContext().append(role="system", text=SUMMARY_PROMPT)
+        ctx.append(role="user", text='\n'.join(lines))
+        try:
+            parts = []
+            stream = self._llm.chat(chat_ctx=ctx)
+            async with stream:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                    if chunk.usage is not None:
+                        self.summary_prompt_tokens += chunk.usage.prompt_tokens
+                        self.summary_completion_tokens += chunk.usage.completion_tokens
+        except Exception as e:
+            logger.error(f"Error summarising chat context: {str(e)}")
+            return
+
+        text = ''.join(parts).strip()
+        if not text:
+            return
+        self._summary = llm.ChatMessage.create(text=SUMMARY_PREFIX + text, role="system")
+        self._summarized_ids.update(m.id for m in messages)
+        for message in messages:
+            self._token_counts.pop(message.id, None)
+        self.summaries += 1
+        logger.debug(f"Summarised {len(messages)} messages into {self._tokens(self._summary)} tokens")
+
+    @property
+    def summary_cost(self) -> float:
+        return (
+            self.summary_prompt_tokens * settings.PRICE_CONFIG["LLM"]["INPUT_PRICE"]
+            + self.summary_completion_tokens * settings.PRICE_CONFIG["LLM"]["OUTPUT_PRICE"]
+        )
+
+    async def aclose(self):
+        if self._summary_task is not None and not self._summary_task.done():
+            self._summary_task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'prompt_tokens_before': self.prompt_tokens_before,
+            'prompt_tokens_after': self.prompt_tokens_after,
+            'prompt_tokens_saved': self.prompt_tokens_before - self.prompt_tokens_after,
+            'dropped_messages': self.dropped_messages,
+            'summaries': self.summaries,
+            'summary_tokens': self.summary_prompt_tokens + self.summary_completion_tokens,
+        }
@@ -0,0 +1,240 @@
+import asyncio
+import socket
+import ssl
+import time
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+import aiohttp
+import httpx
+import openai
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+
+from utils.logger import logger
+
+
+def _create_ssl_context() -> ssl.SSLContext:
+    """加载 CA 证书较慢（几十毫秒），在预热时做一次，所有连接共用"""
+    try:
+        import certifi
+        return ssl.create_default_context(cafile=certifi.where())
+    except ImportError:
+        return ssl.create_default_context()
+
+
+class _PrewarmedResolver(AbstractResolver):
+    """优先使用预热时解析好的地址，过期或没有记录时走默认解析"""
+
+    def __init__(self, addresses: Dict[str, List[Dict]], resolved_at: float, ttl: float):
+        self._addresses = addresses
+        self._expires_at = resolved_at + ttl
+        self._fallback = DefaultResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET):
+        entries = self._addresses.get(host)
+        if entries and time.monotonic() < self._expires_at:
+            return [
+                {**entry, 'port': port}
+                for entry in entries
+                if family == socket.AF_UNSPEC or entry['family'] == family
+            ] or await self._fallback.resolve(host, port, family)
+        return await self._fallback.resolve(host, port, family)
+
+    async def close(self):
+        await self._fallback.close()
+
+
+class ProviderPool:
+    """
+    每个任务进程一份的服务商连接池（Deepgram、Cartesia、OpenAI 兼容接口）
+
+    prewarm 阶段还没有事件循环，只能做同步部分：创建 SSL 上下文、解析各服务商域名。
+    任务开始时 start() 在任务的事件循环上创建共享的 aiohttp 会话和 httpx 客户端，
+    并在连接房间、等待孩子加入的同时完成 TCP/TLS 握手，连接以 keep-alive 保留在池中，
+    随后 Deepgram/Cartesia 的 websocket 和 LLM 请求直接复用。
+
+    后台每 refresh_interval 秒对空闲的服务商做一次健康检查，赶在服务端关闭空闲连接
+    之前刷新；Cartesia 每次回复都会把一条连接升级为 websocket 带走，升级后立即补一条。
+    """
+
+    def __init__(self,
+                 llm_base_url: str,
+                 deepgram_url: str,
+                 cartesia_url: str,
+                 refresh_interval: float = 30.0,
+                 keepalive: float = 90.0,
+                 dns_ttl: float = 300.0):
+        self._targets = {
+            'deepgram': deepgram_url.rstrip('/'),
+            'cartesia': cartesia_url.rstrip('/'),
+            'llm': llm_base_url.rstrip('/'),
+        }
+        self._hosts = {name: urlparse(url).hostname for name, url in self._targets.items()}
+        self._refresh_interval = refresh_interval
+        self._keepalive = keepalive
+        self._dns_ttl = dns_ttl
+
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        self._addresses: Dict[str, List[Dict]] = {}
+        self._resolved_at = 0.0
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._last_activity: Dict[str, float] = {}
+        self._warming: Set[str] = set()
+
+        # 统计
+        self.prepare_time = 0.0
+        self.warm_times: Dict[str, float] = {}
+        self.warm_up: Dict[str, bool] = {name: False for name in self._targets}
+        self.refreshes = 0
+        self.failures = 0
+
+    def prepare(self):
+        """同步预热（prewarm 中调用）：SSL 上下文和 DNS"""
+        start = time.perf_counter()
+        self._ssl_context = _create_ssl_context()
+        for host in set(self._hosts.values()):
+            try:
+                infos = socket.getaddrinfo(host, 443, type=socket.SOCK_STREAM)
+            except OSError as e:
+                logger.error(f"Error resolving {host}: {str(e)}")
+                continue
+            self._addresses[host] = [
+                {'hostname': host, 'host': sockaddr[0], 'port': 443,
+                 'family': family, 'proto': proto, 'flags': socket.AI_NUMERICHOST}
+                for family, _, proto, _, sockaddr in infos
+            ]
+        self._resolved_at = time.monotonic()
+        self.prepare_time = time.perf_counter() - start
+        logger.info(f"Provider pool prepared in {self.prepare_time * 1000:.0f}ms ({len(self._addresses)} hosts resolved)")
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    def start(self):
+        """在任务的事件循环上创建客户端并开始建连（entrypoint 开头调用）"""
+        if self._session is not None:
+            return
+        if self._ssl_context is None:
+            self._ssl_context = _create_ssl_context()
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_aiohttp_request)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                ssl=self._ssl_context,
+                resolver=_PrewarmedResolver(self._addresses, self._resolved_at, self._dns_ttl),
+                keepalive_timeout=self._keepalive,
+                ttl_dns_cache=int(self._dns_ttl),
+            ),
+            trace_configs=[trace_config],
+        )
+        self._http_client = httpx.AsyncClient(
+            verify=self._ssl_context,
+            timeout=httpx.Timeout(connect=15.0, read=5.0, write=5.0, pool=5.0),
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=50, keepalive_expiry=self._keepalive),
+            event_hooks={'request': [self._on_httpx_request]},
+        )
+
+        for name in self._targets:
+            self._spawn(self._warm(name))
+        self._spawn(self._refresh_loop())
+
+    def http_session(self) -> aiohttp.ClientSession:
+        """Deepgram、Cartesia 插件共用的会话"""
+        self.start()
+        return self._session
+
+    def llm_client(self, api_key: Optional[str] = None) -> openai.AsyncClient:
+        """共用预热连接的 OpenAI 兼容客户端"""
+        self.start()
+        return openai.AsyncClient(
+            api_key=api_key,
+            base_url=self._targets['llm'],
+            max_retries=0,
+            http_client=self._http_client,
+        )
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro, name="provider_pool")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _name_for_host(self, host: Optional[str]) -> Optional[str]:
+        for name, target_host in self._hosts.items():
+            if target_host == host:
+                return name
+        return None
+
+    async def _on_aiohttp_request(self, session, trace_ctx, params):
+        name = self._name_for_host(params.url.host)
+        if name is None:
+            return
+        self._last_activity[name] = time.monotonic()
+        # websocket 升级会把池里的连接带走，稍后补一条热连接给下一次回复
+        if params.headers.get('Upgrade', '').lower() == 'websocket':
+            self._spawn(self._warm(name, delay=0.5))
+
+    async def _on_httpx_request(self, request: httpx.Request):
+        name = self._name_for_host(request.url.host)
+        if name is not None:
+            self._last_activity[name] = time.monotonic()
+
+    async def _warm(self, name: str, delay: float = 0.0):
+        """发一个轻量请求建立（或确认）连接，任何 HTTP 响应都说明连接可用"""
+        if delay:
+            await asyncio.sleep(delay)
+        if name in self._warming:
+            return
+        self._warming.add(name)
+        url = self._targets[name]
+        start = time.perf_counter()
+        try:
+            if name == 'llm':
+                response = await self._http_client.head(url)
+                await response.aread()
+            else:
+                async with self._session.head(url, allow_redirects=False) as response:
+                    await response.read()
+            self.warm_times.setdefault(name, time.perf_counter() - start)
+            self.warm_up[name] = True
+        except Exception as e:
+            self.warm_up[name] = False
+            self.failures += 1
+            logger.warning(f"Health check for {name} failed: {str(e)}")
+        finally:
+            self._warming.discard(name)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            now = time.monotonic()
+            for name in self._targets:
+                if now - self._last_activity.get(name, 0.0) >= self._refresh_interval:
+                    self.refreshes += 1
+                    self._spawn(self._warm(name))
+
+    def status(self) -> Dict:
+        """连接预热状态，供就绪检查和日志使用"""
+        return {
+            'started': self.started,
+            'warm': dict(self.warm_up),
+            'warm_ms': {name: round(seconds * 1000, 1) for name, seconds in self.warm_times.items()},
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+        }
+
+    async def aclose(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        if self._session is not None:
+            await self._session.close()
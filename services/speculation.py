@@ -0,0 +1,338 @@
+import asyncio
+import contextvars
+import difflib
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+from livekit.agents import llm, stt, utils
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions
+
+from config.settings import settings
+from services.context_budget import estimate_tokens
+from utils.logger import logger
+
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def similarity(a: str, b: str) -> float:
+    """按词比较两段转写文本的相似度（0~1），忽略大小写和标点"""
+    return difflib.SequenceMatcher(None, _words(a), _words(b)).ratio()
+
+
+class TranscriptTapSTT(stt.STT):
+    """原样转发流式 STT 的结果，同时把每个转写事件交给回调"""
+
+    def __init__(self, stt_impl: stt.STT, on_transcript: Callable[[stt.SpeechEvent], None]):
+        super().__init__(capabilities=stt_impl.capabilities)
+        self._stt = stt_impl
+        self._on_transcript = on_transcript
+
+        @self._stt.on("metrics_collected")
+        def _forward_metrics(*args, **kwargs):
+            self.emit("metrics_collected", *args, **kwargs)
+
+    async def _recognize_impl(self, buffer, *, language, conn_options: APIConnectOptions):
+        return await self._stt.recognize(buffer=buffer, language=language, conn_options=conn_options)
+
+    def stream(
+        self,
+        *,
+        language: Optional[str] = None,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> stt.RecognizeStream:
+        return _TapStream(
+            self,
+            wrapped=self._stt.stream(language=language, conn_options=conn_options),
+            conn_options=conn_options,
+        )
+
+    async def aclose(self):
+        await self._stt.aclose()
+
+
+class _TapStream(stt.RecognizeStream):
+    def __init__(self, tap: TranscriptTapSTT, *, wrapped: stt.RecognizeStream, conn_options: APIConnectOptions):
+        self._wrapped = wrapped
+        super().__init__(stt=tap, conn_options=conn_options)
+
+    async def _metrics_monitor_task(self, event_aiter):
+        # 指标由被包装的 STT 发出并转发；这一路 tee 仍须读完，否则事件会一直留在缓冲里
+        async for _ in event_aiter:
+            pass
+
+    async def _run(self):
+        async def _forward_input():
+            async for data in self._input_ch:
+                if isinstance(data, self._FlushSentinel):
+                    self._wrapped.flush()
+                else:
+                    self._wrapped.push_frame(data)
+            self._wrapped.end_input()
+
+        async def _forward_events():
+            async for ev in self._wrapped:
+                if ev.type in (stt.SpeechEventType.INTERIM_TRANSCRIPT, stt.SpeechEventType.FINAL_TRANSCRIPT):
+                    try:
+                        self._stt._on_transcript(ev)
+                    except Exception as e:
+                        logger.error(f"Error in transcript tap: {str(e)}")
+                self._event_ch.send_nowait(ev)
+
+        tasks = [
+            asyncio.create_task(_forward_input(), name="tap_forward_input"),
+            asyncio.create_task(_forward_events(), name="tap_forward_events"),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await utils.aio.gracefully_cancel(*tasks)
+            await self._wrapped.aclose()
+
+
+class _Speculation:
+    """一次投机的 LLM 请求，后台把输出缓冲下来"""
+
+    def __init__(self, text: str, chat_ctx: llm.ChatContext):
+        self.text = text
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.prompt_estimate = sum(estimate_tokens(m) for m in chat_ctx.messages)
+        self.chunks: List[llm.ChatChunk] = []
+        self.usage: Optional[llm.CompletionUsage] = None
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.updated = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self, stream: llm.LLMStream):
+        try:
+            async with stream:
+                async for chunk in stream:
+                    if self.first_token_at is None and chunk.choices and \
+                            (chunk.choices[0].delta.content or chunk.choices[0].delta.tool_calls):
+                        self.first_token_at = time.perf_counter()
+                    self.chunks.append(chunk)
+                    if chunk.usage is not None:
+                        self.usage = chunk.usage
+                    self.updated.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self.finished_at = time.perf_counter()
+            self.updated.set()
+
+    def latency_saved(self, now: float) -> float:
+        """
+        提交时节省的首 token 延迟
+
+        正常请求在提交时才发出，首 token 要再等一个 TTFT；投机请求已经等了 now - started_at。
+        节省的时间不超过投机请求自己的 TTFT（已结束但没有输出时取其完成耗时）。
+        """
+        elapsed = now - self.started_at
+        for at in (self.first_token_at, self.finished_at):
+            if at is not None:
+                return min(elapsed, at - self.started_at)
+        return elapsed
+
+    @property
+    def completion_tokens(self) -> int:
+        if self.usage is not None:
+            return self.usage.completion_tokens
+        return sum(1 for c in self.chunks if c.choices and c.choices[0].delta.content)
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.usage.prompt_tokens if self.usage is not None else self.prompt_estimate
+
+
+class _ReplayLLMStream(llm.LLMStream):
+    """把投机请求已缓冲和后续到达的输出作为本轮回复的 LLM 流"""
+
+    def __init__(self, llm_impl: llm.LLM, *, speculation: _Speculation,
+                 chat_ctx: llm.ChatContext, fnc_ctx):
+        self._speculation = speculation
+        super().__init__(llm_impl, chat_ctx=chat_ctx, fnc_ctx=fnc_ctx, conn_options=DEFAULT_API_CONNECT_OPTIONS)
+
+    async def _run(self):
+        spec = self._speculation
+        index = 0
+        while True:
+            spec.updated.clear()
+            while index < len(spec.chunks):
+                chunk = spec.chunks[index]
+                index += 1
+                if chunk.choices and chunk.choices[0].delta.tool_calls:
+                    self._function_calls_info.extend(chunk.choices[0].delta.tool_calls)
+                self._event_ch.send_nowait(chunk)
+            if spec.done:
+                break
+            await spec.updated.wait()
+        if spec.error is not None:
+            raise spec.error
+
+    async def aclose(self):
+        if self._speculation.task is not None:
+            await utils.aio.gracefully_cancel(self._speculation.task)
+        await super().aclose()
+
+
+class Speculator:
+    """
+    根据 Deepgram 中间结果提前发起 LLM 请求
+
+    同一段中间结果连续 stable_interims 次不变、且不少于 min_words 个词时，用
+    「已确认的转写 + 中间结果」作为用户输入提前请求 LLM，输出在后台缓冲。
+    before_llm_cb 拿到最终的用户输入后做相似度比较：达到阈值就回放缓冲的输出
+    （提交），否则取消并走正常请求（浪费）。agent 正在说话时不做投机，因为此时
+    正式请求的上下文还会带上正在播放的回复。
+
+    投机请求在空的 contextvars 上下文中创建，agent 不会转发它的指标；提交后由回放流
+    发出指标，未提交的 token 单独统计并计入会话成本。
+    """
+
+    def __init__(self,
+                 agent_llm: llm.LLM,
+                 prepare: Optional[Callable[[llm.ChatContext], llm.ChatContext]] = None,
+                 min_words: int = 3,
+                 stable_interims: int = 2,
+                 similarity_threshold: float = 0.9,
+                 max_per_turn: int = 3):
+        self._llm = agent_llm
+        self._prepare = prepare
+        self._min_words = min_words
+        self._stable_interims = stable_interims
+        self._threshold = similarity_threshold
+        self._max_per_turn = max_per_turn
+
+        self._agent = None
+        self._agent_speaking = False
+        self._finals: List[str] = []
+        self._last_interim = ""
+        self._repeats = 0
+        self._turn_speculations = 0
+        self._current: Optional[_Speculation] = None
+
+        # 统计
+        self.started = 0
+        self.committed = 0
+        self.cancelled = 0
+        self.latency_saved = 0.0
+        self.wasted_prompt_tokens = 0
+        self.wasted_completion_tokens = 0
+
+    def attach(self, agent):
+        self._agent = agent
+
+        @agent.on("agent_started_speaking")
+        def _on_agent_started_speaking():
+            self._agent_speaking = True
+
+        @agent.on("agent_stopped_speaking")
+        def _on_agent_stopped_speaking():
+            self._agent_speaking = False
+
+        @agent.on("user_speech_committed")
+        def _on_user_speech_committed(msg):
+            self._finals.clear()
+            self._turn_speculations = 0
+
+    def on_transcript(self, ev: stt.SpeechEvent):
+        text = ev.alternatives[0].text if ev.alternatives else ""
+        if not text:
+            return
+        if ev.type == stt.SpeechEventType.FINAL_TRANSCRIPT:
+            self._finals.append(text)
+            self._last_interim, self._repeats = "", 0
+            candidate = " ".join(self._finals)
+        else:
+            if _words(text) == _words(self._last_interim):
+                self._repeats += 1
+            else:
+                self._last_interim, self._repeats = text, 1
+            if self._repeats < self._stable_interims:
+                return
+            candidate = " ".join(self._finals + [text])
+        self._maybe_speculate(candidate)
+
+    def _maybe_speculate(self, candidate: str):
+        if self._agent is None or self._agent_speaking:
+            return
+        if len(_words(candidate)) < self._min_words:
+            return
+        if self._current is not None:
+            if similarity(self._current.text, candidate) >= self._threshold:
+                return
+            self._discard()
+        if self._turn_speculations >= self._max_per_turn:
+            return
+
+        chat_ctx = self._agent.chat_ctx.copy()
+        chat_ctx.messages.append(llm.ChatMessage.create(text=candidate, role="user"))
+        if self._prepare is not None:
+            chat_ctx = self._prepare(chat_ctx)
+
+        spec = _Speculation(candidate, chat_ctx)
+
+        def _start():
+            stream = self._llm.chat(chat_ctx=chat_ctx, fnc_ctx=self._agent.fnc_ctx)
+            spec.task = asyncio.create_task(spec.run(stream), name="speculative_llm")
+
+        contextvars.Context().run(_start)
+        self._current = spec
+        self._turn_speculations += 1
+        self.started += 1
+
+    def _discard(self):
+        spec, self._current = self._current, None
+        if spec is None:
+            return
+        if spec.task is not None and not spec.task.done():
+            spec.task.cancel()
+        self.cancelled += 1
+        self.wasted_prompt_tokens += spec.prompt_tokens
+        self.wasted_completion_tokens += spec.completion_tokens
+
+    def take(self, chat_ctx: llm.ChatContext) -> Optional[llm.LLMStream]:
+        """before_llm_cb 中调用：投机结果可用时返回回放流，否则返回 None"""
+        spec = self._current
+        if spec is None:
+            return None
+        last = chat_ctx.messages[-1] if chat_ctx.messages else None
+        user_text = last.content if last is not None and last.role == "user" else None
+        if not isinstance(user_text, str) or spec.error is not None \
+                or similarity(spec.text, user_text) < self._threshold:
+            self._discard()
+            return None
+
+        self._current = None
+        self.committed += 1
+        self.latency_saved += spec.latency_saved(time.perf_counter())
+        return _ReplayLLMStream(self._llm, speculation=spec, chat_ctx=chat_ctx, fnc_ctx=self._agent.fnc_ctx)
+
+    @property
+    def wasted_cost(self) -> float:
+        return (
+            self.wasted_prompt_tokens * settings.PRICE_CONFIG["LLM"]["INPUT_PRICE"]
+            + self.wasted_completion_tokens * settings.PRICE_CONFIG["LLM"]["OUTPUT_PRICE"]
+        )
+
+    async def aclose(self):
+        self._discard()
+
+    def stats(self) -> Dict:
+        return {
+            'started': self.started,
+            'committed': self.committed,
+            'cancelled': self.cancelled,
+            'commit_rate': self.committed / self.started if self.started else 0.0,
+            'latency_saved': self.latency_saved,
+            'wasted_prompt_tokens': self.wasted_prompt_tokens,
+            'wasted_completion_tokens': self.wasted_completion_tokens,
+        }
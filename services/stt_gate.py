@@ -0,0 +1,177 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from livekit import rtc
+from livekit.agents import stt, utils, vad
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions
+
+from config.settings import settings
+
+# VAD 事件相对输入音频的最大延迟（秒）：静音期间缓冲 pre_roll 加上这段时间的音频
+_MAX_VAD_LAG = 2.0
+
+
+class VADGatedSTT(stt.STT):
+    """
+    静音抑制：只把 VAD 判定为语音的音频（前后各留一段余量）送给流式 STT
+
+    语音开始时先补发开始前 pre_roll 秒的音频，语音结束 hang_over 秒后停止转发并 flush
+    （Deepgram 收到 Finalize 后立即给出最终转写）。停止转发期间 Deepgram 插件自己的
+    KeepAlive 保持连接。STT 按实际送出的音频计费，被抑制的秒数见 stats()。
+
+    VAD 在静音一段时间（min_silence_duration）后才判定语音结束，所以实际保留的尾部
+    静音不少于这段时间。
+    """
+
+    def __init__(self, stt_impl: stt.STT, vad_impl: vad.VAD, pre_roll: float = 0.5, hang_over: float = 0.6):
+        super().__init__(capabilities=stt_impl.capabilities)
+        self._stt = stt_impl
+        self._vad = vad_impl
+        self._pre_roll = pre_roll
+        self._hang_over = hang_over
+
+        # 统计（会话内所有流累计）
+        self.forwarded_seconds = 0.0
+        self.suppressed_seconds = 0.0
+        self.segments = 0
+
+        @self._stt.on("metrics_collected")
+        def _forward_metrics(*args, **kwargs):
+            self.emit("metrics_collected", *args, **kwargs)
+
+    async def _recognize_impl(self, buffer, *, language, conn_options: APIConnectOptions):
+        return await self._stt.recognize(buffer=buffer, language=language, conn_options=conn_options)
+
+    def stream(
+        self,
+        *,
+        language: Optional[str] = None,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> stt.RecognizeStream:
+        return _GatedStream(
+            self,
+            wrapped=self._stt.stream(language=language, conn_options=conn_options),
+            conn_options=conn_options,
+        )
+
+    def stats(self) -> Dict:
+        total = self.forwarded_seconds + self.suppressed_seconds
+        return {
+            'forwarded_seconds': round(self.forwarded_seconds, 2),
+            'suppressed_seconds': round(self.suppressed_seconds, 2),
+            'suppressed_ratio': round(self.suppressed_seconds / total, 3) if total else 0.0,
+            'segments': self.segments,
+            'saved_cost': self.suppressed_seconds * settings.PRICE_CONFIG["STT"]["PRICE"],
+        }
+
+    async def aclose(self):
+        await self._stt.aclose()
+
+
+class _GatedStream(stt.RecognizeStream):
+    """
+    按音频时间线（秒）判断每一帧是否转发
+
+    VAD 事件相对输入有延迟，开始 / 结束时间由事件中的 timestamp 减去 speech_duration /
+    silence_duration 得到，与帧在输入中的位置比较，不受延迟影响。
+    """
+
+    def __init__(self, gate: VADGatedSTT, *, wrapped: stt.RecognizeStream, conn_options: APIConnectOptions):
+        self._gate = gate
+        self._wrapped = wrapped
+        super().__init__(stt=gate, conn_options=conn_options)
+        self._received = 0.0
+        self._open = False
+        self._close_at: Optional[float] = None
+        self._buffer: Deque[Tuple[float, rtc.AudioFrame]] = deque()
+
+    async def _metrics_monitor_task(self, event_aiter):
+        # 指标由被包装的 STT 发出并转发；这一路 tee 仍须读完，否则事件会一直留在缓冲里
+        async for _ in event_aiter:
+            pass
+
+    def _forward(self, frame: rtc.AudioFrame):
+        self._gate.forwarded_seconds += frame.duration
+        self._wrapped.push_frame(frame)
+
+    def _on_frame(self, frame: rtc.AudioFrame):
+        start = self._received
+        self._received += frame.duration
+        if self._open:
+            if self._close_at is None or start < self._close_at:
+                self._forward(frame)
+                return
+            self._close()
+
+        self._buffer.append((start, frame))
+        horizon = self._received - self._gate._pre_roll - _MAX_VAD_LAG
+        while self._buffer and self._buffer[0][0] + self._buffer[0][1].duration < horizon:
+            _, old = self._buffer.popleft()
+            self._gate.suppressed_seconds += old.duration
+
+    def _on_speech_start(self, speech_start: float):
+        self._close_at = None
+        if self._open:
+            return
+        self._open = True
+        self._gate.segments += 1
+        # 补发语音开始前 pre_roll 秒的音频，更早的丢弃
+        keep_from = speech_start - self._gate._pre_roll
+        while self._buffer:
+            start, frame = self._buffer.popleft()
+            if start + frame.duration > keep_from:
+                self._forward(frame)
+            else:
+                self._gate.suppressed_seconds += frame.duration
+
+    def _on_speech_end(self, speech_end: float):
+        if not self._open:
+            return
+        self._close_at = speech_end + self._gate._hang_over
+        if self._received >= self._close_at:
+            self._close()
+
+    def _close(self):
+        self._open = False
+        self._close_at = None
+        self._wrapped.flush()
+
+    async def _run(self):
+        vad_stream = self._gate._vad.stream()
+
+        async def _forward_input():
+            async for data in self._input_ch:
+                if isinstance(data, self._FlushSentinel):
+                    self._wrapped.flush()
+                    continue
+                vad_stream.push_frame(data)
+                self._on_frame(data)
+            vad_stream.end_input()
+            self._wrapped.end_input()
+
+        async def _watch_vad():
+            async for ev in vad_stream:
+                if ev.type == vad.VADEventType.START_OF_SPEECH:
+                    self._on_speech_start(ev.timestamp - ev.speech_duration)
+                elif ev.type == vad.VADEventType.END_OF_SPEECH:
+                    self._on_speech_end(ev.timestamp - ev.silence_duration)
+
+        async def _forward_events():
+            async for ev in self._wrapped:
+                self._event_ch.send_nowait(ev)
+
+        tasks = [
+            asyncio.create_task(_forward_input(), name="gate_forward_input"),
+            asyncio.create_task(_watch_vad(), name="gate_watch_vad"),
+            asyncio.create_task(_forward_events(), name="gate_forward_events"),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await utils.aio.gracefully_cancel(*tasks)
+            await vad_stream.aclose()
+            await self._wrapped.aclose()
+            # 未转发的缓冲音频计入抑制
+            self._gate.suppressed_seconds += sum(frame.duration for _, frame in self._buffer)
+            self._buffer.clear()
@@ -0,0 +1,196 @@
+import asyncio
+import re
+from typing import Dict, List
+
+from livekit.agents import tts, utils
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions
+
+_WORD_RE = re.compile(r"\S+")
+# 标点后必须跟空白才算边界，避免把 "3.5"、"e.g.x" 之类切开；流式输入时要等下一个 token 确认
+_CLAUSE_END_RE = re.compile(r"[,;:—–)]\s")
+_SENTENCE_END_RE = re.compile(r"[.!?…]+[\"')\]]*\s")
+
+
+class ClauseSegmenter:
+    """
+    流式文本分段
+
+    第一段尽量短：凑够 first_min_words 个词后在第一个子句边界（逗号、分号等）切出，
+    最迟 first_max_words 个词强制在词边界切出。之后的段只在句末切分，最小长度按
+    growth 倍数递增到 max_min_words，保证后续语句的韵律；超过 hard_max_words 仍没有
+    句末时退回到子句边界，再不行就在词边界切。
+    """
+
+    def __init__(self,
+                 first_min_words: int = 3,
+                 first_max_words: int = 12,
+                 growth: float = 2.0,
+                 max_min_words: int = 30,
+                 hard_max_words: int = 60):
+        self._first_min_words = first_min_words
+        self._first_max_words = first_max_words
+        self._growth = growth
+        self._max_min_words = max_min_words
+        self._hard_max_words = hard_max_words
+        self._buffer = ""
+        self._index = 0
+
+    def _min_words(self) -> int:
+        return min(int(self._first_min_words * self._growth ** self._index), self._max_min_words)
+
+    def _cut(self, position: int) -> str:
+        segment, self._buffer = self._buffer[:position].strip(), self._buffer[position:].lstrip()
+        self._index += 1
+        return segment
+
+    def _boundary(self, pattern: re.Pattern, min_words: int) -> int:
+        """第一个前面至少有 min_words 个词的边界，返回切分位置，没有则返回 -1"""
+        for match in pattern.finditer(self._buffer):
+            if len(_WORD_RE.findall(self._buffer[:match.end()])) >= min_words:
+                return match.end()
+        return -1
+
+    def _next(self) -> str:
+        words = len(_WORD_RE.findall(self._buffer))
+        if self._index == 0:
+            if words < self._first_min_words:
+                return ""
+            position = self._boundary(_SENTENCE_END_RE, self._first_min_words)
+            clause = self._boundary(_CLAUSE_END_RE, self._first_min_words)
+            if clause != -1 and (position == -1 or clause < position):
+                position = clause
+            if position == -1 and words > self._first_max_words:
+                position = self._word_boundary(self._first_max_words)
+        else:
+            min_words = self._min_words()
+            if words < min_words:
+                return ""
+            position = self._boundary(_SENTENCE_END_RE, min_words)
+            if position == -1 and words > self._hard_max_words:
+                position = self._boundary(_CLAUSE_END_RE, min_words)
+                if position == -1:
+                    position = self._word_boundary(self._hard_max_words)
+        return self._cut(position) if position > 0 else ""
+
+    def _word_boundary(self, count: int) -> int:
+        matches = list(_WORD_RE.finditer(self._buffer))
+        return matches[count - 1].end() if len(matches) > count else -1
+
+    def push(self, text: str) -> List[str]:
+        self._buffer += text
+        segments = []
+        while True:
+            segment = self._next()
+            if not segment:
+                return segments
+            segments.append(segment)
+
+    def flush(self) -> List[str]:
+        """输入结束：剩余文本作为最后一段，并重置为新一轮的第一段"""
+        segment = self._buffer.strip()
+        self._buffer = ""
+        self._index = 0
+        return [segment] if segment else []
+
+
+class SegmentedTTS(tts.TTS):
+    """
+    在 LLM token 流和流式 TTS 之间插入 ClauseSegmenter
+
+    每个分段推给底层流后立即 flush，让服务端马上开始合成第一段。底层流在一次
+    上下文里只发一次 is_final，按 flush 计数的字符数会偏少，所以流式指标由本包装
+    自己发出（按 agent 推入的全部文本计费），底层只转发非流式（synthesize）的指标。
+    """
+
+    def __init__(self, tts_impl: tts.TTS, segmenter_options: Dict):
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=True),
+            sample_rate=tts_impl.sample_rate,
+            num_channels=tts_impl.num_channels,
+        )
+        self._tts = tts_impl
+        self._segmenter_options = segmenter_options
+
+        # 统计
+        self.streams = 0
+        self.segments = 0
+        self.first_segment_words = 0
+
+        @self._tts.on("metrics_collected")
+        def _forward_metrics(mtrcs):
+            if not mtrcs.streamed:
+                self.emit("metrics_collected", mtrcs)
+
+    def synthesize(
+        self,
+        text: str,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.ChunkedStream:
+        return self._tts.synthesize(text, conn_options=conn_options)
+
+    def stream(
+        self,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.SynthesizeStream:
+        return _SegmentedStream(
+            tts=self,
+            conn_options=conn_options,
+            wrapped=self._tts.stream(conn_options=conn_options),
+            segmenter=ClauseSegmenter(**self._segmenter_options),
+        )
+
+    def stats(self) -> Dict:
+        return {
+            'streams': self.streams,
+            'segments': self.segments,
+            'avg_first_segment_words': self.first_segment_words / self.streams if self.streams else 0.0,
+        }
+
+    async def aclose(self):
+        await self._tts.aclose()
+
+
+class _SegmentedStream(tts.SynthesizeStream):
+    def __init__(self, *, tts: SegmentedTTS, conn_options: APIConnectOptions,
+                 wrapped: tts.SynthesizeStream, segmenter: ClauseSegmenter):
+        self._wrapped = wrapped
+        self._segmenter = segmenter
+        super().__init__(tts=tts, conn_options=conn_options)
+
+    async def _run(self):
+        first = True
+
+        async def _forward_input():
+            nonlocal first
+            async for data in self._input_ch:
+                if isinstance(data, self._FlushSentinel):
+                    segments = self._segmenter.flush()
+                else:
+                    # 从收到第一个 token 开始计时，TTFB 包含分段等待的时间
+                    self._mark_started()
+                    segments = self._segmenter.push(data)
+                for segment in segments:
+                    if first:
+                        first = False
+                        self._tts.streams += 1
+                        self._tts.first_segment_words += len(_WORD_RE.findall(segment))
+                    self._tts.segments += 1
+                    self._wrapped.push_text(segment + " ")
+                    self._wrapped.flush()
+            self._wrapped.end_input()
+
+        async def _forward_audio():
+            async for audio in self._wrapped:
+                self._event_ch.send_nowait(audio)
+
+        tasks = [
+            asyncio.create_task(_forward_input(), name="segmenter_forward_input"),
+            asyncio.create_task(_forward_audio(), name="segmenter_forward_audio"),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await utils.aio.gracefully_cancel(*tasks)
+            await self._wrapped.aclose()
@@ -0,0 +1,300 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+from livekit.agents import tts, utils
+from livekit.agents.metrics import TTSMetrics
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions
+
+from utils.logger import logger
+
+_INDEX_FILE = "index.json"
+
+
+class TTSAudioCache:
+    """
+    固定语句的 TTS 音频磁盘缓存
+
+    每条语句的 16-bit PCM 单独存为一个文件，读取时 mmap，多个任务进程共享同一目录
+    和页缓存。index.json 记录采样率、大小和最近使用时间，总大小超过 max_bytes 时按
+    LRU 淘汰。文件和索引都先写临时文件再 os.replace，并发写入时最坏只会丢失索引项
+    （下次未命中重新合成），不会读到半截音频。
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # key → 元数据，按最近使用排序
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(text: str, **fields) -> str:
+        """缓存键：文本 + 影响音色的所有参数（model、voice、speed、emotion、sample_rate 等）"""
+        payload = json.dumps({'text': text, **fields}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._directory, name)
+
+    def load(self):
+        """读取索引并映射已有音频（在 prewarm 中调用）"""
+        os.makedirs(self._directory, exist_ok=True)
+        try:
+            with open(self._path(_INDEX_FILE), encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = {}
+        except Exception as e:
+            logger.error(f"Error reading TTS cache index, starting empty: {str(e)}")
+            entries = {}
+
+        with self._lock:
+            for key, entry in sorted(entries.items(), key=lambda item: item[1]['last_used']):
+                if not os.path.exists(self._path(entry['file'])):
+                    continue
+                self._entries[key] = entry
+                self.total_bytes += entry['bytes']
+                self._map(key)
+        logger.info(f"TTS cache loaded {len(self._entries)} utterances ({self.total_bytes / 1024:.0f} KiB)")
+
+    def _map(self, key: str) -> Optional[mmap.mmap]:
+        mapped = self._maps.get(key)
+        if mapped is None:
+            entry = self._entries[key]
+            try:
+                with open(self._path(entry['file']), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error mapping cached TTS audio {entry['file']}: {str(e)}")
+                return None
+            self._maps[key] = mapped
+        return mapped
+
+    def contains(self, key: str) -> bool:
+        """是否已缓存（不计入命中统计）"""
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str) -> Optional[Dict]:
+        """命中时返回 {'pcm', 'sample_rate', 'num_channels'}，pcm 为 mmap"""
+        with self._lock:
+            entry = self._entries.get(key)
+            mapped = self._map(key) if entry is not None else None
+            if mapped is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            entry['last_used'] = time.time()
+            return {'pcm': mapped, 'sample_rate': entry['sample_rate'], 'num_channels': entry['num_channels']}
+
+    def put(self, key: str, pcm: bytes, sample_rate: int, num_channels: int):
+        """写入一条音频（阻塞磁盘 IO，需在线程中调用）"""
+        if not pcm or len(pcm) > self._max_bytes:
+            return
+        name = f"{key}.pcm"
+        tmp = self._path(f"{name}.{os.getpid()}.tmp")
+        with open(tmp, 'wb') as f:
+            f.write(pcm)
+        os.replace(tmp, self._path(name))
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old['bytes']
+                self._maps.pop(key, None)
+            self._entries[key] = {
+                'file': name,
+                'bytes': len(pcm),
+                'sample_rate': sample_rate,
+                'num_channels': num_channels,
+                'last_used': time.time(),
+            }
+            self.total_bytes += len(pcm)
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        while self.total_bytes > self._max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry['bytes']
+            # 不主动 close：正在播放的会话仍持有映射，文件删除后映射依然有效
+            self._maps.pop(key, None)
+            try:
+                os.remove(self._path(entry['file']))
+            except FileNotFoundError:
+                pass
+            self.evictions += 1
+
+    def _save_index(self):
+        tmp = self._path(f"{_INDEX_FILE}.{os.getpid()}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(dict(self._entries), f)
+        os.replace(tmp, self._path(_INDEX_FILE))
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+class CachedTTS(tts.TTS):
+    """
+    带音频缓存的 TTS 包装
+
+    synthesize()（agent.say 的文本路径）先查缓存：命中时直接从 mmap 回放，
+    TTSMetrics 的字符数为 0；未命中时调用原 TTS 并在完整合成后写入缓存。
+    stream()（LLM 回复路径）直接交给原 TTS，不做缓存。
+    """
+
+    def __init__(self, tts_impl: tts.TTS, cache: TTSAudioCache, key_fields: Dict):
+        super().__init__(
+            capabilities=tts_impl.capabilities,
+            sample_rate=tts_impl.sample_rate,
+            num_channels=tts_impl.num_channels,
+        )
+        self._tts = tts_impl
+        self._cache = cache
+        self._key_fields = {**key_fields, 'sample_rate': tts_impl.sample_rate}
+        self._store_tasks: Set[asyncio.Task] = set()
+
+        @self._tts.on("metrics_collected")
+        def _forward_metrics(*args, **kwargs):
+            self.emit("metrics_collected", *args, **kwargs)
+
+    @property
+    def cache(self) -> TTSAudioCache:
+        return self._cache
+
+    def synthesize(
+        self,
+        text: str,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.ChunkedStream:
+        key = TTSAudioCache.make_key(text, **self._key_fields)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return _CachedChunkedStream(tts=self, input_text=text, conn_options=conn_options, cached=cached)
+        return _CapturingChunkedStream(tts=self, input_text=text, conn_options=conn_options, key=key)
+
+    def stream(
+        self,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.SynthesizeStream:
+        return self._tts.stream(conn_options=conn_options)
+
+    async def prefill(self, texts: List[str]) -> int:
+        """合成缓存里还没有的语句并写入缓存，返回新写入的条数"""
+        added = 0
+        for text in texts:
+            key = TTSAudioCache.make_key(text, **self._key_fields)
+            if self._cache.contains(key):
+                continue
+            chunks = []
+            async with self._tts.synthesize(text) as stream:
+                async for ev in stream:
+                    chunks.append(bytes(ev.frame.data))
+            await asyncio.to_thread(self._cache.put, key, b''.join(chunks), self.sample_rate, self.num_channels)
+            added += 1
+        return added
+
+    def _store(self, key: str, pcm: bytes):
+        async def _put():
+            try:
+                await asyncio.to_thread(self._cache.put, key, pcm, self.sample_rate, self.num_channels)
+            except Exception as e:
+                logger.error(f"Error storing TTS audio in cache: {str(e)}")
+
+        task = asyncio.create_task(_put(), name="tts_cache_store")
+        self._store_tasks.add(task)
+        task.add_done_callback(self._store_tasks.discard)
+
+    async def aclose(self):
+        if self._store_tasks:
+            await asyncio.gather(*self._store_tasks, return_exceptions=True)
+        await self._tts.aclose()
+
+
+class _CachedChunkedStream(tts.ChunkedStream):
+    """从缓存回放，不访问 TTS 服务"""
+
+    def __init__(self, *, tts: CachedTTS, input_text: str, conn_options: APIConnectOptions, cached: Dict):
+        self._cached = cached
+        super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
+
+    async def _metrics_monitor_task(self, event_aiter):
+        start_time = time.perf_counter()
+        ttfb = -1.0
+        audio_duration = 0.0
+        request_id = ""
+        async for ev in event_aiter:
+            if ttfb == -1.0:
+                ttfb = time.perf_counter() - start_time
+            audio_duration += ev.frame.duration
+            request_id = ev.request_id
+
+        # 缓存命中不产生 TTS 费用
+        self._tts.emit("metrics_collected", TTSMetrics(
+            timestamp=time.time(),
+            request_id=request_id,
+            ttfb=ttfb,
+            duration=time.perf_counter() - start_time,
+            characters_count=0,
+            audio_duration=audio_duration,
+            cancelled=self._synthesize_task.cancelled(),
+            label=self._tts.label,
+            streamed=False,
+            error=None,
+        ))
+
+    async def _run(self):
+        request_id = utils.shortuuid()
+        bstream = utils.audio.AudioByteStream(
+            sample_rate=self._cached['sample_rate'],
+            num_channels=self._cached['num_channels'],
+        )
+        for frame in bstream.write(self._cached['pcm'][:]):
+            self._event_ch.send_nowait(tts.SynthesizedAudio(request_id=request_id, frame=frame))
+        for frame in bstream.flush():
+            self._event_ch.send_nowait(tts.SynthesizedAudio(request_id=request_id, frame=frame))
+
+
+class _CapturingChunkedStream(tts.ChunkedStream):
+    """未命中：转发原 TTS 的音频，完整合成后写入缓存"""
+
+    def __init__(self, *, tts: CachedTTS, input_text: str, conn_options: APIConnectOptions, key: str):
+        self._key = key
+        super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
+
+    async def _metrics_monitor_task(self, event_aiter):
+        # 指标由原 TTS 发出并转发；这一路 tee 仍须读完，否则每帧音频都会多留一份
+        async for _ in event_aiter:
+            pass
+
+    async def _run(self):
+        chunks = []
+        async with self._tts._tts.synthesize(self._input_text, conn_options=self._conn_options) as stream:
+            async for ev in stream:
+                chunks.append(bytes(ev.frame.data))
+                self._event_ch.send_nowait(ev)
+        # 被打断时不会执行到这里，只缓存完整的音频
+        self._tts._store(self._key, b''.join(chunks))
@@ -59,9 +59,11 @@ PID=$!
 echo $PID > logs/agent.pid
 
 # 实时显示日志并检查启动状态
-echo -e "\n等待服务启动..."
+# 轮询主进程的就绪接口：已在 LiveKit 注册且有预热完成的任务进程后返回 200
+echo -e "\n等待服务就绪..."
+READY_URL="http://127.0.0.1:${HEALTH_PORT:-8082}/readyz"
 attempt=0
-max_attempts=30
+max_attempts=300  # 每次 0.2 秒，最多 60 秒
 
 (tail -f logs/agent.log) &
 TAIL_PID=$!
@@ -75,21 +77,24 @@ while [ $attempt -lt $max_attempts ]; do
         exit 1
     fi
 
-    if grep -q "VAD model loaded successfully" logs/agent.log; then
-        echo -e "\n${GREEN}✓ Agent 服务已成功启动${NC}"
+    if curl -sf -o /dev/null "$READY_URL"; then
+        echo -e "\n${GREEN}✓ Agent 服务已就绪${NC}"
         echo -e "${GREEN}✓ PID: $PID${NC}"
+        echo -e "${YELLOW}就绪状态: $READY_URL${NC}"
         echo -e "${YELLOW}完整日志请查看: logs/agent.log${NC}"
         kill $TAIL_PID
         exit 0
     fi
 
     attempt=$((attempt + 1))
-    sleep 1
+    sleep 0.2
 done
 
 # 如果超时
 kill $TAIL_PID
 echo -e "${RED}✗ 服务启动超时${NC}"
-echo -e "${YELLOW}最后 20 行日志:${NC}"
+echo -e "${YELLOW}就绪状态:${NC}"
+curl -s "$READY_URL"
+echo -e "\n${YELLOW}最后 20 行日志:${NC}"
 tail -n 20 logs/agent.log
-exit 1
\ No newline at end of file
+exit 1
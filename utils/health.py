@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from config.settings import settings
+from utils.logger import logger
+
+
+class _RegistrationWatcher(logging.Filter):
+    """
+    从 livekit.agents 的日志中得知 worker 的注册状态
+
+    Worker 由 cli.run_app 内部创建，拿不到实例，无法订阅 worker_registered 事件；
+    依赖 INFO 级别的 "registered worker" 日志（cli 默认日志级别即为 INFO）。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.registered = False
+        self.draining = False
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if message == "registered worker":
+            self.registered = True
+        elif message in ("draining worker", "shutting down worker"):
+            self.draining = True
+        return True
+
+
+class WorkerHealth:
+    """主进程内汇总 worker 注册状态和各任务进程的预热状态"""
+
+    def __init__(self, min_ready_processes: int):
+        self._min_ready = min_ready_processes
+        self._lock = threading.Lock()
+        self._processes: Dict[int, Dict] = {}
+        self.watcher = _RegistrationWatcher()
+        self.startup: Dict[str, float] = {}
+
+    def apply(self, report: Dict):
+        with self._lock:
+            state = self._processes.setdefault(report['pid'], {})
+            state.update(report)
+            state['updated'] = time.time()
+
+    def _alive_processes(self) -> Dict[int, Dict]:
+        # 任务进程是本进程的子进程，退出后直接从列表中移除
+        for pid in list(self._processes):
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                del self._processes[pid]
+            except PermissionError:
+                pass
+        return dict(self._processes)
+
+    def status(self) -> Dict:
+        with self._lock:
+            processes = self._alive_processes()
+        idle_ready = sum(1 for state in processes.values() if state.get('vad') and not state.get('busy'))
+        return {
+            'ready': self.watcher.registered and not self.watcher.draining and idle_ready >= self._min_ready,
+            'registered': self.watcher.registered,
+            'draining': self.watcher.draining,
+            'idle_ready_processes': idle_ready,
+            'processes': {str(pid): state for pid, state in processes.items()},
+            'startup_ms': self.startup,
+        }
+
+
+class HealthServer:
+    """
+    主 worker 进程内的存活/就绪检查
+
+    /livez：主进程在运行即返回 200。
+    /readyz：已在 LiveKit 注册、未在排空，且至少有 min_ready_processes 个已加载 VAD 的
+    空闲任务进程时返回 200，否则 503；响应体为各进程的预热状态（JSON）。
+    任务进程预热完成、开始会话时通过 Unix 数据报上报状态。
+    """
+
+    def __init__(self, socket_path: str, host: str, port: int, min_ready_processes: int):
+        self.health = WorkerHealth(min_ready_processes)
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(socket_path)
+
+        health = self.health
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path == '/livez':
+                    self._reply(200, {'alive': True})
+                elif path == '/readyz':
+                    status = health.status()
+                    self._reply(200 if status['ready'] else 503, status)
+                else:
+                    self.send_error(404)
+
+            def _reply(self, code: int, payload: Dict):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._http = ThreadingHTTPServer((host, port), _Handler)
+        self._http.daemon_threads = True
+
+    def start(self):
+        logging.getLogger("livekit.agents").addFilter(self.health.watcher)
+        threading.Thread(target=self._receive, name="health_receiver", daemon=True).start()
+        threading.Thread(target=self._http.serve_forever, name="health_http", daemon=True).start()
+        host, port = self._http.server_address[:2]
+        logger.info(f"Worker health checks available at http://{host}:{port}/readyz")
+
+    def _receive(self):
+        while True:
+            try:
+                data = self._sock.recv(1 << 16)
+                self.health.apply(json.loads(data))
+            except Exception as e:
+                logger.error(f"Error applying health report: {str(e)}")
+
+
+def report_process_state(**state):
+    """任务进程上报预热状态（vad、pool、busy 等），主进程未开启健康检查时忽略"""
+    if not settings.HEALTH_CONFIG["ENABLED"]:
+        return
+    payload = json.dumps({'pid': os.getpid(), **state}, separators=(',', ':')).encode('utf-8')
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(payload, settings.HEALTH_CONFIG["SOCKET_PATH"])
+    except OSError as e:
+        logger.debug(f"Could not report process state: {str(e)}")
+
+
+def start_health_server() -> Optional[HealthServer]:
+    """在主 worker 进程中启动健康检查服务（须在 cli.run_app 之前调用）"""
+    if not settings.HEALTH_CONFIG["ENABLED"]:
+        return None
+    try:
+        server = HealthServer(
+            settings.HEALTH_CONFIG["SOCKET_PATH"],
+            settings.HEALTH_CONFIG["HOST"],
+            settings.HEALTH_CONFIG["PORT"],
+            settings.HEALTH_CONFIG["MIN_READY_PROCESSES"],
+        )
+        server.start()
+        return server
+    except Exception as e:
+        logger.error(f"Error starting health server: {str(e)}")
+        return None
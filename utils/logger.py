@@ -1,18 +1,183 @@
+import atexit
+import copy
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
 
 from config.settings import settings
 
+# 每条记录附带的上下文字段（任务进程只服务一个会话，用进程级的字典即可）
+_CONTEXT_KEYS = ('session_id', 'room')
+_context: Dict[str, str] = {}
+
+# 被丢弃的记录数：原因 → 累计条数
+_dropped: Dict[str, int] = {}
+_reported: Dict[str, int] = {}
+_dropped_lock = threading.Lock()
+
+
+def set_log_context(**fields):
+    """设置本进程之后日志记录的上下文字段（如 session_id、room），值为 None 时移除"""
+    for key, value in fields.items():
+        if value is None:
+            _context.pop(key, None)
+        else:
+            _context[key] = str(value)
+
+
+def _count_drop(reason: str):
+    with _dropped_lock:
+        _dropped[reason] = _dropped.get(reason, 0) + 1
+
+
+def log_stats() -> Dict[str, int]:
+    """本进程累计丢弃的日志记录数（按原因）"""
+    with _dropped_lock:
+        return dict(_dropped)
+
+
+def take_dropped_counts() -> Dict[str, int]:
+    """自上次调用以来新增的丢弃数，供指标上报"""
+    with _dropped_lock:
+        delta = {reason: count - _reported.get(reason, 0) for reason, count in _dropped.items()}
+        _reported.update(_dropped)
+    return {reason: count for reason, count in delta.items() if count > 0}
+
+
+def _parse_limits(spec: str) -> Dict[str, float]:
+    """"livekit=20,httpx=5" → {'livekit': 20.0, 'httpx': 5.0}"""
+    limits = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            limits[name.strip()] = float(value)
+    return limits
+
+
+class JsonFormatter(logging.Formatter):
+    """一行一个 JSON 对象，带上进程号和会话上下文"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        for key in _CONTEXT_KEYS:
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _context.items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按 logger 名称前缀限速和采样（最长前缀匹配，子 logger 共用父前缀的额度）
+
+    rates：每秒最多放行的条数（令牌桶，允许一秒的突发），只限制 ERROR 以下的记录；
+    samples：放行比例 0~1，只作用于 WARNING 以下的记录。
+    """
+
+    def __init__(self, rates: Dict[str, float], samples: Dict[str, float]):
+        super().__init__()
+        self._rates = rates
+        self._samples = samples
+        self._buckets: Dict[str, List[float]] = {}  # 前缀 → [令牌数, 上次补充时间]
+        self._prefixes: Dict[int, Dict[str, Optional[str]]] = {}  # 规则表 → logger 名 → 匹配的前缀
+        self._lock = threading.Lock()
+
+    def _prefix(self, name: str, table: Dict[str, float]) -> Optional[str]:
+        cache = self._prefixes.setdefault(id(table), {})
+        if name not in cache:
+            matches = [key for key in table if name == key or name.startswith(key + '.')]
+            cache[name] = max(matches, key=len) if matches else None
+        return cache[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and self._samples:
+            prefix = self._prefix(record.name, self._samples)
+            if prefix is not None and random.random() >= self._samples[prefix]:
+                _count_drop('sampled')
+                return False
+
+        if record.levelno < logging.ERROR and self._rates:
+            prefix = self._prefix(record.name, self._rates)
+            if prefix is not None:
+                rate = self._rates[prefix]
+                now = time.monotonic()
+                with self._lock:
+                    bucket = self._buckets.setdefault(prefix, [rate, now])
+                    bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+                    bucket[1] = now
+                    if bucket[0] < 1:
+                        _count_drop('rate_limited')
+                        return False
+                    bucket[0] -= 1
+        return True
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """只在调用线程里拼好消息文本，格式化和 I/O 交给监听线程；队列满时丢弃并计数"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _count_drop('queue_full')
+
+
+def _queue_handler(handlers: List[logging.Handler]) -> QueueHandler:
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_CONFIG["QUEUE_SIZE"])
+    handler = _DroppingQueueHandler(log_queue)
+    handler.addFilter(_ContextFilter())
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # 退出前把队列里剩下的记录写完
+    atexit.register(listener.stop)
+    return handler
+
+
+def _formatter() -> logging.Formatter:
+    if settings.LOG_CONFIG["JSON"]:
+        return JsonFormatter()
+    return logging.Formatter(settings.LOG_FORMAT)
+
 
 def setup_logger(name, log_file, level=logging.INFO):
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    
+    formatter = _formatter()
+
     # 确保日志目录存在
     os.makedirs('logs', exist_ok=True)
-    
+
     # 文件处理器 - 按大小轮转
     file_handler = RotatingFileHandler(
         f'logs/{log_file}',
@@ -20,17 +185,47 @@ def setup_logger(name, log_file, level=logging.INFO):
         backupCount=5
     )
     file_handler.setFormatter(formatter)
-    
+
     # 控制台处理器
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    
-    # 创建logger
+
+    # 创建logger：写文件和控制台在后台线程进行，不占用事件循环
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+    logger.addHandler(_queue_handler([file_handler, console_handler]))
+
     return logger
 
-logger = setup_logger("voice-agent", settings.LOG_FILE)
\ No newline at end of file
+
+def setup_job_logging():
+    """
+    任务进程内调用（prewarm 最开始）
+
+    livekit 在任务进程的根 logger 上挂了把记录序列化后发给主进程的处理器，级别为 NOTSET，
+    DEBUG 记录也会在事件循环上格式化、pickle 之后才在主进程被丢弃。这里把根级别设为
+    LOG_LEVEL，让低级别记录在创建前就被过滤；原处理器改由后台线程调用，并加上限速和采样。
+    """
+    root = logging.getLogger()
+    handlers = [handler for handler in root.handlers if not isinstance(handler, _DroppingQueueHandler)]
+    if not handlers:
+        return
+    for handler in handlers:
+        root.removeHandler(handler)
+    handler = _queue_handler(handlers)
+    # 限速和采样只在任务进程内按会话进行：主进程收到的是所有任务进程转发来的记录，
+    # 在那里限速会让所有会话共用一份额度
+    config = settings.LOG_CONFIG
+    handler.addFilter(RateLimitFilter(_parse_limits(config["RATE_LIMITS"]), _parse_limits(config["SAMPLING"])))
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL)
+    for name in settings.LOG_CONFIG["QUIET_LOGGERS"].split(','):
+        quiet = logging.getLogger(name.strip())
+        if quiet.level == logging.NOTSET:
+            quiet.setLevel(logging.WARNING)
+
+
+# 导入时只创建 logger，不建目录、不挂处理器：由主进程启动时调用 setup_logger；
+# 任务进程的日志经 livekit 的进程间日志队列转发到主进程的处理器
+logger = logging.getLogger("voice-agent")
+logger.setLevel(logging.INFO)
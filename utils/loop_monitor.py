@@ -0,0 +1,227 @@
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Sequence
+
+from config.settings import settings
+from utils.logger import logger
+from utils.quantiles import QuantileSketch
+
+# 阻塞调用栈的最大深度（从最内层算起）
+_STACK_LIMIT = 20
+
+
+def _frame_label(code) -> str:
+    # 只保留路径最后两级，同名文件（如各插件的 stt.py）仍能区分
+    path = '/'.join(code.co_filename.replace('\\', '/').split('/')[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(';', ':')
+
+
+def _collapse(frame, tag: str) -> str:
+    """把一个线程的调用栈折叠成 "tag;外层;...;内层" 的形式"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(tag)
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    低开销的采样分析器
+
+    后台线程每 interval 秒读取一次目标线程的调用栈（sys._current_frames），按折叠栈计数，
+    不对被测代码插桩。输出为 flamegraph.pl / speedscope 可直接读取的折叠栈格式，
+    每行以会话 ID 为根帧，便于合并多个进程的输出后按会话区分。
+    """
+
+    def __init__(self, session_id: str, interval: float = 0.02, thread_ids: Optional[List[int]] = None):
+        self._session_id = re.sub(r'[;\s]', '_', session_id)
+        self._interval = interval
+        self._thread_ids = thread_ids  # None 表示采样所有线程
+        self._stacks: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling_profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self._thread_ids is not None and ident not in self._thread_ids):
+                    continue
+                stack = _collapse(frame, f"{self._session_id};{names.get(ident, ident)}")
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self._stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+
+class LoopMonitor:
+    """
+    事件循环看门狗
+
+    循环内的心跳协程每 interval 秒醒来一次，记录实际醒来比预期晚了多少（事件循环延迟）。
+    另一个线程检查心跳：超过 block_threshold 没有心跳时，说明有回调在同步阻塞
+    （如在 async 方法里调用同步 IO），此时抓取事件循环线程的调用栈并记录日志，
+    每次阻塞只记录一次。可选同时运行 SamplingProfiler。
+
+    每次心跳的延迟交给 on_lag 中的回调（指标上报、负载统计共用这一个心跳）；
+    watch 为 False 时只运行心跳，不启动看门狗线程。
+    """
+
+    def __init__(self,
+                 session_id: str,
+                 interval: float = 0.05,
+                 block_threshold: float = 0.1,
+                 profiler_interval: Optional[float] = None,
+                 profiler_all_threads: bool = False,
+                 profile_dir: str = "logs/profiles",
+                 on_lag: Sequence[Callable[[float], None]] = (),
+                 watch: bool = True):
+        self._session_id = session_id
+        self._interval = interval
+        self._block_threshold = block_threshold
+        self._profiler_interval = profiler_interval
+        self._profiler_all_threads = profiler_all_threads
+        self._profile_dir = profile_dir
+        self._on_lag = list(on_lag)
+        self._watch_enabled = watch
+
+        self._loop_thread: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watch_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_beat = 0.0
+        self._reported_beat = 0.0
+        self.profiler: Optional[SamplingProfiler] = None
+
+        # 统计
+        self.lag = QuantileSketch()
+        self.blocks = 0
+        self.blocked_seconds = 0.0
+        self.blocking_sites: Dict[str, int] = {}  # 阻塞时最内层的帧 → 次数
+
+    def start(self):
+        """在事件循环内调用"""
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        if self._watch_enabled:
+            self._watch_thread = threading.Thread(target=self._watch, name="loop_watchdog", daemon=True)
+            self._watch_thread.start()
+        if self._profiler_interval:
+            thread_ids = None if self._profiler_all_threads else [self._loop_thread]
+            self.profiler = SamplingProfiler(self._session_id, self._profiler_interval, thread_ids)
+            self.profiler.start()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self._interval
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            self._last_beat = now
+            lag = max(0.0, now - expected)
+            self.lag.add(lag)
+            if lag >= self._block_threshold:
+                self.blocks += 1
+                self.blocked_seconds += lag
+            for callback in self._on_lag:
+                callback(lag)
+
+    def _watch(self):
+        check_interval = min(self._interval, self._block_threshold) / 2
+        while not self._stop.wait(check_interval):
+            last_beat = self._last_beat
+            stalled = time.monotonic() - last_beat - self._interval
+            if stalled < self._block_threshold or last_beat == self._reported_beat:
+                continue
+            self._reported_beat = last_beat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame, limit=_STACK_LIMIT)
+            if stack:
+                site = f"{stack[-1].name} ({stack[-1].filename}:{stack[-1].lineno})"
+                self.blocking_sites[site] = self.blocking_sites.get(site, 0) + 1
+            logger.warning(
+                f"Event loop blocked for more than {stalled * 1000:.0f}ms in {self._session_id}, "
+                f"loop thread stack:\n{''.join(traceback.format_list(stack))}"
+            )
+
+    def stats(self) -> Dict:
+        def _ms(value):
+            return round(value * 1000, 1) if value is not None else None
+
+        top_sites = sorted(self.blocking_sites.items(), key=lambda item: item[1], reverse=True)[:5]
+        return {
+            'lag_p50_ms': _ms(self.lag.quantile(0.5)),
+            'lag_p99_ms': _ms(self.lag.quantile(0.99)),
+            'lag_max_ms': _ms(self.lag.max if self.lag.count else None),
+            'blocks': self.blocks,
+            'blocked_ms': _ms(self.blocked_seconds),
+            'blocking_sites': dict(top_sites),
+            'profile_samples': self.profiler.samples if self.profiler is not None else 0,
+        }
+
+    async def aclose(self) -> Optional[str]:
+        """停止监控；开启了采样分析时写出折叠栈文件并返回其路径"""
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        if self.profiler is None:
+            return None
+        name = re.sub(r'[^\w.-]', '_', self._session_id)
+        path = os.path.join(self._profile_dir, f"{name}.{os.getpid()}.folded")
+        try:
+            # 等待采样线程退出、写文件都放到线程里，不阻塞事件循环
+            await asyncio.to_thread(self.profiler.stop)
+            await asyncio.to_thread(self.profiler.write, path)
+            return path
+        except Exception as e:
+            logger.error(f"Error writing profile for {self._session_id}: {str(e)}")
+            return None
+
+
+def start_loop_monitor(session_id: str,
+                       on_lag: Sequence[Callable[[float], None]] = (),
+                       required: bool = False) -> Optional[LoopMonitor]:
+    """
+    未开启且 required 为 False 时返回 None；须在事件循环内调用
+
+    required：其他组件（如负载统计）需要心跳延迟时为 True，未开启时只运行心跳。
+    """
+    config = settings.LOOP_MONITOR_CONFIG
+    if not (config["ENABLED"] or required):
+        return None
+    monitor = LoopMonitor(
+        session_id,
+        interval=config["INTERVAL"],
+        block_threshold=config["BLOCK_THRESHOLD"],
+        profiler_interval=config["PROFILER_INTERVAL"] if config["ENABLED"] and config["PROFILER_ENABLED"] else None,
+        profiler_all_threads=config["PROFILER_ALL_THREADS"],
+        profile_dir=config["PROFILER_DIR"],
+        on_lag=on_lag,
+        watch=config["ENABLED"],
+    )
+    monitor.start()
+    return monitor
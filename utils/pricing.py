@@ -0,0 +1,30 @@
+from typing import Tuple
+
+from livekit.agents.metrics.base import LLMMetrics, STTMetrics, TTSMetrics
+
+from config.settings import settings
+
+
+def calculate_metrics_cost(mtrcs) -> float:
+    """按 PRICE_CONFIG 计算单条 metrics_collected 事件的成本（美元）"""
+    if isinstance(mtrcs, LLMMetrics):
+        return (
+            mtrcs.prompt_tokens * settings.PRICE_CONFIG["LLM"]["INPUT_PRICE"]
+            + mtrcs.completion_tokens * settings.PRICE_CONFIG["LLM"]["OUTPUT_PRICE"]
+        )
+    if isinstance(mtrcs, TTSMetrics):
+        return mtrcs.characters_count * settings.PRICE_CONFIG["TTS"]["PRICE"]
+    if isinstance(mtrcs, STTMetrics):
+        return mtrcs.audio_duration * settings.PRICE_CONFIG["STT"]["PRICE"]
+    return 0.0
+
+
+def calculate_summary_cost(summary) -> Tuple[float, float, float]:
+    """按 PRICE_CONFIG 计算 UsageSummary 的 (llm, tts, stt) 成本（美元）"""
+    llm_cost = (
+            summary.llm_prompt_tokens * settings.PRICE_CONFIG["LLM"]["INPUT_PRICE"]
+            + summary.llm_completion_tokens * settings.PRICE_CONFIG["LLM"]["OUTPUT_PRICE"]
+    )
+    tts_cost = summary.tts_characters_count * settings.PRICE_CONFIG["TTS"]["PRICE"]
+    stt_cost = summary.stt_audio_duration * settings.PRICE_CONFIG["STT"]["PRICE"]
+    return llm_cost, tts_cost, stt_cost
@@ -0,0 +1,249 @@
+import math
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from livekit.agents.metrics.base import LLMMetrics, STTMetrics, TTSMetrics, VADMetrics
+
+
+class QuantileSketch:
+    """
+    对数分桶的分位数草图（DDSketch 风格）
+
+    桶按相对精度 relative_accuracy 以几何级数划分，存放在定长数组里，
+    内存只取决于取值范围和精度，与样本数无关。两个参数相同的草图按桶相加即可合并。
+    小于 min_value 的值计入零桶，超出 max_value 的值计入最后一个桶。
+    """
+
+    def __init__(self, relative_accuracy: float = 0.02, min_value: float = 1e-4, max_value: float = 1e5):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._offset = math.ceil(math.log(min_value) / self._log_gamma)
+        size = math.ceil(math.log(max_value) / self._log_gamma) - self._offset + 1
+        self._buckets = array('I', bytes(4 * size))
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, value: float) -> int:
+        index = math.ceil(math.log(value) / self._log_gamma) - self._offset
+        return min(max(index, 0), len(self._buckets) - 1)
+
+    def _value(self, index: int) -> float:
+        # 桶 (gamma^(i-1), gamma^i] 的代表值，相对误差不超过 relative_accuracy
+        return 2 * self._gamma ** (index + self._offset) / (self._gamma + 1)
+
+    def add(self, value: float, count: int = 1):
+        if count <= 0 or value != value:
+            return
+        if value < self.min_value:
+            self.zero_count += count
+        else:
+            self._buckets[self._index(value)] += count
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def _check_compatible(self, other: 'QuantileSketch'):
+        if (other.relative_accuracy, other.min_value, other.max_value) != \
+                (self.relative_accuracy, self.min_value, self.max_value):
+            raise ValueError("Cannot merge sketches with different parameters")
+
+    def merge(self, other: 'QuantileSketch'):
+        """把另一个草图合并进来"""
+        self._check_compatible(other)
+        if not other.count:
+            return
+        buckets = self._buckets
+        for index, n in enumerate(other._buckets):
+            if n:
+                buckets[index] += n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return max(self.min, 0.0)
+        for index, n in enumerate(self._buckets):
+            seen += n
+            if seen > rank:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def clear(self):
+        for index in range(len(self._buckets)):
+            self._buckets[index] = 0
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def copy(self) -> 'QuantileSketch':
+        sketch = QuantileSketch(self.relative_accuracy, self.min_value, self.max_value)
+        sketch.merge(self)
+        return sketch
+
+    def nonzero_buckets(self) -> Iterable[Tuple[int, int]]:
+        """(桶下标, 计数)，用于紧凑序列化"""
+        return ((index, n) for index, n in enumerate(self._buckets) if n)
+
+    def to_compact(self) -> List:
+        """紧凑表示：[zero_count, count, sum, min, max, [[桶下标, 计数], ...]]"""
+        return [self.zero_count, self.count, self.sum, self.min, self.max,
+                [list(item) for item in self.nonzero_buckets()]]
+
+    def merge_compact(self, data: List):
+        """合并 to_compact() 的结果（双方参数必须相同）"""
+        zero_count, count, total, minimum, maximum, buckets = data
+        if not count:
+            return
+        for index, n in buckets:
+            self._buckets[index] += n
+        self.zero_count += zero_count
+        self.count += count
+        self.sum += total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+    def count_at_most(self, value: float) -> int:
+        """不大于 value 的样本数（按桶估算），用于生成固定边界的直方图"""
+        if value < self.min_value:
+            return self.zero_count if value >= 0 else 0
+        last = self._index(value)
+        if self._value(last) > value:
+            last -= 1
+        return self.zero_count + sum(self._buckets[:last + 1])
+
+    def summary(self, quantiles: Iterable[float] = (0.5, 0.95, 0.99)) -> Dict:
+        result = {'count': self.count, 'mean': self.mean}
+        for q in quantiles:
+            result[f"p{round(q * 100):d}"] = self.quantile(q)
+        result['max'] = self.max if self.count else None
+        return result
+
+
+class RollingSketch:
+    """
+    滑动时间窗口上的分位数草图
+
+    窗口被切成 slots 个时间片，每片一个草图，过期的时间片复用时清零；
+    查询时合并窗口内仍然有效的时间片。
+    """
+
+    def __init__(self, window: float = 60.0, slots: int = 6, **sketch_kwargs):
+        self._slot_length = window / slots
+        self._sketches = [QuantileSketch(**sketch_kwargs) for _ in range(slots)]
+        self._epochs = [-1] * slots
+        self._sketch_kwargs = sketch_kwargs
+
+    def _epoch(self, now: Optional[float]) -> int:
+        return int((time.monotonic() if now is None else now) / self._slot_length)
+
+    def add(self, value: float, count: int = 1, now: Optional[float] = None):
+        epoch = self._epoch(now)
+        slot = epoch % len(self._sketches)
+        if self._epochs[slot] != epoch:
+            self._sketches[slot].clear()
+            self._epochs[slot] = epoch
+        self._sketches[slot].add(value, count)
+
+    def snapshot(self, now: Optional[float] = None) -> QuantileSketch:
+        epoch = self._epoch(now)
+        merged = QuantileSketch(**self._sketch_kwargs)
+        for slot_epoch, sketch in zip(self._epochs, self._sketches):
+            if epoch - len(self._sketches) < slot_epoch <= epoch:
+                merged.merge(sketch)
+        return merged
+
+
+class MetricsAggregator:
+    """
+    按指标族汇总 metrics_collected 事件的分位数
+
+    每个指标族保留一个全量草图和一个滑动窗口草图，单个会话的内存固定；
+    会话结束时可以 merge 到进程级汇总中。
+    """
+
+    FAMILIES = {
+        'stt_duration': 's',
+        'llm_ttft': 's',
+        'llm_tokens_per_second': 'tok/s',
+        'tts_ttfb': 's',
+        'vad_inference': 's',
+    }
+
+    def __init__(self, window: float = 60.0, slots: int = 6, relative_accuracy: float = 0.02):
+        self.totals = {name: QuantileSketch(relative_accuracy) for name in self.FAMILIES}
+        self.windows = {
+            name: RollingSketch(window, slots, relative_accuracy=relative_accuracy)
+            for name in self.FAMILIES
+        }
+
+    def add(self, family: str, value: float, count: int = 1):
+        if value < 0:
+            return
+        self.totals[family].add(value, count)
+        self.windows[family].add(value, count)
+
+    def observe(self, mtrcs):
+        """处理一条 metrics_collected 事件"""
+        if isinstance(mtrcs, STTMetrics):
+            # 流式识别不统计处理时长（duration 恒为 0）
+            if not mtrcs.streamed:
+                self.add('stt_duration', mtrcs.duration)
+        elif isinstance(mtrcs, LLMMetrics):
+            # 没有产出任何 token 时 ttft 为 -1，add 会忽略
+            self.add('llm_ttft', mtrcs.ttft)
+            if mtrcs.completion_tokens:
+                self.add('llm_tokens_per_second', mtrcs.tokens_per_second)
+        elif isinstance(mtrcs, TTSMetrics):
+            self.add('tts_ttfb', mtrcs.ttfb)
+        elif isinstance(mtrcs, VADMetrics):
+            if mtrcs.inference_count:
+                self.add('vad_inference', mtrcs.inference_duration_total / mtrcs.inference_count,
+                         mtrcs.inference_count)
+
+    def merge(self, other: 'MetricsAggregator'):
+        """合并另一个汇总的全量草图（滑动窗口只反映本地最近的数据，不参与合并）"""
+        for name, sketch in other.totals.items():
+            self.totals[name].merge(sketch)
+
+    def summary(self, windowed: bool = False) -> Dict[str, Dict]:
+        if windowed:
+            return {name: rolling.snapshot().summary() for name, rolling in self.windows.items()}
+        return {name: sketch.summary() for name, sketch in self.totals.items()}
+
+    def format_summary(self, windowed: bool = False) -> str:
+        lines = []
+        for name, stats in self.summary(windowed).items():
+            if not stats['count']:
+                continue
+            unit = self.FAMILIES[name]
+            lines.append(
+                f"\n  - {name}: n={stats['count']}"
+                f" p50={stats['p50']:.3f}{unit} p95={stats['p95']:.3f}{unit}"
+                f" p99={stats['p99']:.3f}{unit} max={stats['max']:.3f}{unit}"
+            )
+        return ''.join(lines) if lines else "\n  - no samples"
+
+
+# 进程级汇总，任务进程内所有会话结束时合并进来
+process_metrics = MetricsAggregator()
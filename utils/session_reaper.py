@@ -0,0 +1,189 @@
+import asyncio
+import math
+import time
+from typing import Callable, List, Optional, Set
+
+from config.settings import settings
+from utils.logger import logger
+
+
+class Timer:
+    __slots__ = ('callback', 'rounds', 'slot', 'cancelled')
+
+    def __init__(self, callback: Callable[[], None], rounds: int, slot: int):
+        self.callback = callback
+        self.rounds = rounds
+        self.slot = slot
+        self.cancelled = False
+
+
+class TimerWheel:
+    """
+    哈希时间轮：一个进程内所有超时共用一个按 tick 前进的任务
+
+    定时器按到期的 tick 数放进对应的槽，超过一圈的记录剩余圈数；取消只做标记并移出槽，
+    增删都是 O(1)。没有定时器时后台任务退出，下次 schedule 时再启动。精度为一个 tick，
+    对秒级以上的会话超时足够。
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self._tick = tick
+        self._slots: List[Set[Timer]] = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._count = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> Timer:
+        ticks = max(1, math.ceil(delay / self._tick))
+        slot = (self._cursor + ticks) % len(self._slots)
+        timer = Timer(callback, (ticks - 1) // len(self._slots), slot)
+        self._slots[slot].add(timer)
+        self._count += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return timer
+
+    def cancel(self, timer: Optional[Timer]):
+        if timer is None or timer.cancelled:
+            return
+        timer.cancelled = True
+        if timer in self._slots[timer.slot]:
+            self._slots[timer.slot].discard(timer)
+            self._count -= 1
+
+    def _advance(self):
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        bucket = self._slots[self._cursor]
+        expired = [timer for timer in bucket if timer.rounds == 0]
+        for timer in bucket:
+            if timer.rounds > 0:
+                timer.rounds -= 1
+        for timer in expired:
+            bucket.discard(timer)
+            self._count -= 1
+            timer.cancelled = True
+            try:
+                timer.callback()
+            except Exception as e:
+                logger.error(f"Error in timer callback: {str(e)}")
+
+    async def _run(self):
+        next_tick = time.monotonic()
+        while self._count > 0:
+            next_tick += self._tick
+            delay = next_tick - time.monotonic()
+            # 事件循环被阻塞过时不再等待，直接补齐错过的 tick
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._advance()
+
+
+class SessionReaper:
+    """
+    回收僵尸会话：等待参与者超时、用户和 agent 长时间都不说话（VAD 驱动）、超过最长会话时长
+
+    所有结束会话的地方都通过 shutdown() 进行，第一个原因记为 reason，会话汇总据此记录
+    结束原因；由超时触发的 reclaimed 为 True。超时值为 0 或 None 时不启用对应检查。
+    """
+
+    def __init__(self,
+                 ctx,
+                 wheel: TimerWheel,
+                 participant_wait: Optional[float] = None,
+                 idle_timeout: Optional[float] = None,
+                 max_duration: Optional[float] = None):
+        self._ctx = ctx
+        self._wheel = wheel
+        self._participant_wait = participant_wait
+        self._idle_timeout = idle_timeout
+        self._max_duration = max_duration
+        self._wait_timer: Optional[Timer] = None
+        self._idle_timer: Optional[Timer] = None
+        self._max_timer: Optional[Timer] = None
+        self._last_activity = time.monotonic()
+        self._speaking: Set[str] = set()
+        self.reason: Optional[str] = None
+        self.reclaimed = False
+
+    def start(self):
+        if self._max_duration:
+            self._max_timer = self._wheel.schedule(
+                self._max_duration, lambda: self._reclaim(f"Session reached maximum duration of {self._max_duration}s")
+            )
+        if self._participant_wait:
+            self._wait_timer = self._wheel.schedule(
+                self._participant_wait, lambda: self._reclaim(f"No participant joined within {self._participant_wait}s")
+            )
+
+    def participant_joined(self):
+        self._wheel.cancel(self._wait_timer)
+        self._wait_timer = None
+        self._last_activity = time.monotonic()
+        if self._idle_timeout and self._idle_timer is None:
+            self._idle_timer = self._wheel.schedule(self._idle_timeout, self._check_idle)
+
+    def attach(self, agent):
+        """用 agent 的语音事件（用户侧由 VAD 判定）作为活动信号"""
+        agent.on("user_started_speaking", lambda: self._speech_started("user"))
+        agent.on("user_stopped_speaking", lambda: self._speech_stopped("user"))
+        agent.on("agent_started_speaking", lambda: self._speech_started("agent"))
+        agent.on("agent_stopped_speaking", lambda: self._speech_stopped("agent"))
+
+    def _speech_started(self, who: str):
+        self._speaking.add(who)
+        self._last_activity = time.monotonic()
+
+    def _speech_stopped(self, who: str):
+        self._speaking.discard(who)
+        self._last_activity = time.monotonic()
+
+    def _check_idle(self):
+        # 活动时只更新时间戳，到期时再判断，避免每次说话都重排定时器
+        self._idle_timer = None
+        idle_for = time.monotonic() - self._last_activity
+        if self._speaking or idle_for < self._idle_timeout:
+            remaining = self._idle_timeout if self._speaking else self._idle_timeout - idle_for
+            self._idle_timer = self._wheel.schedule(remaining, self._check_idle)
+            return
+        self._reclaim(f"No speech for {self._idle_timeout}s")
+
+    def _reclaim(self, reason: str):
+        logger.info(f"Reclaiming session in room {self._ctx.room.name}: {reason}")
+        self.shutdown(reason, reclaimed=True)
+
+    def shutdown(self, reason: str, reclaimed: bool = False):
+        """结束会话（ctx.shutdown 是同步方法，可以在事件回调中直接调用）"""
+        if self.reason is None:
+            self.reason = reason
+            self.reclaimed = reclaimed
+        self.cancel()
+        self._ctx.shutdown(reason=reason)
+
+    def cancel(self):
+        for timer in (self._wait_timer, self._idle_timer, self._max_timer):
+            self._wheel.cancel(timer)
+        self._wait_timer = self._idle_timer = self._max_timer = None
+
+
+_timer_wheel: Optional[TimerWheel] = None
+
+
+def get_timer_wheel() -> TimerWheel:
+    """本进程共用的时间轮"""
+    global _timer_wheel
+    if _timer_wheel is None:
+        _timer_wheel = TimerWheel()
+    return _timer_wheel
+
+
+def start_session_reaper(ctx) -> SessionReaper:
+    """在任务入口创建并启动（连接房间之前），超时取 settings 中的会话超时配置"""
+    reaper = SessionReaper(
+        ctx,
+        get_timer_wheel(),
+        participant_wait=settings.PARTICIPANT_WAIT_TIMEOUT,
+        idle_timeout=settings.ROOM_IDLE_TIMEOUT,
+        max_duration=settings.MAX_SESSION_DURATION,
+    )
+    reaper.start()
+    return reaper
@@ -0,0 +1,40 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from utils.logger import logger
+
+
+class StartupProfiler:
+    """记录启动各阶段（导入、加载模型、预热连接等）的耗时"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def mark(self, name: str):
+        """记录从进程开始计时到现在的耗时（如导入完成）"""
+        self.phases.append((name, time.perf_counter() - self.started_at))
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 1) for name, seconds in self.phases}
+
+    def report(self, title: str):
+        phases = ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases)
+        logger.info(f"{title} in {self.elapsed * 1000:.0f}ms ({phases})")
+
+
+# 本进程的启动计时，agent.py 最先导入
+startup = StartupProfiler()
@@ -0,0 +1,303 @@
+import abc
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from livekit.agents.metrics.base import (
+    LLMMetrics,
+    PipelineEOUMetrics,
+    STTMetrics,
+    TTSMetrics,
+    VADMetrics,
+)
+
+from config.settings import settings
+from utils.logger import logger
+
+
+@dataclass
+class Span:
+    name: str
+    start: float  # unix 时间戳（秒）
+    end: float
+    span_id: str = field(default_factory=lambda: os.urandom(8).hex())
+    parent_id: Optional[str] = None
+    attributes: Dict = field(default_factory=dict)
+
+    def to_otlp(self, trace_id: str) -> Dict:
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(self.start * 1e9)),
+            "endTimeUnixNano": str(int(max(self.end, self.start) * 1e9)),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class _Turn:
+    """一轮对话内收集到的指标"""
+
+    def __init__(self, sequence_id: str):
+        self.sequence_id = sequence_id
+        self.eou: Optional[PipelineEOUMetrics] = None
+        self.llm: List[LLMMetrics] = []
+        self.tts: List[TTSMetrics] = []
+        self.stt: List[STTMetrics] = []
+        self.vad: List[VADMetrics] = []
+        self.first_audio: Optional[float] = None
+
+
+class SpanExporter(abc.ABC):
+    """在单独的线程里导出 OTLP/JSON 格式的 span，不占用事件循环；子类实现 _write"""
+
+    def __init__(self, service_name: str):
+        self._service_name = service_name
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="span_exporter")
+
+    def export(self, trace_id: str, spans: List[Span]):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self._service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "voice-agent.turns"},
+                    "spans": [span.to_otlp(trace_id) for span in spans],
+                }],
+            }]
+        }
+        self._executor.submit(self._safe_write, json.dumps(payload, ensure_ascii=False))
+
+    def _safe_write(self, body: str):
+        try:
+            self._write(body)
+        except Exception as e:
+            logger.error(f"Error exporting turn trace: {str(e)}")
+
+    @abc.abstractmethod
+    def _write(self, body: str):
+        """写出一批 span（OTLP/JSON 字符串），在导出线程中调用"""
+
+    async def aclose(self):
+        """等待已提交的导出完成"""
+        await asyncio.to_thread(self._executor.shutdown, True)
+
+
+class FileSpanExporter(SpanExporter):
+    """每轮对话一行 OTLP/JSON，追加写入本地文件"""
+
+    def __init__(self, path: str, service_name: str):
+        super().__init__(service_name)
+        self._path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def _write(self, body: str):
+        with open(self._path, 'a', encoding='utf-8') as f:
+            f.write(body + '\n')
+
+
+class OTLPHttpSpanExporter(SpanExporter):
+    """以 OTLP/HTTP JSON 协议发送到 collector（例如 http://localhost:4318/v1/traces）"""
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 5.0):
+        super().__init__(service_name)
+        self._endpoint = endpoint
+        self._timeout = timeout
+
+    def _write(self, body: str):
+        request = urllib.request.Request(
+            self._endpoint,
+            data=body.encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=self._timeout):
+            pass
+
+
+class TurnTracer:
+    """
+    把同一轮对话的 EOU/STT/LLM/TTS/VAD 指标合并成一棵 span 树
+
+    流水线指标通过 sequence_id 关联；STT 和 VAD 指标没有 sequence_id，
+    归入当时正在进行的一轮。根 span 上记录关键路径拆分：
+    说话结束 → STT 最终结果 → 端点判定 → LLM 首 token → TTS 首字节 → 首帧音频。
+    """
+
+    def __init__(self, session_id: str, exporter: SpanExporter):
+        self._session_id = session_id
+        self._exporter = exporter
+        self._turns: Dict[str, _Turn] = {}
+        self._current: Optional[_Turn] = None
+        self._pending_stt: List[STTMetrics] = []
+        self._pending_vad: List[VADMetrics] = []
+        self.exported = 0
+
+    def _turn(self, sequence_id: str) -> _Turn:
+        turn = self._turns.get(sequence_id)
+        if turn is None:
+            turn = self._turns[sequence_id] = _Turn(sequence_id)
+        return turn
+
+    def on_metrics(self, mtrcs):
+        sequence_id = getattr(mtrcs, 'sequence_id', None)
+
+        if isinstance(mtrcs, PipelineEOUMetrics):
+            # 新的一轮开始，之前的轮次不会再有首帧音频事件
+            for turn in list(self._turns.values()):
+                if turn.sequence_id != sequence_id:
+                    self._finish(turn)
+            turn = self._turn(sequence_id)
+            turn.eou = mtrcs
+            turn.stt.extend(self._pending_stt)
+            turn.vad.extend(self._pending_vad)
+            self._pending_stt, self._pending_vad = [], []
+            self._current = turn
+        elif isinstance(mtrcs, LLMMetrics) and sequence_id:
+            self._turn(sequence_id).llm.append(mtrcs)
+        elif isinstance(mtrcs, TTSMetrics) and sequence_id:
+            self._turn(sequence_id).tts.append(mtrcs)
+        elif isinstance(mtrcs, STTMetrics):
+            self._pending_stt.append(mtrcs)
+        elif isinstance(mtrcs, VADMetrics):
+            self._pending_vad.append(mtrcs)
+
+    def on_agent_started_speaking(self, *args):
+        """agent 开始播放音频，即首帧音频时间"""
+        if self._current is not None and self._current.first_audio is None:
+            self._current.first_audio = time.time()
+
+    def _finish(self, turn: _Turn):
+        self._turns.pop(turn.sequence_id, None)
+        if self._current is turn:
+            self._current = None
+        if turn.eou is None and not turn.llm and not turn.tts:
+            return
+        try:
+            trace_id = os.urandom(16).hex()
+            self._exporter.export(trace_id, self._build_spans(turn))
+            self.exported += 1
+        except Exception as e:
+            logger.error(f"Error building turn trace: {str(e)}")
+
+    def _build_spans(self, turn: _Turn) -> List[Span]:
+        root = Span(name="turn", start=0.0, end=0.0, attributes={
+            "session.id": self._session_id,
+            "turn.sequence_id": turn.sequence_id,
+            "turn.user_initiated": turn.eou is not None,
+        })
+        children: List[Span] = []
+        critical: Dict[str, float] = {}
+
+        validated_at = None
+        end_of_speech = None
+        if turn.eou is not None:
+            validated_at = turn.eou.timestamp
+            end_of_speech = validated_at - turn.eou.end_of_utterance_delay
+            stt_final = end_of_speech + turn.eou.transcription_delay
+            children.append(Span("stt.final_transcript", end_of_speech, stt_final, attributes={
+                "transcription_delay": turn.eou.transcription_delay,
+            }))
+            children.append(Span("eou.endpointing", end_of_speech, validated_at, attributes={
+                "end_of_utterance_delay": turn.eou.end_of_utterance_delay,
+            }))
+            critical["stt_final"] = turn.eou.transcription_delay
+            critical["endpointing"] = turn.eou.end_of_utterance_delay - turn.eou.transcription_delay
+
+        first_token = None
+        for m in turn.llm:
+            start = m.timestamp - m.duration
+            children.append(Span("llm", start, m.timestamp, attributes={
+                "model": m.label,
+                "ttft": m.ttft,
+                "prompt_tokens": m.prompt_tokens,
+                "completion_tokens": m.completion_tokens,
+                "tokens_per_second": m.tokens_per_second,
+                "cancelled": m.cancelled,
+            }))
+            if first_token is None and m.ttft >= 0:
+                first_token = start + m.ttft
+                # 预合成时 LLM 可能在端点判定之前就已开始
+                critical["llm_ttft"] = first_token - max(start, validated_at or start)
+
+        first_byte = None
+        for m in turn.tts:
+            start = m.timestamp - m.duration
+            children.append(Span("tts", start, m.timestamp, attributes={
+                "model": m.label,
+                "ttfb": m.ttfb,
+                "characters": m.characters_count,
+                "audio_duration": m.audio_duration,
+                "cancelled": m.cancelled,
+            }))
+            if first_byte is None and m.ttfb >= 0:
+                first_byte = start + m.ttfb
+                critical["tts_ttfb"] = m.ttfb
+
+        if turn.first_audio is not None:
+            anchor = validated_at or turn.first_audio
+            children.append(Span("playout.first_audio", anchor, turn.first_audio))
+            if first_byte is not None:
+                critical["playout"] = max(turn.first_audio - first_byte, 0.0)
+            if end_of_speech is not None:
+                critical["total"] = turn.first_audio - end_of_speech
+
+        if turn.stt:
+            children.append(Span("stt.stream", min(m.timestamp - m.duration for m in turn.stt),
+                                 max(m.timestamp for m in turn.stt), attributes={
+                "audio_duration": sum(m.audio_duration for m in turn.stt),
+                "requests": len(turn.stt),
+            }))
+        if turn.vad:
+            children.append(Span("vad", min(m.timestamp for m in turn.vad),
+                                 max(m.timestamp for m in turn.vad), attributes={
+                "inference_duration_total": sum(m.inference_duration_total for m in turn.vad),
+                "inference_count": sum(m.inference_count for m in turn.vad),
+            }))
+
+        root.start = end_of_speech if end_of_speech is not None else min(s.start for s in children)
+        root.end = max(s.end for s in children)
+        for span in children:
+            span.parent_id = root.span_id
+        for name, value in critical.items():
+            root.attributes[f"critical_path.{name}"] = value
+        return [root] + children
+
+    async def aclose(self):
+        """导出尚未结束的轮次并关闭导出器"""
+        for turn in list(self._turns.values()):
+            self._finish(turn)
+        await self._exporter.aclose()
+
+
+def create_turn_tracer(session_id: str) -> Optional[TurnTracer]:
+    """按采样率决定本会话是否追踪；未采样时返回 None，调用方不注册任何回调"""
+    sample_rate = settings.TRACE_CONFIG["SAMPLE_RATE"]
+    if sample_rate <= 0 or random.random() >= sample_rate:
+        return None
+
+    service_name = settings.TRACE_CONFIG["SERVICE_NAME"]
+    if settings.TRACE_CONFIG["EXPORTER"] == "otlp":
+        exporter = OTLPHttpSpanExporter(settings.TRACE_CONFIG["OTLP_ENDPOINT"], service_name)
+    else:
+        exporter = FileSpanExporter(settings.TRACE_CONFIG["FILE"], service_name)
+    return TurnTracer(session_id, exporter)
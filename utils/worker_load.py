@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from livekit.agents.metrics.base import VADMetrics
+
+from config.settings import settings
+from utils.health import WorkerHealth, report_process_state
+from utils.logger import logger
+
+def read_memory_mb(pid: Optional[int] = None) -> Dict[str, float]:
+    """进程当前 / 峰值常驻内存（MB），取自 /proc/<pid>/status；不可用时为 0"""
+    values = {}
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, amount = line.split(':', 1)
+                    values[key] = int(amount.split()[0]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return {'rss_mb': values.get('VmRSS', 0.0), 'peak_rss_mb': values.get('VmHWM', 0.0)}
+
+
+def read_rss_mb(pid: Optional[int] = None) -> float:
+    """进程的常驻内存（MB）"""
+    return read_memory_mb(pid)['rss_mb']
+
+
+def _memory_total_mb() -> float:
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class SessionLoadTracker:
+    """
+    任务进程内统计本会话的实际开销，定期通过健康检查通道上报给主进程
+
+    vad：VAD 推理耗时占墙钟时间的比例（来自 VADMetrics，即本会话占用的核数）；
+    lag_ms：上报周期内事件循环延迟的 p90；rss_mb：本进程的常驻内存。
+    事件循环延迟来自 LoopMonitor 的心跳（作为 on_lag 回调注册），本身不再运行心跳，
+    随心跳按 report_interval 上报。
+    """
+
+    def __init__(self, report_interval: float = 2.0):
+        self._report_interval = report_interval
+        self._vad_seconds = 0.0
+        self._lags: List[float] = []
+        self._window_start = time.monotonic()
+
+    def observe(self, mtrcs):
+        if isinstance(mtrcs, VADMetrics):
+            self._vad_seconds += mtrcs.inference_duration_total
+
+    def _snapshot(self, elapsed: float) -> Dict:
+        lags = sorted(self._lags)
+        lag = lags[int(len(lags) * 0.9)] if lags else 0.0
+        vad = self._vad_seconds / elapsed if elapsed > 0 else 0.0
+        self._vad_seconds = 0.0
+        self._lags = []
+        return {'vad': round(vad, 4), 'lag_ms': round(lag * 1000, 1), 'rss_mb': round(read_rss_mb(), 1)}
+
+    def observe_lag(self, lag: float):
+        """LoopMonitor 的每次心跳延迟"""
+        self._lags.append(lag)
+        now = time.monotonic()
+        if now - self._window_start >= self._report_interval:
+            report_process_state(load=self._snapshot(now - self._window_start))
+            self._window_start = now
+
+    async def aclose(self):
+        # 会话结束，进程即将退出，不再计入负载
+        report_process_state(load=None)
+
+
+class WorkerLoad:
+    """
+    主进程内根据各任务进程上报的实际开销计算 worker 负载（供 WorkerOptions.load_fnc 调用）
+
+    每项开销按各自的上限归一化，达到上限时恰好等于 threshold，负载取各项的最大值：
+      - 会话数：当前会话数 / max_sessions；
+      - CPU：所有会话的 VAD 推理占用再加上一个平均会话，相对 cpu 核数 × vad_cpu_budget，
+        即再接一个房间是否还放得下；
+      - 事件循环延迟：各任务进程中最大的 p90 延迟 / lag_target_ms；
+      - 内存：主进程与所有任务进程（含预热的空闲进程）的常驻内存 / memory_budget_mb。
+    负载达到 threshold 后标记为满载，降到 threshold - hysteresis 以下才恢复接收，避免在阈值附近反复切换。
+    """
+
+    def __init__(self,
+                 health: WorkerHealth,
+                 threshold: float = 0.75,
+                 hysteresis: float = 0.1,
+                 max_sessions: int = 0,
+                 vad_cpu_budget: float = 0.5,
+                 lag_target_ms: float = 50.0,
+                 memory_budget_mb: float = 0.0):
+        self._health = health
+        self._threshold = threshold
+        self._hysteresis = hysteresis
+        self._max_sessions = max_sessions
+        self._cpu_budget = (os.cpu_count() or 1) * vad_cpu_budget
+        self._lag_target_ms = lag_target_ms
+        self._memory_budget_mb = memory_budget_mb or _memory_total_mb() * 0.8
+        self._lock = threading.Lock()
+        self._full = False
+        self.components: Dict[str, float] = {}
+
+    def _components(self, sessions: int) -> Dict[str, float]:
+        processes = self._health.status()['processes'].values()
+        loads = [state['load'] for state in processes if state.get('load')]
+        components = {}
+        if self._max_sessions > 0:
+            components['sessions'] = sessions / self._max_sessions
+        if loads:
+            vad = sum(load['vad'] for load in loads)
+            components['cpu'] = (vad + vad / len(loads)) / self._cpu_budget
+            components['lag'] = max(load['lag_ms'] for load in loads) / self._lag_target_ms
+        if self._memory_budget_mb > 0:
+            rss = read_rss_mb() + sum(
+                state['load']['rss_mb'] if state.get('load') else state.get('rss_mb', 0.0) for state in processes
+            )
+            components['memory'] = rss / self._memory_budget_mb
+        return {name: round(value * self._threshold, 3) for name, value in components.items()}
+
+    def get_load(self, sessions: int) -> float:
+        components = self._components(sessions)
+        load = max(components.values(), default=0.0)
+        with self._lock:
+            if not self._full and load >= self._threshold:
+                self._full = True
+                logger.info(f"Worker load {load:.2f} reached {self._threshold}, not accepting new rooms: {components}")
+            elif self._full and load < self._threshold - self._hysteresis:
+                self._full = False
+                logger.info(f"Worker load {load:.2f} back below {self._threshold - self._hysteresis:.2f}, accepting new rooms")
+            self.components = components
+            # 满载期间上报的负载不低于阈值，worker 保持不可用
+            return max(load, self._threshold) if self._full else load
+
+
+_worker_load: Optional[WorkerLoad] = None
+
+
+def init_worker_load(health: WorkerHealth) -> WorkerLoad:
+    """在主 worker 进程中创建负载计算（依赖健康检查通道接收任务进程的上报）"""
+    global _worker_load
+    config = settings.LOAD_CONFIG
+    _worker_load = WorkerLoad(
+        health,
+        threshold=config["THRESHOLD"],
+        hysteresis=config["HYSTERESIS"],
+        max_sessions=config["MAX_SESSIONS"],
+        vad_cpu_budget=config["VAD_CPU_BUDGET"],
+        lag_target_ms=config["LAG_TARGET_MS"],
+        memory_budget_mb=config["MEMORY_BUDGET_MB"],
+    )
+    return _worker_load
+
+
+def get_worker_load(worker) -> float:
+    """WorkerOptions.load_fnc（模块级函数，WorkerOptions 须可 pickle）"""
+    if _worker_load is None:
+        return 0.0
+    try:
+        return _worker_load.get_load(len(worker.active_jobs))
+    except Exception as e:
+        logger.error(f"Error calculating worker load: {str(e)}")
+        return 0.0
+
+
+def create_session_load_tracker() -> Optional[SessionLoadTracker]:
+    """任务进程内调用；未开启时返回 None。须把 observe_lag 注册到 LoopMonitor"""
+    if not (settings.LOAD_CONFIG["ENABLED"] and settings.HEALTH_CONFIG["ENABLED"]):
+        return None
+    return SessionLoadTracker(settings.LOAD_CONFIG["REPORT_INTERVAL"])
@@ -0,0 +1,362 @@
+import json
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from livekit.agents.metrics.base import (
+    LLMMetrics,
+    PipelineEOUMetrics,
+    STTMetrics,
+    TTSMetrics,
+    VADMetrics,
+)
+
+from config.settings import settings
+from utils.logger import logger, take_dropped_counts
+from utils.pricing import calculate_metrics_cost
+from utils.quantiles import QuantileSketch
+
+# 直方图指标：名称 → 说明
+HISTOGRAMS = {
+    'voice_agent_stt_duration_seconds': 'STT processing time (non-streaming requests)',
+    'voice_agent_llm_ttft_seconds': 'LLM time to first token',
+    'voice_agent_tts_ttfb_seconds': 'TTS time to first byte',
+    'voice_agent_vad_inference_seconds': 'VAD inference time per window',
+    'voice_agent_eou_delay_seconds': 'End of speech to end-of-utterance decision',
+    'voice_agent_event_loop_lag_seconds': 'Job process event loop lag (loop monitor heartbeats)',
+    'voice_agent_endpointing_delay_seconds': 'End-of-turn wait chosen by the adaptive turn detector',
+}
+
+COUNTERS = {
+    'voice_agent_sessions_total': 'Sessions started',
+    'voice_agent_llm_tokens_total': 'LLM tokens processed',
+    'voice_agent_tts_characters_total': 'TTS characters synthesized',
+    'voice_agent_stt_audio_seconds_total': 'Seconds of audio transcribed',
+    'voice_agent_stt_audio_suppressed_seconds_total': 'Seconds of silence not sent to STT',
+    'voice_agent_cost_usd_total': 'Estimated provider cost in USD',
+    'voice_agent_endpointing_saved_seconds_total': 'Endpointing wait saved versus the fixed delay',
+    'voice_agent_endpointing_extended_seconds_total': 'Endpointing wait added beyond the fixed delay',
+    'voice_agent_log_records_dropped_total': 'Log records dropped by the worker and job processes (queue full, rate limited, sampled)',
+}
+
+HISTOGRAM_BOUNDS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(**kwargs) -> Labels:
+    return tuple(sorted(kwargs.items()))
+
+
+class MetricsReporter:
+    """
+    任务进程内的指标上报器
+
+    metrics_collected 事件只在本地累加增量，后台线程按 flush_interval 把增量打包成
+    一个 Unix 数据报发给主进程；主进程没有在监听时直接丢弃，不影响会话。
+    """
+
+    def __init__(self, socket_path: str, flush_interval: float = 5.0):
+        self._socket_path = socket_path
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], QuantileSketch] = {}
+        self._active_sessions = 0
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._send_errors = 0
+        self._thread = threading.Thread(target=self._run, name="metrics_reporter", daemon=True)
+        self._thread.start()
+
+    def _inc(self, name: str, value: float, labels: Labels = ()):
+        if value:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def _observe(self, name: str, value: float, labels: Labels = (), count: int = 1):
+        if value < 0:
+            return
+        key = (name, labels)
+        sketch = self._histograms.get(key)
+        if sketch is None:
+            sketch = self._histograms[key] = QuantileSketch()
+        sketch.add(value, count)
+
+    def session_started(self):
+        with self._lock:
+            self._active_sessions += 1
+            self._inc('voice_agent_sessions_total', 1)
+
+    def session_ended(self):
+        with self._lock:
+            self._active_sessions = max(self._active_sessions - 1, 0)
+        # 进程可能随会话结束被回收，立即上报剩余增量
+        self.flush()
+
+    def observe(self, mtrcs):
+        """处理一条 metrics_collected 事件"""
+        model = _labels(model=getattr(mtrcs, 'label', ''))
+        with self._lock:
+            if isinstance(mtrcs, LLMMetrics):
+                self._observe('voice_agent_llm_ttft_seconds', mtrcs.ttft, model)
+                self._inc('voice_agent_llm_tokens_total', mtrcs.prompt_tokens, model + (('type', 'prompt'),))
+                self._inc('voice_agent_llm_tokens_total', mtrcs.completion_tokens, model + (('type', 'completion'),))
+                self._inc('voice_agent_cost_usd_total', calculate_metrics_cost(mtrcs), _labels(service='llm'))
+            elif isinstance(mtrcs, TTSMetrics):
+                self._observe('voice_agent_tts_ttfb_seconds', mtrcs.ttfb, model)
+                self._inc('voice_agent_tts_characters_total', mtrcs.characters_count, model)
+                self._inc('voice_agent_cost_usd_total', calculate_metrics_cost(mtrcs), _labels(service='tts'))
+            elif isinstance(mtrcs, STTMetrics):
+                if not mtrcs.streamed:
+                    self._observe('voice_agent_stt_duration_seconds', mtrcs.duration, model)
+                self._inc('voice_agent_stt_audio_seconds_total', mtrcs.audio_duration, model)
+                self._inc('voice_agent_cost_usd_total', calculate_metrics_cost(mtrcs), _labels(service='stt'))
+            elif isinstance(mtrcs, VADMetrics):
+                if mtrcs.inference_count:
+                    self._observe('voice_agent_vad_inference_seconds',
+                                  mtrcs.inference_duration_total / mtrcs.inference_count,
+                                  model, mtrcs.inference_count)
+            elif isinstance(mtrcs, PipelineEOUMetrics):
+                self._observe('voice_agent_eou_delay_seconds', mtrcs.end_of_utterance_delay)
+
+    def observe_stt_suppressed(self, seconds: float):
+        """静音抑制少送给 STT 的音频秒数"""
+        with self._lock:
+            self._inc('voice_agent_stt_audio_suppressed_seconds_total', seconds)
+
+    def observe_endpointing(self, delay: float, won: float):
+        """自适应端点判定的每轮等待时间，以及相对固定等待节省（正）或延长（负）的秒数"""
+        with self._lock:
+            self._observe('voice_agent_endpointing_delay_seconds', delay)
+            if won > 0:
+                self._inc('voice_agent_endpointing_saved_seconds_total', won)
+            elif won < 0:
+                self._inc('voice_agent_endpointing_extended_seconds_total', -won)
+
+    def observe_loop_lag(self, seconds: float):
+        """事件循环看门狗的每次心跳延迟"""
+        with self._lock:
+            self._observe('voice_agent_event_loop_lag_seconds', seconds)
+
+    def _drain(self) -> Dict:
+        dropped = take_dropped_counts()
+        with self._lock:
+            for reason, count in dropped.items():
+                self._inc('voice_agent_log_records_dropped_total', count, _labels(reason=reason))
+            counters, self._counters = self._counters, {}
+            histograms, self._histograms = self._histograms, {}
+            active = self._active_sessions
+        return {
+            'pid': os.getpid(),
+            'active': active,
+            'c': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'h': [[name, list(labels), sketch.to_compact()] for (name, labels), sketch in histograms.items()],
+        }
+
+    def flush(self):
+        payload = json.dumps(self._drain(), separators=(',', ':')).encode('utf-8')
+        try:
+            self._sock.sendto(payload, self._socket_path)
+        except OSError as e:
+            # 主进程未开启指标服务或缓冲区已满，本批增量丢弃
+            self._send_errors += 1
+            if self._send_errors == 1:
+                logger.debug(f"Metrics reporter could not reach {self._socket_path}: {str(e)}")
+
+    def _run(self):
+        # 没有增量时也发送，作为本进程存活的心跳
+        while True:
+            time.sleep(self._flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing worker metrics: {str(e)}")
+
+
+class WorkerMetrics:
+    """主进程内汇总各任务进程上报的增量"""
+
+    def __init__(self, stale_after: float):
+        self._stale_after = stale_after
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], QuantileSketch] = {}
+        self._processes: Dict[int, Tuple[int, float]] = {}  # pid → (活跃会话数, 最后上报时间)
+        self._gauges: List[Tuple[str, str, Callable[[], float]]] = []
+        self.reports = 0
+
+    def apply(self, report: Dict):
+        with self._lock:
+            self.reports += 1
+            self._processes[report['pid']] = (report['active'], time.monotonic())
+            for name, labels, value in report['c']:
+                key = (name, tuple(tuple(item) for item in labels))
+                self._counters[key] = self._counters.get(key, 0.0) + value
+            for name, labels, data in report['h']:
+                key = (name, tuple(tuple(item) for item in labels))
+                sketch = self._histograms.get(key)
+                if sketch is None:
+                    sketch = self._histograms[key] = QuantileSketch()
+                sketch.merge_compact(data)
+
+    def register_gauge(self, name: str, help_text: str, read: Callable[[], float]):
+        """主进程内的即时指标，每次抓取时调用 read() 取值"""
+        with self._lock:
+            self._gauges.append((name, help_text, read))
+
+    def _active(self) -> Tuple[int, int]:
+        # 超时未上报的进程视为已退出
+        now = time.monotonic()
+        for pid, (_, seen) in list(self._processes.items()):
+            if now - seen > self._stale_after:
+                del self._processes[pid]
+        return sum(active for active, _ in self._processes.values()), len(self._processes)
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式"""
+        with self._lock:
+            # 主进程自己的日志队列满时丢弃的记录（任务进程的由 MetricsReporter 上报）
+            for reason, count in take_dropped_counts().items():
+                key = ('voice_agent_log_records_dropped_total', _labels(reason=reason))
+                self._counters[key] = self._counters.get(key, 0.0) + count
+            active, processes = self._active()
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            lines: List[str] = [
+                '# HELP voice_agent_active_sessions Sessions currently running in job processes',
+                '# TYPE voice_agent_active_sessions gauge',
+                f'voice_agent_active_sessions {active}',
+                '# HELP voice_agent_job_processes Job processes that reported recently',
+                '# TYPE voice_agent_job_processes gauge',
+                f'voice_agent_job_processes {processes}',
+            ]
+
+            for name, help_text, read in self._gauges:
+                try:
+                    value = read()
+                except Exception as e:
+                    logger.error(f"Error reading gauge {name}: {str(e)}")
+                    continue
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {value}')
+
+            for name, help_text in COUNTERS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for (metric, labels), value in counters:
+                    if metric == name:
+                        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+            for name, help_text in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, labels), sketch in histograms:
+                    if metric != name:
+                        continue
+                    for bound in HISTOGRAM_BOUNDS:
+                        le = labels + (('le', str(bound)),)
+                        lines.append(f'{name}_bucket{_format_labels(le)} {sketch.count_at_most(bound)}')
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {sketch.count}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {sketch.sum}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {sketch.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsServer:
+    """
+    主 worker 进程内的指标服务
+
+    一个线程接收任务进程发来的数据报，另一个线程提供 Prometheus 抓取接口（/metrics）。
+    """
+
+    def __init__(self, socket_path: str, host: str, port: int, flush_interval: float):
+        self._socket_path = socket_path
+        self.aggregator = WorkerMetrics(stale_after=flush_interval * 3)
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(socket_path)
+
+        aggregator = self.aggregator
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = aggregator.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._http = ThreadingHTTPServer((host, port), _Handler)
+        self._http.daemon_threads = True
+
+    def start(self):
+        threading.Thread(target=self._receive, name="metrics_receiver", daemon=True).start()
+        threading.Thread(target=self._http.serve_forever, name="metrics_http", daemon=True).start()
+        host, port = self._http.server_address[:2]
+        logger.info(f"Worker metrics available at http://{host}:{port}/metrics")
+
+    def _receive(self):
+        while True:
+            try:
+                data = self._sock.recv(1 << 20)
+                self.aggregator.apply(json.loads(data))
+            except Exception as e:
+                logger.error(f"Error applying worker metrics report: {str(e)}")
+
+
+_reporter: Optional[MetricsReporter] = None
+
+
+def get_reporter() -> Optional[MetricsReporter]:
+    """获取本进程的上报器（首次调用时创建），未开启时返回 None"""
+    global _reporter
+    if not settings.METRICS_CONFIG["ENABLED"]:
+        return None
+    if _reporter is None:
+        _reporter = MetricsReporter(
+            settings.METRICS_CONFIG["SOCKET_PATH"],
+            settings.METRICS_CONFIG["FLUSH_INTERVAL"],
+        )
+    return _reporter
+
+
+def start_metrics_server() -> Optional[MetricsServer]:
+    """在主 worker 进程中启动指标服务（须在 cli.run_app 之前调用）"""
+    if not settings.METRICS_CONFIG["ENABLED"]:
+        return None
+    try:
+        server = MetricsServer(
+            settings.METRICS_CONFIG["SOCKET_PATH"],
+            settings.METRICS_CONFIG["HOST"],
+            settings.METRICS_CONFIG["PORT"],
+            settings.METRICS_CONFIG["FLUSH_INTERVAL"],
+        )
+        server.start()
+        return server
+    except Exception as e:
+        logger.error(f"Error starting worker metrics server: {str(e)}")
+        return None